@@ -0,0 +1,87 @@
+"""Measure the startup (import) time of `slurpy` for each of its operations.
+
+Each operation is timed in a fresh interpreter using `python -X importtime`, importing the
+entry point (`slurpy.__main__`) along with the modules which that operation imports.  The
+total import time, the number of modules and the slowest imports are reported.
+
+Usage:  python benchmarks/importtime.py [--repeat N] [--top N]
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+# Modules imported by each operation of `slurpy.__main__._run()` (before any queries)
+OPERATIONS = [
+    ('version', []),
+    ('sacct', ['slurpy.sacct']),
+    ('summary', ['slurpy.sacct', 'slurpy.stats']),
+    ('nodes', ['slurpy.sacct', 'slurpy.hostlist']),
+    ('efficiency', ['slurpy.efficiency']),
+    ('arrays', ['slurpy.sacct']),
+    ('queue', ['slurpy.squeue']),
+    ('merge', ['slurpy.squeue']),
+    ('cancel', ['slurpy.sacct', 'slurpy.scancel', 'slurpy.utils']),
+    ('watch', ['slurpy.watch']),
+    ('export', ['slurpy.sacct', 'slurpy.export']),
+    ('sync', ['slurpy.history']),
+    ('serve', ['slurpy.server']),
+    ('clear-cache', ['slurpy.cache']),
+]
+
+_ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def measure(modules):
+    """Import `slurpy.__main__` and the given modules in a new interpreter.
+
+    Returns
+    -------
+    total : float
+        Total import time [ms].
+    imports : list of (float, str)
+        Cumulative import time [ms] of each top-level import.
+
+    """
+    code = "; ".join("import " + mm for mm in ['slurpy.__main__'] + modules)
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=_ROOT_PATH,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if p.returncode:
+        raise RuntimeError("Import failed: '{}'".format(p.stderr.strip()))
+
+    imports = []
+    total = 0.0
+    for line in p.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        # e.g. "import time:       315 |     123342 |   slurpy.sacct"
+        self_us, cumul_us, name = line.split(':', 1)[1].split('|')
+        total += int(self_us) / 1000.0
+        # Only top-level imports (not indented) are reported individually
+        if not name[1:].startswith(' '):
+            imports.append((int(cumul_us) / 1000.0, name.strip()))
+
+    return total, sorted(imports, reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Number of measurements, the fastest is reported.")
+    parser.add_argument("--top", type=int, default=3,
+                        help="Number of slowest (top-level) imports to report.")
+    args = parser.parse_args()
+
+    print("{:>12s}  {:>10s}  {}".format("operation", "time [ms]", "slowest imports [ms]"))
+    for name, modules in OPERATIONS:
+        results = [measure(modules) for _ in range(args.repeat)]
+        total, imports = min(results, key=lambda rr: rr[0])
+        slowest = ", ".join("{} ({:.1f})".format(nn, tt) for tt, nn in imports[:args.top])
+        print("{:>12s}  {:10.1f}  {}".format(name, total, slowest))
+
+    return
+
+
+if __name__ == "__main__":
+    main()
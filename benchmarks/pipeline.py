@@ -0,0 +1,125 @@
+"""Benchmark the stages of the 'sacct' pipeline on synthetic results, without a cluster.
+
+Results are generated by `slurpy.runner.SyntheticRunner` and recorded once, then replayed by
+`slurpy.runner.ReplayRunner` (so that generating them is not included).  Each stage is timed
+separately: parsing (reading and converting into typed columns), filtering, sorting,
+summarizing and formatting.  The peak memory allocated (measured with `tracemalloc`, in a
+separate pass) is reported for each stage.
+
+Usage:  python benchmarks/pipeline.py [--rows 10000 100000 1000000] [--repeat N] [--no-memory]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from slurpy import runner, query, sacct, stats, utils   # noqa
+
+
+def stages(args):
+    """Return the (name, function) of each stage, where each function takes the previous result.
+    """
+    def parse(_):
+        return sacct._parse_sacct(args, pushdown=False)
+
+    def filter(table):
+        sacct._filter_lines(table, args, pushdown=False)
+        return table
+
+    def sort(table):
+        sacct._sort_lines(table, args)
+        return table
+
+    def summary(table):
+        stats.format_summary(stats.summarize(table, by='Partition'), verbose=True)
+        return table
+
+    def format(table):
+        utils.format_table(table, args)
+        return table
+
+    return [('parse', parse), ('filter', filter), ('sort', sort), ('summary', summary),
+            ('format', format)]
+
+
+def measure(num, repeat=1, memory=True):
+    """Time (and optionally measure the peak memory of) each stage for `num` synthetic jobs.
+
+    Returns
+    -------
+    results : list of (str, float, float or None)
+        Name, fastest time [s] and peak memory [MB] of each stage.
+
+    """
+    # Query with filters and a sort which are all applied in python
+    args = query.SacctQuery(state='COMPLETED', partition='itccluster', name='job_1',
+                            sort='-Elapsed', shard_days=0).args()
+    results = []
+    path = tempfile.mkdtemp(prefix='slurpy-bench-')
+    try:
+        command = sacct._construct_sacct_command(args)
+        runner.record(command, path, runner=runner.SyntheticRunner(num))
+        times, peaks = _measure_stages(args, runner.ReplayRunner(path), repeat, memory)
+    finally:
+        shutil.rmtree(path)
+
+    for name, _ in stages(args):
+        results.append((name, times[name], peaks.get(name)))
+
+    return results
+
+
+def _measure_stages(args, replay, repeat, memory):
+    """Return the fastest time [s] and peak memory [MB] of each stage, using the given runner.
+    """
+    with runner.using(replay):
+        times = {}
+        for _ in range(repeat):
+            value = None
+            for name, func in stages(args):
+                beg = time.perf_counter()
+                value = func(value)
+                dur = time.perf_counter() - beg
+                times[name] = min(times.get(name, dur), dur)
+
+        peaks = {}
+        if memory:
+            value = None
+            for name, func in stages(args):
+                tracemalloc.start()
+                value = func(value)
+                peaks[name] = tracemalloc.get_traced_memory()[1] / 2**20
+                tracemalloc.stop()
+
+    return times, peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help="Numbers of synthetic jobs to benchmark.")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of timing measurements, the fastest is reported.")
+    parser.add_argument("--no-memory", action="store_false", dest="memory", default=True,
+                        help="Do not measure peak memory (which is slow for many rows).")
+    args = parser.parse_args()
+
+    print("{:>9s}  {:>8s}  {:>10s}  {:>12s}  {:>10s}".format(
+        "rows", "stage", "time [ms]", "rows/s", "peak [MB]"))
+    for num in args.rows:
+        for name, dur, peak in measure(num, repeat=args.repeat, memory=args.memory):
+            peak = "" if peak is None else "{:10.1f}".format(peak)
+            print("{:9d}  {:>8s}  {:10.1f}  {:12.0f}  {:>10s}".format(
+                num, name, dur*1000, num / dur, peak))
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
+import re
 from setuptools import setup
 
 readme = open('README.md').read()
-version = open('VERSION').read().strip()
+# Read the version from the package without importing it
+version = re.search(r'^__version__ = "(.*)"', open('slurpy/__init__.py').read(), re.M).group(1)
 requirements = ['numpy', 'scipy', 'astropy', 'matplotlib']
 
 requirements = []
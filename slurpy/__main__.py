@@ -1,10 +1,15 @@
 """Main entry point for `slurpy` scripts.
 
 Default behavior is to run 'sacct' and print parsed output.
+
+Only the modules needed by the selected operation are imported (e.g. `--queue` does not import
+the 'scancel' or 'watch' modules, or the local cache), so that startup stays fast for repeated
+calls.
 """
 # import os
 import datetime
-from slurpy import sacct, squeue, scancel, utils
+import slurpy
+from slurpy import const
 
 # Prompt the user to confirm before canceling jobs.
 _CANCEL_PROMPT = True
@@ -15,21 +20,63 @@ _CANCEL_PROMPT = True
 _DEFAULT_ARG_START = -7.0
 
 
-def main(args=None, thread=False):
+def main(args=None):
     if args is None:
         args = _init_argparse()
 
+    if args.profile is None and not args.profile_memory:
+        _run(args)
+        return
+
+    # Record the time (etc) of each stage of the operation, and report it to 'stderr'
+    import sys
+    from slurpy import profiling
+    prof = profiling.Profiler(memory=args.profile_memory)
+    try:
+        with prof:
+            _run(args)
+    finally:
+        text = prof.to_json() if args.profile == 'json' else prof.report()
+        print(text, file=sys.stderr)
+
+    return
+
+
+def _run(args):
+    """Run the operation selected by the given (command-line) arguments.
+    """
+    if args.clear_cache:
+        from slurpy import cache
+        cache.clear()
+
+    # Append newly finished jobs to the local history
+    # -----------------------------------------------
+    if args.command == 'sync':
+        from slurpy import history
+        history.sync(args)
+        return
+
+    # Serve the results of periodic queries to other (local) calls
+    # -------------------------------------------------------------
+    if args.command == 'serve':
+        from slurpy import server
+        server.serve(args)
+        return
+
     # Cancel / Kill Jobs
     # ------------------
     if args.cancel:
+        from slurpy import sacct, scancel, utils
+        # Jobs are never cancelled based on the (possibly outdated) results of a server
+        args.server = False
         if _CANCEL_PROMPT:
-            lines, header = sacct.sacct_results(args)
+            table = sacct.sacct_results(args)
             # Print the jobs about to be canceled
             if args.verbose:
                 print("\nCancel would end the following jobs:\n")
-                utils.print_lines_dicts(lines, header, args)
+                utils.print_table(table, args)
                 print("")
-            prompt = "Are you sure you want to cancel {} jobs?".format(len(lines))
+            prompt = "Are you sure you want to cancel {} jobs?".format(len(table))
             if not utils.prompt_yes_no(prompt, default='no'):
                 print("Exiting.")
                 return
@@ -37,26 +84,37 @@ def main(args=None, thread=False):
         scancel.scancel(args)
         return
 
+    # 'Watch' Output: repeatedly printed
+    # ----------------------------------
+    if args.watch is not None:
+        from slurpy import watch
+        watch.watch(args)
+        return
+
     # Information sacct, summary, and squeue operations
     # -------------------------------------------------
     if args.summary:
+        from slurpy import sacct
         sacct.summary(args)
+    elif args.nodes:
+        from slurpy import sacct
+        sacct.node_summary(args)
+    elif args.efficiency:
+        from slurpy import efficiency
+        efficiency.efficiency(args)
     elif args.queue:
+        from slurpy import squeue
         squeue.squeue(args)
+    elif args.merge:
+        from slurpy import squeue
+        squeue.merged(args)
+    elif args.arrays:
+        from slurpy import sacct
+        sacct.arrays(args)
     else:
+        from slurpy import sacct
         sacct.sacct(args)
 
-    # 'Watch' Output: repeatedly printed
-    # ----------------------------------
-    # Repeatedly call `main` to keep producing new output
-    if (args.watch is not None) and (not thread):
-        import time
-        # Start look to keep re-calling this (the `main`) method repeatedly every interval
-        while True:
-            time.sleep(args.watch)
-            # set `thread` to True so that subsequent calls don't start their own loops and timers.
-            main(args, thread=True)
-
     return
 
 
@@ -79,6 +137,16 @@ def _init_argparse():
     # -------------------------
     parser = argparse.ArgumentParser()
 
+    parser.add_argument(
+        "command", nargs='?', default=None, choices=['sync', 'serve'],
+        help=("'sync': append all jobs which finished since the last sync (or since `--start`) "
+              "to the local history, see `--history`.  'serve': query 'sacct' and 'squeue' "
+              "every `--interval` seconds, and answer the queries of other `slurpy` calls "
+              "(e.g. `--watch`) on a local socket, see `--socket`."))
+
+    parser.add_argument(
+        "--version", action="version", version="slurpy {}".format(slurpy.__version__))
+
     parser.add_argument(
         "-v", "--verbose", action="store_true", dest="verbose", default=False,
         help="Extended output.")
@@ -91,6 +159,22 @@ def _init_argparse():
         "--tail", nargs='?', dest="tail", default=None, const=10,
         help=("Only print last  `tail` entries (default: 10)"))
 
+    parser.add_argument(
+        "--stream", action="store_true", dest="stream", default=False,
+        help=("Print 'sacct' results as they are read (column widths are estimated).  "
+              "Not used with `--sort`, both `--head` and `--tail`, or the local cache "
+              "(see `--cache`)."))
+
+    parser.add_argument(
+        "-o", "--output", type=str, dest="output", default=None,
+        choices=['csv', 'jsonl', 'npz', 'parquet', 'arrow'],
+        help=("Write all fields of the results in the given machine-readable format, with typed "
+              "values, instead of printing a table.  'parquet' and 'arrow' require `pyarrow`."))
+
+    parser.add_argument(
+        "--output-file", type=str, dest="output_file", default=None,
+        help="File to write `--output` results to (default: stdout).")
+
     parser.add_argument(
         "--state", type=str, dest="state", default=None,
         help="state to filter by (e.g. 'RUNNING', 'COMPLETED')")
@@ -100,39 +184,158 @@ def _init_argparse():
         help=("start time for `sacct` quieries in the format "
               "'YYYY-MM-DD[THH:MM[:SS]]' (e.g. `--start 2017-01-01`)."))
 
+    parser.add_argument(
+        "--end", type=str, dest="end", default=None,
+        help=("end time for `sacct` quieries in the format "
+              "'YYYY-MM-DD[THH:MM[:SS]]' (e.g. `--end 2017-02-01`)."))
+
     parser.add_argument(
         "--id", type=str, dest="jobid", default=None, nargs='*',
         help=("JobID number to filter by (e.g. `--id 84513996`, `--id 84513996:84514000`"))
 
     parser.add_argument(
         "--sort", type=str, dest="sort", default=None,
-        help=("Sort 'sacct' results by the given parameter field.  "
-              "Use `--sort=-KEY` to reverse-sort by 'KEY'."))
+        help=("Sort results by the given (comma-separated) fields, in order of priority, "
+              "e.g. `--sort State,-Elapsed`.  Use `--sort=-KEY` to reverse-sort by 'KEY'."))
 
     parser.add_argument(
         "--name", type=str, dest="name", default=None,
         help="job name to filter by")
 
+    parser.add_argument(
+        "--exact", action="store_true", dest="exact", default=False,
+        help="Match `--name` exactly instead of as a substring (filtered by 'sacct' itself).")
+
+    parser.add_argument(
+        "--steps", action="store_true", dest="steps", default=False,
+        help="Include job-steps (e.g. '123.0') in 'sacct' results, not only job allocations.")
+
     parser.add_argument(
         "-s", "--summary", action="store_true", dest="summary", default=False,
         help="Print a summary from the current 'sacct' results.")
 
+    parser.add_argument(
+        "--group-by", type=str, dest="group_by", default=None,
+        choices=['Partition', 'JobName', 'User', 'State', 'Cluster'],
+        help="Group the `--summary` by the given field.")
+
+    parser.add_argument(
+        "--arrays", action="store_true", dest="arrays", default=False,
+        help=("Combine the tasks of each job-array into one row, with the number of tasks in "
+              "each state, their min/median/max elapsed time, and the failed tasks."))
+
+    parser.add_argument(
+        "--nodes", action="store_true", dest="nodes", default=False,
+        help=("Print the number of jobs, failed jobs and elapsed hours on each node, for the "
+              "nodes with the most failures (the number listed is set by `--head`)."))
+
+    parser.add_argument(
+        "-e", "--efficiency", action="store_true", dest="efficiency", default=False,
+        help=("Print the requested versus used memory and CPU time of finished jobs, and the "
+              "jobs with the most unused memory (the number listed is set by `--head`)."))
+
     parser.add_argument(
         "-w", "--watch", nargs='?', dest="watch", type=int, default=None, const=4,
         help=("Print continuous output refreshed every given internal in seconds (default: 4)"))
 
     parser.add_argument(
         "--no-clear", action="store_false", dest="clear", default=True,
-        help="Clear the screen before printing results.  NOTE: only applies in 'watch' mode.")
+        help=("Do not redraw the screen, instead print the full results whenever they change.  "
+              "NOTE: only applies in 'watch' mode."))
 
     parser.add_argument(
         "-q", "--queue", action="store_true", dest="queue", default=False,
-        help="Print the current 'squeue' results.")
+        help="Print the current 'squeue' results (filtered in the same way as 'sacct').")
+
+    parser.add_argument(
+        "--merge", action="store_true", dest="merge", default=False,
+        help=("Add live 'squeue' information ({}) to the 'sacct' results.".format(
+            ", ".join(const.SQUEUE_MERGE_KEYS))))
 
     parser.add_argument(
         "-p", "--partition", nargs='?', const="", default=None, dest="partition",
         help="Target a particular 'Partition' of the cluster.")
 
+    parser.add_argument(
+        "-M", "--clusters", type=str, dest="clusters", default=None,
+        help=("Query each of the given (comma-separated) clusters, concurrently, and combine "
+              "the results (with a 'Cluster' field), e.g. `--clusters odyssey,cannon`."))
+
+    parser.add_argument(
+        "-u", "--users", type=str, dest="users", default=None,
+        help="Query the jobs of the given (comma-separated) users, instead of the current user.")
+
+    parser.add_argument(
+        "--all-users", action="store_true", dest="all_users", default=False,
+        help="Query the jobs of all users (which may be restricted by SLURM's permissions).")
+
+    parser.add_argument(
+        "--timeout", type=float, dest="timeout", default=const.SACCT_TIMEOUT,
+        help=("Kill each 'sacct' query (of each cluster and shard) after this many seconds, "
+              "and continue with the results of the others."))
+
+    parser.add_argument(
+        "--cache", action="store_true", dest="cache", default=const.USE_CACHE,
+        help=("Use (and update) the local cache of finished jobs, so that only jobs active "
+              "since the previous query are requested from 'sacct'."))
+
+    parser.add_argument(
+        "--no-cache", action="store_false", dest="cache",
+        help="Do not use (or update) the local cache of finished jobs.")
+
+    parser.add_argument(
+        "--history", action="store_true", dest="history", default=False,
+        help=("Read finished jobs from the local history (see `slurpy sync`) instead of "
+              "calling 'sacct'."))
+
+    parser.add_argument(
+        "--no-server", action="store_false", dest="server", default=const.USE_SERVER,
+        help="Do not use a running server (see `slurpy serve`), always call 'sacct' directly.")
+
+    parser.add_argument(
+        "--socket", type=str, dest="socket", default=None,
+        help=("Path of the server's socket (default: '{}', or '{}' if '$SLURM_CLUSTER_NAME' "
+              "is set, within '$XDG_RUNTIME_DIR/slurpy' or '{}').".format(
+                  const.SERVER_SOCKET, const.SERVER_SOCKET_CLUSTER, const.SERVER_DIR)))
+
+    parser.add_argument(
+        "--shared", action="store_true", dest="shared", default=False,
+        help=("Allow all local users to use the socket of `slurpy serve` (requires "
+              "`--all-users`), on `--socket` or the configured shared socket (default: {}).  "
+              "Otherwise only the current user can use it.".format(
+                  const.SERVER_SHARED_SOCKET)))
+
+    parser.add_argument(
+        "--interval", type=float, dest="interval", default=const.SERVER_INTERVAL,
+        help=("Seconds between the queries of `slurpy serve` (default: {}).".format(
+            const.SERVER_INTERVAL)))
+
+    parser.add_argument(
+        "--clear-cache", action="store_true", dest="clear_cache", default=False,
+        help="Delete the local cache of finished jobs before running.")
+
+    parser.add_argument(
+        "--profile", nargs='?', dest="profile", default=None, const='text',
+        choices=['text', 'json'],
+        help=("Report the time, rows and bytes of each stage (e.g. 'read', 'filter', 'format') "
+              "to stderr, as a table ('text', default) or 'json'."))
+
+    parser.add_argument(
+        "--profile-memory", action="store_true", dest="profile_memory", default=False,
+        help="Also report the peak memory of each stage, see `--profile` (much slower).")
+
+    parser.add_argument(
+        "--workers", type=int, dest="workers", default=None,
+        help=("Maximum number of SLURM commands (e.g. 'scancel', or 'sacct' shards) to run "
+              "concurrently (default: {} for 'sacct', 1 otherwise).".format(
+                  const.SACCT_SHARD_WORKERS)))
+
+    parser.add_argument(
+        "--shard-days", type=float, dest="shard_days", default=const.SACCT_SHARD_DAYS,
+        help=("Split 'sacct' queries over long windows into shards of this many days, which are "
+              "queried concurrently (default: {}).  Use 0 for a single query.".format(
+                  const.SACCT_SHARD_DAYS)))
+
     # NOTE: this should be changed to a subcommand
     parser.add_argument(
         "--cancel", action="store_true", dest="cancel", default=False,
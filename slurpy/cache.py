@@ -0,0 +1,235 @@
+"""Persistent, local cache of 'sacct' results for jobs which have finished.
+
+Jobs in a terminal state (`const.TERMINAL_STATES`, e.g. 'COMPLETED') never change again, so
+they are stored permanently in an SQLite database under `const.CACHE_DIR`, one per cluster and
+user.  Later queries then only need to ask 'sacct' for jobs active since the last sync, see
+`sacct._parse_sacct_cached`.
+
+Classes
+-------
+-   SacctCache            - SQLite database of finished jobs, with their typed 'sacct' fields.
+
+Functions
+---------
+-   cache_path            - Path to the cache file for the given cluster and user.
+-   clear                 - Delete all cache files.
+
+-   _to_sql_columns       - Convert the typed columns of a `JobTable` into SQL columns.
+-   _from_sql_columns     - Convert SQL columns back into the typed columns of a `JobTable`.
+"""
+
+import os
+import glob
+import sqlite3
+from collections import OrderedDict
+import numpy as np
+
+from . import const
+from .table import JobTable
+from .jobid import JOBID_DTYPE
+
+_TABLE_NAME = 'jobs'
+_META_NAME = 'meta'
+
+
+class SacctCache(object):
+    """SQLite database of finished jobs, with their typed 'sacct' fields.
+
+    The database is invalidated (cleared) whenever `const.CACHE_VERSION` or the stored fields
+    change.  The metadata values 'synced' and 'covered' record the time of the last 'sacct'
+    query, and the earliest start-time included in the cache.
+    """
+
+    def __init__(self, path, header, types):
+        self.path = path
+        self.header = list(header)
+        self.types = types
+
+        path_dir = os.path.dirname(path)
+        if not os.path.isdir(path_dir):
+            os.makedirs(path_dir)
+
+        self._conn = sqlite3.connect(path, timeout=const.CACHE_TIMEOUT)
+        self._columns = [nn for nn, vv in _to_sql_columns(JobTable.from_rows([], header, types))]
+        self._init_tables()
+        return
+
+    def _init_tables(self):
+        conn = self._conn
+        conn.execute("CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT)".format(
+            _META_NAME))
+
+        signature = "{}:{}".format(const.CACHE_VERSION, ",".join(self._columns))
+        if self._get_meta('signature') != signature:
+            # Stored data is not compatible, start over
+            conn.execute("DROP TABLE IF EXISTS {}".format(_TABLE_NAME))
+            conn.execute("DELETE FROM {}".format(_META_NAME))
+            self._set_meta('signature', signature)
+
+        columns = ", ".join('"{}"'.format(cc) for cc in self._columns)
+        conn.execute("CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, {})".format(
+            _TABLE_NAME, columns))
+        conn.execute("CREATE INDEX IF NOT EXISTS end_index ON {} (\"End\")".format(_TABLE_NAME))
+        conn.commit()
+        return
+
+    def _get_meta(self, key):
+        row = self._conn.execute(
+            "SELECT value FROM {} WHERE key = ?".format(_META_NAME), (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO {} VALUES (?, ?)".format(_META_NAME),
+                           (key, str(value)))
+        return
+
+    @property
+    def synced(self):
+        """Time (`datetime64`) of the most recent sync, or `None`.
+        """
+        val = self._get_meta('synced')
+        return None if val is None else np.datetime64(val, 's')
+
+    @property
+    def covered(self):
+        """Earliest start time (`datetime64`) included in the cache, or `None`.
+        """
+        val = self._get_meta('covered')
+        return None if val is None else np.datetime64(val, 's')
+
+    def load(self, start):
+        """Load all cached jobs which ended after the time `start` (`datetime64`).
+        """
+        columns = ", ".join('"{}"'.format(cc) for cc in self._columns)
+        rows = self._conn.execute(
+            "SELECT {} FROM {} WHERE \"End\" >= ?".format(columns, _TABLE_NAME),
+            (_time_to_sql(start),)).fetchall()
+        return _from_sql_columns(list(zip(*rows)), len(rows), self.header, self.types)
+
+    def store(self, table, synced, covered):
+        """Store the jobs in `table` (which should all be finished), and update the metadata.
+        """
+        keys = table.render('JobID').tolist()
+        values = [vv for nn, vv in _to_sql_columns(table)]
+        holders = ", ".join(["?"] * (len(self._columns) + 1))
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO {} VALUES ({})".format(_TABLE_NAME, holders),
+                zip(keys, *values))
+            self._set_meta('synced', synced)
+            old = self.covered
+            if old is None or covered < old:
+                self._set_meta('covered', covered)
+
+        return
+
+    def evict(self, now):
+        """Remove jobs which ended more than `const.CACHE_MAX_AGE` days before `now`, and the
+        earliest-ending jobs beyond `const.CACHE_MAX_ROWS`.
+        """
+        oldest = now - np.timedelta64(int(const.CACHE_MAX_AGE * 24 * 3600), 's')
+        with self._conn:
+            num = self._conn.execute("DELETE FROM {} WHERE \"End\" < ?".format(_TABLE_NAME),
+                                     (_time_to_sql(oldest),)).rowcount
+            if num > 0:
+                self._update_covered(oldest)
+
+            num = self._conn.execute(
+                "DELETE FROM {tab} WHERE key NOT IN "
+                "(SELECT key FROM {tab} ORDER BY \"End\" DESC LIMIT ?)".format(tab=_TABLE_NAME),
+                (const.CACHE_MAX_ROWS,)).rowcount
+            if num > 0:
+                # Jobs ending before (or at the same time as) the earliest remaining one may
+                # have been removed
+                row = self._conn.execute(
+                    "SELECT MIN(\"End\") FROM {}".format(_TABLE_NAME)).fetchone()
+                self._update_covered(np.datetime64(int(row[0]) + 1, 's'))
+
+        return
+
+    def _update_covered(self, covered):
+        old = self.covered
+        if old is not None and covered > old:
+            self._set_meta('covered', covered)
+        return
+
+    def close(self):
+        self._conn.close()
+        return
+
+
+def cache_path(cluster, user, steps=False):
+    """Path to the cache file for the given cluster and user (and whether job-steps are included).
+    """
+    fname = "sacct_{}_{}{}.sqlite".format(cluster, user, "_steps" if steps else "")
+    return os.path.join(os.path.expanduser(const.CACHE_DIR), fname)
+
+
+def clear():
+    """Delete all cache files.
+    """
+    pattern = os.path.join(os.path.expanduser(const.CACHE_DIR), "sacct_*.sqlite")
+    for fname in glob.glob(pattern):
+        os.remove(fname)
+    return
+
+
+def _time_to_sql(time):
+    return int(time.astype('datetime64[s]').astype(np.int64))
+
+
+def _to_sql_columns(table):
+    """Convert the typed columns of a `JobTable` into (name, list-of-values) pairs for SQLite.
+    """
+    columns = []
+    for kk in table.header:
+        col = table[kk]
+        type = table.types.get(kk)
+        if type == 'jobid':
+            for nn in col.dtype.names:
+                columns.append((kk + '_' + nn, col[nn].tolist()))
+        elif type == 'time':
+            vals = col.astype(np.int64).astype(object)
+            vals[np.isnat(col)] = None
+            columns.append((kk, vals.tolist()))
+        elif type == 'memory':
+            vals = col.astype(object)
+            vals[~np.isfinite(col)] = None
+            columns.append((kk, vals.tolist()))
+        else:
+            columns.append((kk, col.tolist()))
+
+    return columns
+
+
+def _from_sql_columns(values, num, header, types):
+    """Convert SQL columns (as returned by `_to_sql_columns`) into a `JobTable`.
+    """
+    if not num:
+        return JobTable.from_rows([], header, types)
+
+    values = iter(values)
+    columns = OrderedDict()
+    for kk in header:
+        type = types.get(kk)
+        if type == 'jobid':
+            col = np.zeros(num, dtype=JOBID_DTYPE)
+            for nn in JOBID_DTYPE.names:
+                col[nn] = next(values)
+        elif type == 'time':
+            vals = np.array(next(values), dtype=object)
+            nat = np.equal(vals, None)
+            vals[nat] = 0
+            col = vals.astype(np.int64).astype('datetime64[s]')
+            col[nat] = np.datetime64('NaT')
+        elif type == 'memory':
+            vals = np.array(next(values), dtype=object)
+            vals[np.equal(vals, None)] = np.nan
+            col = vals.astype(np.float64)
+        elif type in ['duration', 'count']:
+            col = np.array(next(values), dtype=np.int64)
+        else:
+            col = np.array(next(values), dtype=str)
+        columns[kk] = col
+
+    return JobTable(columns, header, types=types)
@@ -1,38 +1,164 @@
 """
 """
 
-import re
+import os
 
 
-META_WIDTH = 50
 COLUMN_SPACING = 2
 SEP_CHAR = " "
 # Change time-strings as returned by sacct into a different format
 REFORMAT_TIMES = True
 REFORMAT_TIMES_SEP_CHAR = " "
+# Number of distinct duration-strings (in non-standard formats) whose values are kept, see `times.py`
+TIME_CACHE_SIZE = 65536
+# Number of lines of output written at a time
+OUTPUT_CHUNK_SIZE = 4096
+# Number of rows used to estimate column widths when streaming output (`--stream`)
+FORMAT_SAMPLE_SIZE = 1000
 
-SACCT_KEYS = ['JobID', 'JobName', 'State', 'Submit', 'Start', 'Elapsed',
-              'AveVMSize', 'MaxVMSize', 'ReqMem', 'AveDiskRead', 'AveDiskWrite',
-              'partition', 'nodelist']
+# Delimiter between fields in the (`--parsable2`) output of 'sacct'
+SACCT_DELIMITER = "|"
+# Largest range of JobIDs (e.g. `--id LO:HI`) which is passed to 'sacct' as an explicit list
+PUSHDOWN_MAX_JOBIDS = 1000
+# Number of 'sacct' output lines converted into typed columns at a time
+PARSE_CHUNK_SIZE = 10000
+# Length of the time-shards [days] that long 'sacct' query windows are split into (`--shard-days`)
+SACCT_SHARD_DAYS = 7.0
+# Fraction of a shard by which a window may exceed a whole number of shards without adding another
+#    (e.g. the default 7-day window, measured a few seconds after its start was determined)
+SACCT_SHARD_SLACK = 0.01
+# Default number of 'sacct' shard queries to run concurrently (`--workers`)
+SACCT_SHARD_WORKERS = 4
+# Number of threads of the shared pool used to run SLURM commands (see `pool.py`)
+POOL_WORKERS = 8
+# Maximum time [s] for each 'sacct' query (of each cluster and time-shard), or `None` (`--timeout`)
+SACCT_TIMEOUT = None
 
-SACCT_KEYS_TIMES = ['Submit', 'Start', 'Elapsed']
+SACCT_KEYS = ['JobID', 'JobName', 'State', 'Submit', 'Start', 'End', 'Elapsed',
+              'AveVMSize', 'MaxVMSize', 'MaxRSS', 'ReqMem', 'ReqTRES', 'AveDiskRead',
+              'AveDiskWrite', 'AllocCPUS', 'AllocNodes', 'TotalCPU', 'CPUTimeRAW',
+              'Partition', 'NodeList', 'User', 'Cluster']
 
-SACCT_KEYS_PRINT = ['JobID', 'JobName', 'State', 'Submit', 'Start', 'Elapsed',
-                    'partition']
+# Type used to store each 'sacct' field in a `JobTable` (see `table.convert_column`).
+#    Fields which are not included are stored as strings.
+SACCT_KEYS_TYPES = {'JobID': 'jobid', 'Submit': 'time', 'Start': 'time', 'End': 'time',
+                    'Elapsed': 'duration', 'TotalCPU': 'duration', 'CPUTimeRAW': 'duration',
+                    'AveVMSize': 'memory', 'MaxVMSize': 'memory', 'MaxRSS': 'memory',
+                    'ReqMem': 'memory', 'AveDiskRead': 'memory', 'AveDiskWrite': 'memory',
+                    'AllocCPUS': 'count', 'AllocNodes': 'count'}
 
-SQUEUE_KEYS = ['account', 'arrayjobid', 'arraytaskid', 'command', 'cores',
-               'deadline', 'endtime', 'exit_code', 'groupid', 'groupname',
-               'jobid', 'maxcpus', 'maxnodes', 'name', 'minmemory',
-               'numcpus', 'numnodes', 'partition', 'starttime', 'submittime',
-               'timeused', 'timeleft', 'timelimit', 'username']
+SACCT_KEYS_PRINT = ['JobID', 'JobName', 'State', 'Submit', 'Start', 'Elapsed',
+                    'Partition']
 
-DEF_PARTITIONS = ['hernquist', 'itccluster']
+# Fields requested from 'squeue' (using the same names as 'sacct'), and their '--format' codes
+SQUEUE_KEYS = ['JobID', 'JobName', 'State', 'Submit', 'Start', 'Elapsed', 'TimeLeft',
+               'TimeLimit', 'Partition', 'NodeList', 'NumNodes', 'NumCPUs', 'User', 'Reason']
+SQUEUE_KEYS_CODES = {'JobID': '%i', 'JobName': '%j', 'State': '%T', 'Submit': '%V',
+                     'Start': '%S', 'Elapsed': '%M', 'TimeLeft': '%L', 'TimeLimit': '%l',
+                     'Partition': '%P', 'NodeList': '%N', 'NumNodes': '%D', 'NumCPUs': '%C',
+                     'User': '%u', 'Reason': '%r'}
+SQUEUE_KEYS_TYPES = {'JobID': 'jobid', 'Submit': 'time', 'Start': 'time', 'Elapsed': 'duration',
+                     'TimeLeft': 'duration', 'TimeLimit': 'duration'}
+SQUEUE_KEYS_PRINT = ['JobID', 'JobName', 'State', 'Start', 'Elapsed', 'TimeLeft', 'Partition',
+                     'Reason']
+# Live 'squeue' fields added to 'sacct' results (`--merge`)
+SQUEUE_MERGE_KEYS = ['TimeLeft', 'TimeLimit', 'Reason']
 
 STATE_KEYS = ['PENDING', 'RUNNING', 'COMPLETED', 'FAILED', 'CANCELLED', 'TIMEOUT']
 
-REGEX_TIMES = '(\d{4}-\d{2}-\d{2})T(\d{2}:\d{2}:\d{2})'
+# All job states reported by SLURM, see `man sacct`
+SLURM_STATES = STATE_KEYS + [
+    'BOOT_FAIL', 'CONFIGURING', 'COMPLETING', 'DEADLINE', 'NODE_FAIL', 'OUT_OF_MEMORY',
+    'PREEMPTED', 'REQUEUED', 'REQUEUE_FED', 'REQUEUE_HOLD', 'RESIZING', 'RESV_DEL_HOLD',
+    'REVOKED', 'SIGNALING', 'SPECIAL_EXIT', 'STAGE_OUT', 'STOPPED', 'SUSPENDED']
+# Name used for any states not included in `SLURM_STATES`
+OTHER_STATE = 'OTHER'
+# Percentiles of elapsed time reported by `--summary --verbose`
+SUMMARY_PERCENTILES = [0, 50, 90, 100]
+
+# Resource-efficiency report (`--efficiency`, see `efficiency.py`)
+# Number of jobs listed with the most unused (requested) memory
+EFFICIENCY_TOP = 10
+# Number of bins of the efficiency histograms (over 0-100%; higher values are counted separately)
+EFFICIENCY_BINS = 10
+# Width (in characters) of the longest histogram bar
+EFFICIENCY_BAR_WIDTH = 40
+
+# States of job-array tasks which are listed as failed by `--arrays`
+ARRAY_FAILED_STATES = ['FAILED', 'TIMEOUT', 'OUT_OF_MEMORY', 'NODE_FAIL', 'BOOT_FAIL',
+                       'DEADLINE']
+# Number of ranges of failed tasks shown for each job-array (all are shown with `--verbose`)
+ARRAY_FAILED_RANGES = 5
+
+# Per-node report (`--nodes`, see `hostlist.py` and `stats.summarize_nodes`)
+# States of jobs counted as failures of the nodes they ran on
+NODE_FAILURE_STATES = ['FAILED', 'NODE_FAIL', 'BOOT_FAIL']
+# Number of nodes listed (those with the most failed jobs), unless `--head` is given
+NODES_TOP = 20
+# Number of distinct hostlists whose expansions are kept (see `hostlist.expand`)
+HOSTLIST_CACHE_SIZE = 4096
+
+# States of jobs which are finished, and will not change again
+TERMINAL_STATES = ['BOOT_FAIL', 'CANCELLED', 'COMPLETED', 'DEADLINE', 'FAILED', 'NODE_FAIL',
+                   'OUT_OF_MEMORY', 'TIMEOUT']
+
+# Maximum length (in bytes) of each 'scancel' command-line
+SCANCEL_MAX_ARG_BYTES = 100000
+
+# 'Watch' mode (see `watch.py`)
+# -----------------------------
+# Factor by which the refresh interval grows each time the output has not changed
+WATCH_BACKOFF = 1.5
+# Maximum refresh interval, as a multiple of the interval given by `--watch`
+WATCH_MAX_BACKOFF = 4.0
+
+# Cache of 'sacct' results for finished jobs (see `cache.py`)
+# ----------------------------------------------------------
+# Use the cache by default (otherwise enable it with `--cache`).  Filters are not applied by
+#    'sacct' itself when the cache is used (so that all jobs are cached), and results cannot be
+#    streamed, so it is only worthwhile for repeated queries of long windows.
+USE_CACHE = False
+CACHE_DIR = os.path.join("~", ".cache", "slurpy")
+# Increment to invalidate existing cache files
+CACHE_VERSION = 2
+# Jobs which ended more than this many days ago are removed
+CACHE_MAX_AGE = 180.0
+# Maximum number of jobs stored in each cache file
+CACHE_MAX_ROWS = 1000000
+# Seconds to wait for access to a cache file (e.g. being written by another process)
+CACHE_TIMEOUT = 10.0
+# Overlap (in seconds) between the previous sync and the next 'sacct' query, for safety
+CACHE_SYNC_OVERLAP = 60
 
+# Local history of 'sacct' results (`slurpy sync` and `--history`, see `history.py`)
+# ---------------------------------------------------------------------------------
+HISTORY_DIR = os.path.join("~", ".local", "share", "slurpy", "history")
+# Format of the stored history, existing histories with another version cannot be read
+HISTORY_VERSION = 1
 
-# Constructed / Calculated constants
-# ----------------------------------
-_REGEX_TIMES_PATTERN = re.compile(REGEX_TIMES)
+# Server ('slurpy serve', see `server.py`)
+# ---------------------------------------
+# Use a running server when possible (disable with `--no-server`)
+USE_SERVER = True
+# Directory of the server's socket, which only its user can access: 'slurpy' within
+# '$XDG_RUNTIME_DIR' if it is set, otherwise this one (formatted with the user's uid)
+SERVER_DIR = os.path.join("/tmp", "slurpy-{uid}")
+# Name of the server's Unix socket (within its directory), which includes the name of the cluster
+#    only when '$SLURM_CLUSTER_NAME' is set (so that clients never need to query it)
+SERVER_SOCKET = "server.sock"
+SERVER_SOCKET_CLUSTER = "server-{cluster}.sock"
+# Path of a socket shared by all local users (`slurpy serve --shared`), e.g.
+#    '/run/slurpy/server.sock' in a directory set up by an administrator, which clients use when
+#    they do not have a server of their own
+SERVER_SHARED_SOCKET = None
+# Users (besides the current one) whose sockets clients use, e.g. the account of a shared server
+SERVER_TRUSTED_USERS = ['root']
+# Seconds between the server's queries of 'sacct' and 'squeue' (`--interval`)
+SERVER_INTERVAL = 30.0
+# Seconds for which the start time of a request keeps the server from moving its window past it
+#    (e.g. for `--watch` clients, which keep their start time), see `server.Server.poll`
+SERVER_REQUEST_EXPIRY = 3600.0
+# Seconds that clients wait for a response, before calling 'sacct' (or 'squeue') directly
+SERVER_TIMEOUT = 10.0
+# Version of the request/response protocol, servers reject requests with other versions
+SERVER_PROTOCOL = 1
@@ -0,0 +1,258 @@
+"""Resource efficiency of finished jobs: requested versus used memory and CPU time.
+
+Memory requested per node is taken from 'ReqTRES' (e.g. 'cpu=4,mem=16G,node=1', the total for
+the job, divided by 'AllocNodes'), or from 'ReqMem' when 'ReqTRES' does not include memory.
+Memory used per node is the largest 'MaxRSS' of any of the job's steps (including '.batch'),
+which is exact for jobs with one task per node.  CPU efficiency is the ratio of 'TotalCPU'
+(time actually used by all CPUs) to 'CPUTimeRAW' (elapsed time times allocated CPUs).
+
+All values are computed with array operations over the parsed 'sacct' columns: steps are
+grouped with their job by a single sort of the JobIDs.
+
+Functions
+---------
+-   efficiency            - Call 'sacct' (including job-steps) and print the efficiency report.
+-   efficiency_results    - Call 'sacct' and compute the efficiency of each finished job.
+-   compute_efficiency    - Compute the requested and used resources of each job in a table.
+-   format_efficiency     - Format the results of `compute_efficiency` into lines of text.
+
+-   _group_steps          - Label the rows of each job (allocation and steps) by one integer.
+-   _requested_memory     - Total memory requested for each job, from 'ReqTRES' or 'ReqMem'.
+-   _format_histogram     - Format a histogram of efficiencies as lines of text bars.
+-   _percent              - Format a ratio as a percentage ('-' if unknown).
+-   _nanmedian            - Median of the finite values of an array.
+"""
+
+import argparse
+from collections import namedtuple, OrderedDict
+import numpy as np
+
+from . import const
+from . import stats
+from . import utils
+from .table import JobTable, convert_column, render_column
+
+# Results of `compute_efficiency`, arrays have one value per job (NaN when unknown).
+#    jobs : `JobTable` of job allocations (finished, and with a non-zero elapsed time)
+#    mem_req : (N,) memory requested per node [bytes]
+#    mem_used : (N,) largest memory used per node [bytes]
+#    cpu_time : (N,) allocated CPU time (elapsed time times number of CPUs) [s]
+#    cpu_used : (N,) CPU time used [s]
+Efficiency = namedtuple('Efficiency', ['jobs', 'mem_req', 'mem_used', 'cpu_time', 'cpu_used'])
+
+_GB = 2.0**30
+
+
+def efficiency(args):
+    """Call 'sacct' (including all job-steps) and print the resource efficiency of finished jobs.
+
+    The jobs with the most unused memory are listed (`args.head`, or `const.EFFICIENCY_TOP`).
+    """
+    eff = efficiency_results(args)
+    top = const.EFFICIENCY_TOP if args.head is None else int(args.head)
+    for line in format_efficiency(eff, args, top=top):
+        print(line)
+
+    return
+
+
+def efficiency_results(args, check=False):
+    """Call 'sacct' (including all job-steps) and compute the efficiency of each finished job.
+
+    Returns
+    -------
+    eff : `Efficiency`
+
+    """
+    from . import sacct
+    # Memory usage is only reported for job-steps, including '.batch'
+    args = argparse.Namespace(**dict(vars(args), steps='all'))
+    table = sacct.sacct_results(args, check=check)
+    return compute_efficiency(table)
+
+
+def compute_efficiency(table):
+    """Compute the requested and used memory and CPU time of each finished job in the table.
+
+    Arguments
+    ---------
+    table : `JobTable`
+        'sacct' results including job-steps (see `const.SACCT_KEYS`).
+
+    Returns
+    -------
+    eff : `Efficiency`
+
+    """
+    ids = table['JobID']
+    labels, num = _group_steps(ids)
+
+    # Largest memory used by any step of each job (ignoring steps without values)
+    rss = table['MaxRSS']
+    mem_used = np.full(num, -np.inf)
+    valid = np.isfinite(rss)
+    np.maximum.at(mem_used, labels[valid], rss[valid])
+    mem_used[np.isinf(mem_used)] = np.nan
+
+    # Select finished job allocations which ran for some time
+    alloc = (ids['step'] == -1) & (ids['id'] >= 0)
+    alloc &= np.isin(stats.normalize_states(table['State']), const.TERMINAL_STATES)
+    alloc &= (table['Elapsed'] > 0)
+    alloc = np.flatnonzero(alloc)
+    jobs = table[alloc]
+
+    nodes = jobs['AllocNodes'].astype(np.float64)
+    nodes[nodes <= 0] = np.nan
+    mem_req = _requested_memory(jobs) / nodes
+
+    cpu_time = jobs['CPUTimeRAW'].astype(np.float64)
+    cpu_used = jobs['TotalCPU'].astype(np.float64)
+    cpu_time[cpu_time <= 0] = np.nan
+    cpu_used[cpu_used < 0] = np.nan
+
+    return Efficiency(jobs, mem_req, mem_used[labels[alloc]], cpu_time, cpu_used)
+
+
+def format_efficiency(eff, args, top=None):
+    """Format the results of `compute_efficiency` into lines of text.
+
+    Totals are weighted by the elapsed time (and number of nodes) of each job, followed by
+    histograms of the efficiency of each job, and the `top` jobs with the most unused memory.
+    """
+    if top is None:
+        top = const.EFFICIENCY_TOP
+
+    jobs = eff.jobs
+    hours = jobs['Elapsed'] / 3600.0
+    nodes = jobs['AllocNodes'].astype(np.float64)
+    nodes[nodes <= 0] = np.nan
+    mem_eff = eff.mem_used / eff.mem_req
+    cpu_eff = eff.cpu_used / eff.cpu_time
+
+    lines = ["Jobs: {} (with memory usage: {}, with CPU usage: {})".format(
+        len(jobs), np.isfinite(mem_eff).sum(), np.isfinite(cpu_eff).sum())]
+    if not len(jobs):
+        return lines
+
+    # Totals, only including jobs with both values
+    sel = np.isfinite(mem_eff)
+    req = np.sum((eff.mem_req * nodes * hours)[sel]) / _GB
+    used = np.sum((eff.mem_used * nodes * hours)[sel]) / _GB
+    lines.append("Memory: requested {:.1f} GB-hours, used {:.1f} GB-hours ({})".format(
+        req, used, _percent(used, req)))
+    sel = np.isfinite(cpu_eff)
+    req = np.sum(eff.cpu_time[sel]) / 3600.0
+    used = np.sum(eff.cpu_used[sel]) / 3600.0
+    lines.append("CPU: allocated {:.1f} CPU-hours, used {:.1f} CPU-hours ({})".format(
+        req, used, _percent(used, req)))
+    lines.append("Median job efficiency: memory {}, CPU {}".format(
+        _percent(_nanmedian(mem_eff)), _percent(_nanmedian(cpu_eff))))
+
+    lines.append("")
+    lines.append("Memory efficiency (number of jobs):")
+    lines.extend(_format_histogram(mem_eff))
+    lines.append("CPU efficiency (number of jobs):")
+    lines.extend(_format_histogram(cpu_eff))
+
+    # Jobs with the most unused memory (weighted by time)
+    unused = (eff.mem_req - eff.mem_used) * nodes * hours / _GB
+    valid = np.flatnonzero(np.isfinite(unused) & (unused > 0))
+    if not len(valid) or top <= 0:
+        return lines
+
+    idx = valid[np.argsort(-unused[valid], kind='stable')[:top]]
+    columns = [('MemReq', render_column(eff.mem_req[idx], 'memory')),
+               ('MemUsed', render_column(eff.mem_used[idx], 'memory')),
+               ('MemEff', np.array([_percent(vv) for vv in mem_eff[idx]])),
+               ('CPUEff', np.array([_percent(vv) for vv in cpu_eff[idx]])),
+               ('Unused [GB-hr]', np.array(["{:.1f}".format(vv) for vv in unused[idx]]))]
+    table = jobs[idx].select_fields(['JobID', 'JobName', 'State', 'Elapsed', 'AllocCPUS',
+                                      'AllocNodes'])
+    columns = OrderedDict(list(table.columns.items()) + columns)
+    table = JobTable(columns, types=table.types)
+
+    lines.append("")
+    lines.append("Most unused memory:")
+    args = argparse.Namespace(**dict(vars(args), verbose=False, head=None, tail=None))
+    lines.extend(utils.format_table(table, args, keys=list(columns.keys())))
+    return lines
+
+
+def _group_steps(ids):
+    """Label the rows of each job (its allocation and all steps) by the same integer.
+
+    Rows are grouped by the 'id', 'task' and 'het' components of their JobIDs, using one sort.
+
+    Returns
+    -------
+    labels : (N,) np.ndarray of int
+        Index of the job of each row, in [0, num).
+    num : int
+        Number of jobs.
+
+    """
+    if not len(ids):
+        return np.zeros(0, dtype=np.int64), 0
+
+    order = np.lexsort((ids['het'], ids['task'], ids['id']))
+    srt = ids[order]
+    new = np.ones(len(ids), dtype=bool)
+    new[1:] = ((srt['id'][1:] != srt['id'][:-1]) | (srt['task'][1:] != srt['task'][:-1]) |
+               (srt['het'][1:] != srt['het'][:-1]))
+
+    labels = np.empty(len(ids), dtype=np.int64)
+    labels[order] = np.cumsum(new) - 1
+    return labels, int(new.sum())
+
+
+def _requested_memory(jobs):
+    """Total memory [bytes] requested by each job, from 'ReqTRES' or otherwise 'ReqMem'.
+
+    'ReqTRES' (e.g. 'billing=4,cpu=4,mem=16G,node=1') gives the total memory for the job.  When
+    it is not available, 'ReqMem' is assumed to be per node.
+    """
+    uniq, inverse = np.unique(jobs['ReqTRES'], return_inverse=True)
+    mems = []
+    for tres in uniq:
+        mem = ''
+        for item in tres.split(','):
+            if item.startswith('mem='):
+                mem = item[len('mem='):]
+        mems.append(mem)
+
+    total = convert_column(mems, 'memory')[inverse.reshape(-1)]
+    nodes = jobs['AllocNodes'].astype(np.float64)
+    missing = ~np.isfinite(total)
+    total[missing] = jobs['ReqMem'][missing] * np.where(nodes[missing] > 0, nodes[missing], 1)
+    return total
+
+
+def _format_histogram(values):
+    """Format a histogram of efficiencies (in `const.EFFICIENCY_BINS` bins over 0-100%).
+    """
+    values = values[np.isfinite(values)]
+    nbins = const.EFFICIENCY_BINS
+    counts, edges = np.histogram(np.clip(values, 0.0, 1.0), bins=nbins, range=(0.0, 1.0))
+    # Values above 100% are shown separately (they are included in the last bin above)
+    over = np.sum(values > 1.0)
+    counts[-1] -= over
+    labels = ["{:3.0f}-{:3.0f}%".format(100*lo, 100*hi) for lo, hi in zip(edges[:-1], edges[1:])]
+    labels.append("   >100%")
+    counts = np.append(counts, over)
+
+    width = const.EFFICIENCY_BAR_WIDTH
+    scale = width / max(counts.max(), 1)
+    lines = ["\t{} |{:<{}s} {}".format(ll, "#" * int(np.ceil(cc * scale)), width, cc)
+             for ll, cc in zip(labels, counts)]
+    return lines
+
+
+def _percent(num, den=1.0):
+    if not np.isfinite(num) or not np.isfinite(den) or den <= 0:
+        return "-"
+    return "{:.1f}%".format(100.0 * num / den)
+
+
+def _nanmedian(values):
+    values = values[np.isfinite(values)]
+    return np.median(values) if len(values) else np.nan
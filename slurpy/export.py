@@ -0,0 +1,198 @@
+"""Write job tables in machine-readable formats, with typed columns.
+
+Supported formats (`FORMATS`):
+-   'csv'     : comma-separated values with a header line.
+-   'jsonl'   : JSON Lines, one object per job.
+-   'npz'     : `numpy` archive with one array per field (loadable with `np.load`).
+-   'parquet' : Apache Parquet (requires `pyarrow`).
+-   'arrow'   : Apache Arrow IPC stream (requires `pyarrow`).
+
+Times are written in ISO format (or as `datetime64` for binary formats), 'Elapsed' in seconds,
+and memory fields in bytes.  Text formats, and 'parquet'/'arrow', are written one table (chunk)
+at a time, so they can be used while results are still being read.
+
+Functions
+---------
+-   write_tables          - Write the rows of each `JobTable` (chunk) to a file or stdout.
+-   write_table           - Write a single `JobTable` to a file or stdout.
+
+-   _export_columns       - Convert the typed columns of a table into exportable arrays.
+-   _write_csv            -
+-   _write_jsonl          -
+-   _write_npz            -
+-   _write_arrow          -
+-   _import_pyarrow       - Import the optional `pyarrow` package, with an informative error.
+"""
+
+import sys
+import json
+import itertools
+from collections import OrderedDict
+import numpy as np
+
+from . import const
+
+FORMATS = ['csv', 'jsonl', 'npz', 'parquet', 'arrow']
+_BINARY_FORMATS = ['npz', 'parquet', 'arrow']
+
+
+def write_tables(tables, fmt, path=None):
+    """Write the rows of each `JobTable` in `tables` (e.g. chunks of results) to a file or stdout.
+
+    Arguments
+    ---------
+    tables : iterable of `JobTable`
+    fmt : str
+        One of `FORMATS`.
+    path : str or None
+        Output filename, or `None` (or '-') to write to stdout.
+
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unrecognized output format '{}', must be one of {}".format(fmt, FORMATS))
+
+    # Check for optional dependencies before creating any output
+    if fmt in ['parquet', 'arrow']:
+        _import_pyarrow()
+
+    binary = (fmt in _BINARY_FORMATS)
+    if path is None or path == '-':
+        fobj = sys.stdout.buffer if binary else sys.stdout
+        close = False
+    else:
+        fobj = open(path, 'wb' if binary else 'w', newline='' if not binary else None)
+        close = True
+
+    try:
+        if fmt == 'csv':
+            _write_csv(tables, fobj)
+        elif fmt == 'jsonl':
+            _write_jsonl(tables, fobj)
+        elif fmt == 'npz':
+            _write_npz(tables, fobj)
+        else:
+            _write_arrow(tables, fobj, parquet=(fmt == 'parquet'))
+        fobj.flush()
+    finally:
+        if close:
+            fobj.close()
+
+    return
+
+
+def write_table(table, fmt, path=None):
+    """Write a single `JobTable` to a file or stdout, see `write_tables`.
+    """
+    write_tables([table], fmt, path=path)
+    return
+
+
+def _export_columns(table, text=False):
+    """Convert the typed columns of a table into arrays which can be exported directly.
+
+    'JobID' values are converted to strings, along with their integer components (e.g.
+    'JobID_task').  If `text`, times are converted to ISO strings, and missing values are `None`.
+    """
+    columns = OrderedDict()
+    for kk in table.header:
+        col = table[kk]
+        type = table.types.get(kk)
+        if type == 'jobid':
+            columns[kk] = table.render(kk)
+            for nn in ['id', 'task', 'het', 'step']:
+                columns[kk + '_' + nn] = col[nn]
+        elif type == 'time' and text:
+            vals = np.datetime_as_string(col, unit='s').astype(object)
+            vals[np.isnat(col)] = None
+            columns[kk] = vals
+        elif type == 'memory' and text:
+            vals = col.astype(object)
+            vals[~np.isfinite(col)] = None
+            columns[kk] = vals
+        else:
+            columns[kk] = col
+
+    return columns
+
+
+def _write_csv(tables, fobj):
+    import csv
+    writer = csv.writer(fobj)
+    header = None
+    for table in tables:
+        columns = _export_columns(table, text=True)
+        if header is None:
+            header = list(columns.keys())
+            writer.writerow(header)
+        # `csv` writes `None` as an empty field
+        writer.writerows(zip(*[cc.tolist() for cc in columns.values()]))
+
+    return
+
+
+def _write_jsonl(tables, fobj):
+    size = const.OUTPUT_CHUNK_SIZE
+    for table in tables:
+        columns = _export_columns(table, text=True)
+        keys = list(columns.keys())
+        values = [cc.tolist() for cc in columns.values()]
+        rows = zip(*values)
+        while True:
+            lines = [json.dumps(dict(zip(keys, row))) for row in itertools.islice(rows, size)]
+            if not len(lines):
+                break
+            fobj.write("\n".join(lines) + "\n")
+
+    return
+
+
+def _write_npz(tables, fobj):
+    from .table import JobTable
+    tables = list(tables)
+    if not len(tables):
+        return
+    table = JobTable.concatenate(tables)
+    columns = _export_columns(table)
+    # Store the 'JobID' components together as well, in their structured form
+    columns['JobID_parsed'] = table['JobID']
+    np.savez(fobj, **columns)
+    return
+
+
+def _write_arrow(tables, fobj, parquet=False):
+    pa = _import_pyarrow()
+    writer = None
+    try:
+        for table in tables:
+            columns = _export_columns(table)
+            arrays = OrderedDict()
+            for kk, vv in columns.items():
+                # Missing times and memory values are exported as nulls
+                if vv.dtype.kind == 'M':
+                    mask = np.isnat(vv)
+                elif vv.dtype.kind == 'f':
+                    mask = ~np.isfinite(vv)
+                else:
+                    mask = None
+                arrays[kk] = pa.array(vv, mask=mask)
+            batch = pa.table(arrays)
+            if writer is None:
+                if parquet:
+                    import pyarrow.parquet as pq
+                    writer = pq.ParquetWriter(fobj, batch.schema)
+                else:
+                    writer = pa.ipc.new_stream(fobj, batch.schema)
+            writer.write_table(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("The 'parquet' and 'arrow' output formats require `pyarrow`.")
+    return pyarrow
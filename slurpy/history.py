@@ -0,0 +1,253 @@
+"""Local, append-only history of 'sacct' results, partitioned by day, for long-term analysis.
+
+`slurpy sync` queries 'sacct' for jobs active since the previous sync (or since `--start`), and
+appends all finished jobs (including job-steps) to the store.  Each day (of the jobs' 'End'
+times) is a directory containing one `.npy` file per (typed) field, e.g.
+
+    ~/.local/share/slurpy/history/<cluster>_<user>/2017-03-01/JobID.npy
+
+Queries using `--history` (including `--summary` and `--efficiency`) then read only the
+partitions which overlap the query window, without calling 'sacct'.  Columns are memory-mapped,
+and filters are applied to each partition separately, so that only the selected rows are
+copied.  Only finished jobs are stored (see `const.TERMINAL_STATES`).
+
+Classes
+-------
+-   HistoryStore          - Directory of day-partitions of typed 'sacct' columns.
+
+Functions
+---------
+-   sync                  - Query 'sacct' and append all newly finished jobs to the history.
+-   history_results       - Load the (filtered) jobs in the query window from the history.
+-   store_path            - Path to the history directory for the given cluster and user.
+"""
+
+import os
+import json
+import shutil
+import datetime
+from collections import OrderedDict
+import numpy as np
+
+from . import const
+from . import stats
+from .table import JobTable, _missing_value
+
+_INDEX_NAME = 'index.json'
+
+
+class HistoryStore(object):
+    """Directory of day-partitions, each with one `.npy` file per (typed) field.
+
+    The index file records, for each partition, the number of rows, the fields stored, and the
+    earliest start (or submit) time of its jobs (used to select partitions for a query window).
+    It also records the time of the last sync ('synced'), and the earliest time included
+    ('covered').
+    """
+
+    def __init__(self, path, header, types):
+        self.path = path
+        self.header = list(header)
+        self.types = types
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self.index = self._load_index()
+        return
+
+    def _load_index(self):
+        fname = os.path.join(self.path, _INDEX_NAME)
+        if not os.path.exists(fname):
+            return {'version': const.HISTORY_VERSION, 'synced': None, 'covered': None,
+                    'partitions': {}}
+
+        with open(fname, 'r') as fobj:
+            index = json.load(fobj)
+        if index.get('version') != const.HISTORY_VERSION:
+            raise ValueError("History in '{}' has version '{}' (not '{}'), remove it and "
+                             "`sync` again.".format(self.path, index.get('version'),
+                                                    const.HISTORY_VERSION))
+        return index
+
+    def _save_index(self):
+        fname = os.path.join(self.path, _INDEX_NAME)
+        temp = "{}.{}".format(fname, os.getpid())
+        with open(temp, 'w') as fobj:
+            json.dump(self.index, fobj, indent=1, sort_keys=True)
+        os.replace(temp, fname)
+        return
+
+    @property
+    def synced(self):
+        """Time (`datetime64`) of the most recent sync, or `None`.
+        """
+        val = self.index['synced']
+        return None if val is None else np.datetime64(val, 's')
+
+    @property
+    def covered(self):
+        """Earliest time (`datetime64`) included in the history, or `None`.
+        """
+        val = self.index['covered']
+        return None if val is None else np.datetime64(val, 's')
+
+    def partitions(self, start=None, end=None):
+        """Names of the partitions (days) which may include jobs active between `start` and `end`.
+        """
+        days = []
+        for day, meta in sorted(self.index['partitions'].items()):
+            # Partitions are named by the day jobs ended, and jobs started no later than 'first'
+            if start is not None and np.datetime64(day, 'D') < start.astype('datetime64[D]'):
+                continue
+            if end is not None and np.datetime64(meta['first'], 's') > end:
+                continue
+            days.append(day)
+
+        return days
+
+    def read(self, day):
+        """Return the `JobTable` of the given partition, with memory-mapped columns.
+
+        Fields which are not stored in the partition (e.g. added to `const.SACCT_KEYS` later)
+        are given missing values.
+        """
+        meta = self.index['partitions'][day]
+        path = os.path.join(self.path, day)
+        columns = OrderedDict()
+        for kk in self.header:
+            if kk in meta['fields']:
+                columns[kk] = np.load(os.path.join(path, kk + '.npy'), mmap_mode='r')
+            else:
+                type = self.types.get(kk)
+                columns[kk] = np.full(meta['rows'], _missing_value(type),
+                                      dtype=JobTable.from_rows([], [kk], self.types)[kk].dtype)
+
+        return JobTable(columns, self.header, types=self.types)
+
+    def append(self, table, synced, covered):
+        """Add the (finished) jobs in `table` to the partition of the day they ended.
+
+        Jobs already stored (with the same JobID) are replaced.  Each updated partition is
+        written into a new directory, which then replaces the old one.
+
+        Returns
+        -------
+        num : int
+            Number of partitions written.
+
+        """
+        days = table['End'].astype('datetime64[D]')
+        order = np.argsort(days, kind='stable')
+        uniq, first = np.unique(days[order], return_index=True)
+        bounds = list(first[1:]) + [len(order)]
+
+        for day, lo, hi in zip(uniq, first, bounds):
+            day = str(day)
+            part = table[order[lo:hi]]
+            if day in self.index['partitions']:
+                part = self.read(day).update(part)
+            self._write(day, part)
+
+        self.index['synced'] = str(synced)
+        if self.covered is None or covered < self.covered:
+            self.index['covered'] = str(covered)
+        self._save_index()
+        return len(uniq)
+
+    def _write(self, day, table):
+        path = os.path.join(self.path, day)
+        temp = "{}.new-{}".format(path, os.getpid())
+        old = "{}.old-{}".format(path, os.getpid())
+        os.makedirs(temp)
+        for kk in table.header:
+            np.save(os.path.join(temp, kk + '.npy'), np.ascontiguousarray(table[kk]))
+
+        # Readers which have already mapped the old files can keep using them
+        if os.path.exists(path):
+            os.rename(path, old)
+        os.rename(temp, path)
+        if os.path.exists(old):
+            shutil.rmtree(old)
+
+        starts = np.where(np.isnat(table['Start']), table['Submit'], table['Start'])
+        first = starts.min() if len(table) else np.datetime64('NaT')
+        if np.isnat(first):
+            first = np.datetime64(day, 's')
+        self.index['partitions'][day] = {'rows': len(table), 'fields': list(table.header),
+                                         'first': str(first.astype('datetime64[s]'))}
+        return
+
+
+def sync(args):
+    """Query 'sacct' (including job-steps) and append all newly finished jobs to the history.
+
+    The first sync (and any with an earlier `args.start` than previously) queries from
+    `args.start`, later ones only query jobs active since the previous sync, see `slurpy.cache`.
+    """
+    import getpass
+    import argparse
+    from . import sacct
+    header = list(const.SACCT_KEYS)
+    path = store_path(sacct._get_cluster_name(), getpass.getuser())
+    store = HistoryStore(path, header, const.SACCT_KEYS_TYPES)
+
+    start = np.datetime64(args.start, 's')
+    now = np.datetime64(datetime.datetime.now().replace(microsecond=0), 's')
+    synced = store.synced
+    covered = store.covered
+    if (synced is None) or (covered is None) or (start < covered):
+        query_start = start
+    else:
+        query_start = synced - np.timedelta64(const.CACHE_SYNC_OVERLAP, 's')
+
+    # Store all jobs and steps, filters are applied when loading
+    query = argparse.Namespace(**dict(vars(args), steps='all', state=None, partition=None,
+                                      name=None, jobid=None, end=None))
+    table = sacct._parse_sacct(query, start=str(query_start), pushdown=False, check=True)
+    done = np.isin(stats.normalize_states(table['State']), const.TERMINAL_STATES)
+    done &= ~np.isnat(table['End'])
+    table = table[done]
+
+    num = store.append(table, synced=now, covered=min(start, query_start))
+    print("Stored {} finished jobs (and steps) from {} in {} partitions of '{}'.".format(
+        len(table), query_start, num, path))
+    return
+
+
+def history_results(args):
+    """Load the jobs in the query window (`args.start` to `args.end`) from the history.
+
+    Only partitions which may overlap the window are read, and the filters in `args` (see
+    `sacct._filter_lines`) are applied to each one separately.
+
+    Returns
+    -------
+    table : `slurpy.table.JobTable`
+
+    """
+    import getpass
+    from . import sacct
+    header = list(const.SACCT_KEYS)
+    store = HistoryStore(store_path(sacct._get_cluster_name(), getpass.getuser()), header,
+                         const.SACCT_KEYS_TYPES)
+    start = None if args.start is None else np.datetime64(args.start, 's')
+    end = None if args.end is None else np.datetime64(args.end, 's')
+
+    tables = []
+    for day in store.partitions(start, end):
+        table = store.read(day)
+        sel = sacct._select_window(table, args)
+        table = sacct._filter_lines(table[sel], args, pushdown=False)
+        if len(table):
+            tables.append(table)
+
+    if not len(tables):
+        return JobTable.from_rows([], header, const.SACCT_KEYS_TYPES)
+
+    return JobTable.concatenate(tables)
+
+
+def store_path(cluster, user):
+    """Path to the history directory for the given cluster and user.
+    """
+    return os.path.join(os.path.expanduser(const.HISTORY_DIR), "{}_{}".format(cluster, user))
@@ -0,0 +1,186 @@
+"""Expand and compress SLURM hostlists, e.g. 'holy2a[01-03,05],holy7c22' <=> list of node names.
+
+Node-lists repeat heavily between jobs, so expansions are memoized (`expand` keeps an LRU cache
+of `const.HOSTLIST_CACHE_SIZE` entries), and `node_codes` expands each distinct node-list of a
+column only once.
+
+Functions
+---------
+-   expand                - Expand a hostlist into a tuple of node names.
+-   compress              - Combine node names into a compact hostlist.
+-   node_codes            - Expand a column of hostlists into (row, node) index pairs.
+
+-   _expand_or_empty      - Expand a hostlist, giving no node names if it is invalid.
+-   _split                - Split a string at the commas which are not within brackets.
+-   _expand_term          - Expand a single term (e.g. 'holy[01-03]a[1-2]') of a hostlist.
+-   _split_name           - Split a node name into its prefix, number and number of digits.
+"""
+
+import re
+import functools
+import itertools
+import numpy as np
+
+from . import const
+
+_REGEX_NAME_PATTERN = re.compile(r'^(.*?)(\d+)$')
+
+
+@functools.lru_cache(maxsize=const.HOSTLIST_CACHE_SIZE)
+def expand(hostlist):
+    """Expand a hostlist into a tuple of node names, e.g. 'a[1-3],b' => ('a1', 'a2', 'a3', 'b').
+
+    Zero-padding of ranges is kept (e.g. 'a[08-10]' => ('a08', 'a09', 'a10')), and multiple
+    ranges in one name are combined (e.g. 'a[1-2]b[1-2]').  Values which are not hostlists
+    (e.g. '', 'None assigned') give an empty tuple.
+
+    Raises a `ValueError` for an invalid range.
+    """
+    hostlist = hostlist.strip()
+    if not len(hostlist) or ' ' in hostlist:
+        return ()
+
+    names = []
+    for term in _split(hostlist):
+        names.extend(_expand_term(term))
+    return tuple(names)
+
+
+def compress(names):
+    """Combine node names into a compact, sorted hostlist, e.g. ['a1', 'a2', 'a3', 'b'] => 'a[1-3],b'.
+
+    Names are grouped by their (non-numeric) prefix and the number of digits of their numeric
+    suffix, so that zero-padding is preserved.
+    """
+    groups = {}
+    plain = set()
+    for name in set(names):
+        prefix, num, width = _split_name(name)
+        if num is None:
+            plain.add(name)
+        else:
+            groups.setdefault((prefix, width), []).append(num)
+
+    terms = [(nn, nn) for nn in plain]
+    for (prefix, width), nums in groups.items():
+        nums = np.unique(nums)
+        # Start a new range wherever consecutive numbers are not adjacent
+        breaks = np.flatnonzero(np.diff(nums) != 1) + 1
+        ranges = []
+        for run in np.split(nums, breaks):
+            lo = "{:0{}d}".format(run[0], width)
+            hi = "{:0{}d}".format(run[-1], width)
+            ranges.append(lo if len(run) == 1 else "{}-{}".format(lo, hi))
+        if len(nums) == 1:
+            term = prefix + ranges[0]
+        else:
+            term = "{}[{}]".format(prefix, ",".join(ranges))
+        terms.append((prefix + "{:0{}d}".format(nums[0], width), term))
+
+    return ",".join(tt for kk, tt in sorted(terms))
+
+
+def node_codes(hostlists):
+    """Expand a column of hostlists into pairs of (row, node) indices.
+
+    Each distinct hostlist is only expanded once, and the pairs are then constructed with array
+    operations, so that the cost does not grow with the number of repeated node-lists.  Invalid
+    hostlists (e.g. truncated values) are left unexpanded, i.e. their rows have no pairs.
+
+    Arguments
+    ---------
+    hostlists : (N,) array_like of str
+
+    Returns
+    -------
+    nodes : (M,) np.ndarray of str
+        Sorted names of all nodes.
+    rows : (L,) np.ndarray of int
+        Index of the row (into `hostlists`) of each pair.
+    codes : (L,) np.ndarray of int
+        Index of the node (into `nodes`) of each pair.
+
+    """
+    uniq, inverse = np.unique(np.asarray(hostlists, dtype=str), return_inverse=True)
+    inverse = inverse.reshape(-1)
+    expanded = [_expand_or_empty(hh) for hh in uniq]
+    nodes = np.array(sorted(set(itertools.chain.from_iterable(expanded))), dtype=str)
+    lookup = {nn: ii for ii, nn in enumerate(nodes)}
+
+    # Node indices of each distinct hostlist, stored one after another
+    sizes = np.array([len(ee) for ee in expanded], dtype=np.int64)
+    flat = np.array([lookup[nn] for ee in expanded for nn in ee], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+
+    # Repeat each row once per node, and find the position of each node within its hostlist
+    counts = sizes[inverse]
+    rows = np.repeat(np.arange(len(inverse)), counts)
+    within = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    codes = flat[offsets[inverse][rows] + within]
+    return nodes, rows, codes
+
+
+def _expand_or_empty(hostlist):
+    """Expand a hostlist (see `expand`), giving an empty tuple instead of failing if it is invalid.
+    """
+    try:
+        return expand(hostlist)
+    except ValueError:
+        return ()
+
+
+def _split(text):
+    """Split a string at the commas which are not within brackets.
+    """
+    terms = []
+    depth = 0
+    last = 0
+    for ii, char in enumerate(text):
+        if char == '[':
+            depth += 1
+        elif char == ']':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            terms.append(text[last:ii])
+            last = ii + 1
+
+    terms.append(text[last:])
+    return [tt for tt in terms if len(tt)]
+
+
+def _expand_term(term):
+    """Expand a single term of a hostlist, which may include several bracketed ranges.
+    """
+    beg = term.find('[')
+    if beg < 0:
+        return [term]
+
+    end = term.index(']', beg)
+    prefix = term[:beg]
+    rests = _expand_term(term[end+1:])
+    names = []
+    for item in _split(term[beg+1:end]):
+        lo, _, hi = item.partition('-')
+        if not len(hi):
+            hi = lo
+        if not (lo.isdigit() and hi.isdigit()) or int(hi) < int(lo):
+            raise ValueError("Invalid range '{}' in hostlist term '{}'".format(item, term))
+        width = len(lo)
+        for num in range(int(lo), int(hi) + 1):
+            head = prefix + "{:0{}d}".format(num, width)
+            names.extend(head + rr for rr in rests)
+
+    return names
+
+
+def _split_name(name):
+    """Split a node name into its prefix, number and number of digits, e.g. 'a08' => ('a', 8, 2).
+
+    Names without a numeric suffix give `(name, None, 0)`.
+    """
+    match = _REGEX_NAME_PATTERN.match(name)
+    if match is None:
+        return name, None, 0
+
+    prefix, digits = match.groups()
+    return prefix, int(digits), len(digits)
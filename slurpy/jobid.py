@@ -0,0 +1,264 @@
+"""Parsed JobID values, and selection of jobs by JobID specifications (e.g. for `--id`).
+
+JobIDs reported by SLURM have the general form 'ID[_TASK][+HET][.STEP]', where 'TASK' is the
+index of a job-array task (or a bracketed range of tasks for pending arrays, e.g. '[1-50%5]'),
+'HET' is the component of a heterogeneous job, and 'STEP' is the job-step number or name.  These
+are stored as a structured array (`JOBID_DTYPE`) with integer fields, where missing components
+are `NONE` (-1), and named steps are stored as negative values (see `STEP_NAMES`).
+
+Classes
+-------
+-   JobIDIndex            - Sorted index over parsed JobIDs, to select rows matching a spec.
+
+Functions
+---------
+-   parse_jobids          - Parse JobID strings into a structured array (`JOBID_DTYPE`).
+-   render_jobids         - Convert parsed JobIDs back into strings.
+-   parse_spec            - Parse a JobID specification (e.g. '123,456 789_[1-50]') into terms.
+-   pushdown_spec         - Convert specification terms into a list of JobIDs for 'sacct'.
+
+-   _parse_tasks          - Parse a task specification (e.g. '[1-5,9%2]') into ranges.
+"""
+
+import re
+from collections import namedtuple
+import numpy as np
+
+# Value of missing components (i.e. no array task, heterogeneous component, or step)
+NONE = -1
+# Named job-steps, stored as negative step numbers
+STEP_NAMES = {'batch': -2, 'extern': -3, 'interactive': -4, 'TBD': -5}
+_STEP_CODES = {vv: kk for kk, vv in STEP_NAMES.items()}
+
+JOBID_DTYPE = np.dtype([('id', np.int64), ('task', np.int32), ('het', np.int32),
+                        ('step', np.int32), ('array', 'S32')])
+
+_REGEX_JOBID_PATTERN = re.compile(r'(\d+)(?:_(\d+|\[[^\]]*\]))?(?:\+(\d+))?(?:\.(\w+))?$')
+_REGEX_RANGE_PATTERN = re.compile(r'(\d+)\s*[:-]\s*(\d+)$')
+
+# A single term of a JobID specification.  `id_lo` and `id_hi` are inclusive, `tasks` is either
+#    `None` (all tasks) or a list of inclusive (lo, hi) ranges, and `step` is `None` (all steps)
+#    or a step number.
+SpecTerm = namedtuple('SpecTerm', ['id_lo', 'id_hi', 'tasks', 'step'])
+
+
+class JobIDIndex(object):
+    """Sorted index over parsed JobIDs, used to select the rows matching a specification.
+
+    Rows are sorted by (id, task) once, after which each specification term is found by binary
+    search, so that selecting a few IDs out of a large table does not scan every row per ID.
+    """
+
+    def __init__(self, jobids):
+        self.jobids = jobids
+        self.order = np.lexsort((jobids['task'], jobids['id']))
+        self._ids = jobids['id'][self.order]
+        self._tasks = jobids['task'][self.order]
+        return
+
+    def select(self, spec):
+        """Return a boolean mask selecting the rows which match the given specification.
+
+        Arguments
+        ---------
+        spec : str, list of str, or list of `SpecTerm`
+            See `parse_spec`.
+
+        Returns
+        -------
+        sel : (N,) array of bool
+
+        """
+        terms = parse_spec(spec) if not _is_terms(spec) else spec
+        num = len(self._ids)
+        ids = self._ids
+
+        # Terms including all tasks and steps of a range of IDs are selected all at once
+        simple = [tt for tt in terms if tt.tasks is None and tt.step is None]
+        lo = np.searchsorted(ids, [tt.id_lo for tt in simple], side='left')
+        hi = np.searchsorted(ids, [tt.id_hi for tt in simple], side='right')
+        # Mark the beginning and end of each selected range (in sorted order), and accumulate
+        counts = np.zeros(num + 1, dtype=np.int64)
+        np.add.at(counts, lo, 1)
+        np.add.at(counts, hi, -1)
+        sel_sorted = np.cumsum(counts[:-1]) > 0
+
+        # Remaining terms are refined within the rows matching their IDs
+        for tt in terms:
+            if tt.tasks is None and tt.step is None:
+                continue
+            lo = np.searchsorted(ids, tt.id_lo, side='left')
+            hi = np.searchsorted(ids, tt.id_hi, side='right')
+            sub = np.ones(hi - lo, dtype=bool)
+            if tt.tasks is not None:
+                tasks = self._tasks[lo:hi]
+                match = np.zeros(hi - lo, dtype=bool)
+                for tlo, thi in tt.tasks:
+                    match |= (tasks >= tlo) & (tasks <= thi)
+                sub &= match
+            if tt.step is not None:
+                sub &= (self.jobids['step'][self.order[lo:hi]] == tt.step)
+            sel_sorted[lo:hi] |= sub
+
+        sel = np.zeros(num, dtype=bool)
+        sel[self.order] = sel_sorted
+        return sel
+
+
+def parse_jobids(values):
+    """Parse JobID strings into a structured array (`JOBID_DTYPE`).
+
+    Values which cannot be parsed have an 'id' of `NONE`, and are stored in the 'array' field.
+    """
+    num = len(values)
+    ids = [NONE] * num
+    tasks = [NONE] * num
+    hets = [NONE] * num
+    steps = [NONE] * num
+    arrays = [b''] * num
+    for ii, vv in enumerate(values):
+        match = _REGEX_JOBID_PATTERN.match(vv)
+        if match is None:
+            arrays[ii] = vv.encode()
+            continue
+
+        jid, task, het, step = match.groups()
+        ids[ii] = int(jid)
+        if task is not None:
+            if task.startswith('['):
+                arrays[ii] = task.encode()
+            else:
+                tasks[ii] = int(task)
+        if het is not None:
+            hets[ii] = int(het)
+        if step is not None:
+            steps[ii] = int(step) if step.isdigit() else STEP_NAMES.get(step, STEP_NAMES['TBD'])
+
+    jobids = np.zeros(num, dtype=JOBID_DTYPE)
+    jobids['id'] = ids
+    jobids['task'] = tasks
+    jobids['het'] = hets
+    jobids['step'] = steps
+    jobids['array'] = arrays
+    return jobids
+
+
+def render_jobids(jobids):
+    """Convert parsed JobIDs (`JOBID_DTYPE`) back into strings, e.g. '1234_5.batch'.
+    """
+    strings = []
+    for jid, task, het, step, array in jobids.tolist():
+        if jid == NONE:
+            strings.append(array.decode())
+            continue
+
+        ss = str(jid)
+        if task != NONE:
+            ss += "_{}".format(task)
+        elif len(array):
+            ss += "_" + array.decode()
+        if het != NONE:
+            ss += "+{}".format(het)
+        if step != NONE:
+            ss += "." + (str(step) if step >= 0 else _STEP_CODES[step])
+        strings.append(ss)
+
+    return np.array(strings, dtype=str)
+
+
+def parse_spec(spec):
+    """Parse a JobID specification into a list of `SpecTerm`.
+
+    The specification is made up of any combination (comma or space separated) of:
+    -   ID numbers, e.g. '84513996'
+    -   Intervals of ID numbers, e.g. '84513996:84514000' or '84513996-84514000'
+    -   Job-array tasks, e.g. '84513996_4' or '84513996_[1-50,60]'
+    -   Job-steps, e.g. '84513996.0' or '84513996_4.batch'
+
+    Arguments
+    ---------
+    spec : str or list of str
+
+    Returns
+    -------
+    terms : list of `SpecTerm`
+
+    """
+    if not isinstance(spec, str):
+        spec = " ".join(spec)
+
+    # Remove spaces around range separators, e.g. `84513996 : 84514000`
+    spec = re.sub(r'\s*:\s*', ':', spec)
+    # Split on commas and spaces, except within brackets
+    tokens = re.findall(r'(?:[^\s,\[]|\[[^\]]*\])+', spec)
+
+    terms = []
+    for tok in tokens:
+        match = _REGEX_RANGE_PATTERN.match(tok)
+        if match is not None:
+            lo, hi = int(match.group(1)), int(match.group(2))
+            terms.append(SpecTerm(lo, hi, None, None))
+            continue
+
+        match = _REGEX_JOBID_PATTERN.match(tok)
+        if match is None:
+            raise ValueError("Could not parse JobID specification '{}'".format(tok))
+
+        jid, task, het, step = match.groups()
+        jid = int(jid)
+        tasks = None if task is None else _parse_tasks(task)
+        if step is not None:
+            step = int(step) if step.isdigit() else STEP_NAMES.get(step, STEP_NAMES['TBD'])
+        terms.append(SpecTerm(jid, jid, tasks, step))
+
+    return terms
+
+
+def pushdown_spec(terms, max_ids):
+    """Convert specification terms into a list of JobIDs which can be passed to 'sacct --jobs'.
+
+    Ranges of IDs or tasks are expanded when there are at most `max_ids` values in total,
+    otherwise `None` is returned.
+
+    Returns
+    -------
+    jobs : list of str or None
+        JobIDs for 'sacct', or `None` if the specification cannot be expressed.
+
+    """
+    jobs = []
+    for tt in terms:
+        if tt.tasks is None:
+            if tt.id_hi - tt.id_lo + 1 > max_ids:
+                return None
+            ids = [str(ii) for ii in range(tt.id_lo, tt.id_hi + 1)]
+        else:
+            if sum(hi - lo + 1 for lo, hi in tt.tasks) > max_ids:
+                return None
+            ids = ["{}_{}".format(tt.id_lo, kk) for lo, hi in tt.tasks for kk in range(lo, hi + 1)]
+
+        if tt.step is not None:
+            step = str(tt.step) if tt.step >= 0 else _STEP_CODES[tt.step]
+            ids = [ii + "." + step for ii in ids]
+
+        jobs.extend(ids)
+        if len(jobs) > max_ids:
+            return None
+
+    return jobs
+
+
+def _parse_tasks(task):
+    """Parse a task specification (e.g. '4' or '[1-5,9%2]') into a list of inclusive ranges.
+    """
+    # Remove brackets and any limit on the number of simultaneous tasks (e.g. '%2')
+    task = task.strip('[]').split('%')[0]
+    ranges = []
+    for part in task.split(','):
+        lo, _, hi = part.partition('-')
+        ranges.append((int(lo), int(hi) if hi else int(lo)))
+    return ranges
+
+
+def _is_terms(spec):
+    return isinstance(spec, list) and len(spec) and isinstance(spec[0], SpecTerm)
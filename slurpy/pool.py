@@ -0,0 +1,107 @@
+"""Reusable pool of worker threads for running SLURM commands (e.g. 'sacct' queries) concurrently.
+
+Threads are created once and reused by every call (e.g. each refresh in 'watch' mode, or each
+cluster and time-shard of a query), like a pool of connections.  Each call limits its own number
+of concurrent tasks, and returns its results in order.
+
+NOTE: `WorkerPool.map` must not be called from within one of the pool's own tasks (which could
+      wait forever on tasks that cannot start).
+
+Classes
+-------
+-   WorkerPool            - Pool of threads, reused between calls, with bounded concurrency.
+
+Functions
+---------
+-   get_pool              - Return the shared `WorkerPool`, created on first use.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import const
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+class WorkerPool(object):
+    """Pool of `workers` threads, reused between calls to `map`.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='slurpy')
+        return
+
+    def map(self, func, items, limit=None):
+        """Apply `func` to each of `items`, with at most `limit` calls running at a time.
+
+        Calls are started as earlier ones finish.  If any call raises an exception, no more are
+        started, and the first exception is raised once the running calls have finished.
+
+        Arguments
+        ---------
+        func : callable
+        items : iterable
+        limit : int or None
+            Maximum number of concurrent calls (default: all of the pool's workers).
+
+        Returns
+        -------
+        results : list
+            Result of each call, in the order of `items`.
+
+        """
+        items = list(items)
+        limit = self.workers if limit is None else max(min(limit, self.workers), 1)
+        results = [None] * len(items)
+        pending = {}
+        error = None
+        queue = iter(enumerate(items))
+        while True:
+            # Start calls until the limit is reached (unless a call has failed)
+            while error is None and len(pending) < limit:
+                nxt = next(queue, None)
+                if nxt is None:
+                    break
+                pending[self._executor.submit(func, nxt[1])] = nxt[0]
+
+            if not len(pending):
+                break
+
+            done, _ = wait(list(pending.keys()), return_when=FIRST_COMPLETED)
+            for fut in done:
+                idx = pending.pop(fut)
+                if fut.exception() is not None:
+                    error = fut.exception() if error is None else error
+                else:
+                    results[idx] = fut.result()
+
+        if error is not None:
+            raise error
+
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        return
+
+
+def get_pool(workers=None):
+    """Return the shared `WorkerPool`, created on first use.
+
+    The pool has `const.POOL_WORKERS` threads, or `workers` if that is larger (in which case a
+    larger pool replaces the existing one).
+    """
+    global _POOL
+    workers = const.POOL_WORKERS if workers is None else max(workers, const.POOL_WORKERS)
+    with _POOL_LOCK:
+        if _POOL is None or _POOL.workers < workers:
+            old = _POOL
+            _POOL = WorkerPool(workers)
+            if old is not None:
+                # Calls already running on the old pool are allowed to finish
+                old._executor.shutdown(wait=False)
+
+    return _POOL
@@ -0,0 +1,214 @@
+"""Record the time, number of rows, bytes read and memory used by each stage of a query.
+
+Stages of the pipeline (e.g. 'read', 'convert', 'filter', 'sort', 'format', 'write') are
+marked with `stage`, which does nothing unless a `Profiler` is active.  Repeated stages (e.g.
+each chunk of rows that is read) are combined.  For example,
+
+    >>> from slurpy import profiling, query
+    >>> with profiling.Profiler() as prof:
+    ...     table = query.SacctQuery(start='2017-03-01').run()
+    >>> print(prof.report())
+
+Stages run concurrently (e.g. sharded 'sacct' queries) are summed, so their total time can be
+longer than the wall time.  Peak memory is only measured when `memory=True` (using
+`tracemalloc`, which makes everything significantly slower), as the peak above the memory
+allocated at the start of each stage.
+
+Classes
+-------
+-   Profiler              - Collect the statistics of each stage while active.
+
+Functions
+---------
+-   stage                 - Context manager marking a stage of the pipeline.
+-   add                   - Add counts (e.g. bytes read) to a stage, without timing it.
+-   enabled               - Whether a `Profiler` is currently active.
+
+-   _Stage                - Combined statistics of one stage.
+-   _Entry                - Counts set by the code within a single call to `stage`.
+"""
+
+import json
+import time
+import threading
+import contextlib
+from collections import OrderedDict
+
+_PROFILER = None
+
+
+class Profiler(object):
+    """Collect the statistics of each stage of the pipeline while active (used as a context).
+
+    Arguments
+    ---------
+    memory : bool
+        Measure the peak memory allocated in each stage (using `tracemalloc`).
+    callback : callable or None
+        Called with the name and `_Entry` of each stage as it finishes.
+
+    """
+
+    def __init__(self, memory=False, callback=None):
+        self.memory = memory
+        self.callback = callback
+        self.stages = OrderedDict()
+        self.seconds = None
+        self._lock = threading.Lock()
+        self._beg = None
+        self._previous = None
+        return
+
+    def __enter__(self):
+        global _PROFILER
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start()
+        self._previous = _PROFILER
+        _PROFILER = self
+        self._beg = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        global _PROFILER
+        self.seconds = time.perf_counter() - self._beg
+        _PROFILER = self._previous
+        if self.memory:
+            import tracemalloc
+            tracemalloc.stop()
+        return False
+
+    def add(self, name, entry, seconds=0.0, peak=None):
+        """Combine the statistics of a single call of a stage with those of any earlier calls.
+        """
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = _Stage(name)
+            self.stages[name].add(entry, seconds, peak)
+
+        if self.callback is not None:
+            self.callback(name, entry)
+        return
+
+    def to_dict(self):
+        """Return the statistics of all stages (and the total time) as a `dict`.
+        """
+        return OrderedDict([('seconds', self.seconds),
+                            ('stages', [ss.to_dict() for ss in self.stages.values()])])
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+    def report(self):
+        """Return a compact table (str) of the statistics of each stage.
+        """
+        def _num(val):
+            return "-" if val is None else "{:d}".format(val)
+
+        def _mb(val):
+            return "-" if val is None else "{:.1f}".format(val / 2**20)
+
+        lines = ["{:>10s}  {:>6s}  {:>9s}  {:>9s}  {:>9s}  {:>10s}  {:>9s}".format(
+            "stage", "calls", "time [s]", "rows in", "rows out", "bytes [MB]", "peak [MB]")]
+        for ss in self.stages.values():
+            lines.append("{:>10s}  {:6d}  {:9.3f}  {:>9s}  {:>9s}  {:>10s}  {:>9s}".format(
+                ss.name, ss.calls, ss.seconds, _num(ss.rows_in), _num(ss.rows_out),
+                _mb(ss.bytes), _mb(ss.peak)))
+
+        if self.seconds is not None:
+            lines.append("{:>10s}  {:6s}  {:9.3f}".format("total", "", self.seconds))
+        return "\n".join(lines)
+
+
+class _Stage(object):
+    """Combined statistics of all calls to one stage.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.bytes = None
+        self.peak = None
+        return
+
+    def add(self, entry, seconds, peak):
+        if seconds:
+            self.calls += 1
+            self.seconds += seconds
+        for kk in ['rows_in', 'rows_out', 'bytes']:
+            val = getattr(entry, kk)
+            if val is not None:
+                setattr(self, kk, (getattr(self, kk) or 0) + val)
+        if peak is not None:
+            self.peak = max(self.peak or 0, peak)
+        return
+
+    def to_dict(self):
+        return OrderedDict((kk, getattr(self, kk)) for kk in
+                           ['name', 'calls', 'seconds', 'rows_in', 'rows_out', 'bytes', 'peak'])
+
+
+class _Entry(object):
+    """Counts which can be set by the code within a single call to `stage`.
+    """
+
+    def __init__(self, rows_in=None, rows_out=None, bytes=None):
+        self.rows_in = rows_in
+        self.rows_out = rows_out
+        self.bytes = bytes
+        return
+
+
+@contextlib.contextmanager
+def stage(name, rows_in=None):
+    """Context manager marking a stage of the pipeline, yielding an `_Entry` for its counts.
+
+    e.g.
+        >>> with profiling.stage('filter', rows_in=len(table)) as entry:
+        ...     table = _filter_lines(table, args)
+        ...     entry.rows_out = len(table)
+
+    """
+    prof = _PROFILER
+    entry = _Entry(rows_in=rows_in)
+    if prof is None:
+        yield entry
+        return
+
+    if prof.memory:
+        import tracemalloc
+        start = tracemalloc.get_traced_memory()[0]
+        # NOTE: `reset_peak` requires python >= 3.9, otherwise the peak since the start of
+        #       profiling is used
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+    beg = time.perf_counter()
+    try:
+        yield entry
+    finally:
+        seconds = time.perf_counter() - beg
+        peak = None
+        if prof.memory:
+            peak = max(tracemalloc.get_traced_memory()[1] - start, 0)
+        prof.add(name, entry, seconds=seconds, peak=peak)
+
+    return
+
+
+def add(name, rows_in=None, rows_out=None, bytes=None):
+    """Add counts (e.g. bytes read) to a stage, without timing it.
+    """
+    prof = _PROFILER
+    if prof is not None:
+        prof.add(name, _Entry(rows_in=rows_in, rows_out=rows_out, bytes=bytes))
+    return
+
+
+def enabled():
+    """Whether a `Profiler` is currently active.
+    """
+    return _PROFILER is not None
@@ -0,0 +1,311 @@
+"""Library interface for 'sacct' and 'squeue' queries, with blocking and `asyncio` variants.
+
+Queries are described by explicit parameters instead of an `argparse.Namespace`, e.g.
+
+    >>> from slurpy.query import SacctQuery
+    >>> table = SacctQuery(start='2017-03-01', state='RUNNING', partition='itc').run()
+
+or, from within an event loop (e.g. to run many queries concurrently),
+
+    >>> table = await SacctQuery(start='2017-03-01').run_async(timeout=30.0)
+
+Both return a `slurpy.table.JobTable`.  The `asyncio` variants run commands with
+`asyncio.create_subprocess_exec`, parse output as it arrives, and always kill and wait on their
+child processes when they fail, time out, or are cancelled.  Failed commands raise
+`subprocess.CalledProcessError`, and timeouts raise `asyncio.TimeoutError`.
+
+Classes
+-------
+-   SacctQuery            - Query of job accounting information from 'sacct'.
+-   SqueueQuery           - Query of queued jobs from 'squeue'.
+
+Functions
+---------
+-   read_command_async    - Run a command asynchronously and parse its output into a `JobTable`.
+
+-   _gather               - Run coroutines concurrently, cancelling the rest if any fail.
+"""
+
+import argparse
+import asyncio
+import functools
+import subprocess
+from collections import OrderedDict
+
+from . import const
+from . import runner
+
+# Values of all 'command-line' arguments used by the 'sacct' and 'squeue' modules
+_ARG_DEFAULTS = OrderedDict([
+    ('start', None), ('end', None), ('state', None), ('partition', None), ('name', None),
+    ('exact', False), ('jobid', None), ('steps', False), ('sort', None),
+    ('head', None), ('tail', None), ('verbose', False), ('stream', False), ('group_by', None),
+    ('output', None), ('output_file', None), ('cache', False), ('clear_cache', False),
+    ('shard_days', const.SACCT_SHARD_DAYS), ('workers', None), ('merge', False),
+    ('history', False), ('clusters', None), ('users', None), ('all_users', False),
+    ('timeout', None), ('server', False), ('socket', None),
+])
+
+
+class _Query(object):
+    """Base class for queries, which are converted into the arguments used by the CLI.
+    """
+
+    def args(self):
+        """Return the `argparse.Namespace` equivalent to this query's parameters.
+        """
+        values = OrderedDict(_ARG_DEFAULTS)
+        values.update(self.__dict__)
+        return argparse.Namespace(**values)
+
+    def run(self):
+        raise NotImplementedError()
+
+    async def run_async(self, timeout=None):
+        """Run this query within an event loop, see `run`.
+
+        Arguments
+        ---------
+        timeout : float or None
+            Maximum time [s] for the entire query, after which all of its commands are killed
+            and `asyncio.TimeoutError` is raised.
+
+        """
+        return await asyncio.wait_for(self._run_async(), timeout)
+
+    async def _run_async(self):
+        raise NotImplementedError()
+
+    def __repr__(self):
+        params = ", ".join("{}={!r}".format(kk, vv) for kk, vv in self.__dict__.items()
+                           if vv != _ARG_DEFAULTS.get(kk))
+        return "{}({})".format(self.__class__.__name__, params)
+
+
+class SacctQuery(_Query):
+    """Query of job accounting information from 'sacct'.
+
+    Arguments
+    ---------
+    start, end : str or None
+        Time window of the query, in the format 'YYYY-MM-DD[THH:MM[:SS]]'.  Default start is
+        determined by 'sacct' (midnight of the current day).
+    state, partition, name : str or None
+        Select only jobs with the given 'State', 'Partition' or 'JobName' (a substring, unless
+        `exact`).
+    jobid : str, list of str, or None
+        JobID specification, see `jobid.parse_spec`.
+    steps : bool
+        Include job-steps, not only job allocations.
+    sort : str or None
+        Comma-separated fields to sort by, each prefixed with '-' to reverse-sort (e.g.
+        'State,-Elapsed').
+    shard_days : float or None
+        Split long windows into concurrent queries of this many days each (0 for a single query).
+    workers : int or None
+        Maximum number of concurrent 'sacct' processes (default: `const.SACCT_SHARD_WORKERS`).
+    cache : bool
+        Use (and update) the local cache of finished jobs, see `slurpy.cache`.  Only used by the
+        blocking variant (`run`).
+    clusters : str or None
+        Comma-separated clusters to query concurrently (default: the current cluster).
+    users : str or None
+        Comma-separated users whose jobs are queried (default: the current user).
+    all_users : bool
+        Query the jobs of all users.
+    timeout : float or None
+        Maximum time [s] for each 'sacct' command (of each cluster and shard).  Commands which
+        time out raise `subprocess.TimeoutExpired` (or `asyncio.TimeoutError` in `run_async`).
+
+    """
+
+    def __init__(self, start=None, end=None, state=None, partition=None, name=None, exact=False,
+                 jobid=None, steps=False, sort=None, shard_days=const.SACCT_SHARD_DAYS,
+                 workers=None, cache=False, clusters=None, users=None, all_users=False,
+                 timeout=None):
+        self.start = start
+        self.end = end
+        self.state = state
+        self.partition = partition
+        self.name = name
+        self.exact = exact
+        self.jobid = jobid
+        self.steps = steps
+        self.sort = sort
+        self.shard_days = shard_days
+        self.workers = workers
+        self.cache = cache
+        self.clusters = clusters
+        self.users = users
+        self.all_users = all_users
+        self.timeout = timeout
+        return
+
+    def run(self):
+        """Run this query, blocking until all results are parsed.
+
+        Returns
+        -------
+        table : `slurpy.table.JobTable`
+
+        """
+        from . import sacct
+        return sacct.sacct_results(self.args(), check=True)
+
+    async def _run_async(self):
+        from . import sacct
+        args = self.args()
+        header = list(const.SACCT_KEYS)
+        shards = sacct._shard_window(args.start, args.end, args.shard_days)
+        commands = [sacct._construct_sacct_command(args, start=ss, end=ee, cluster=cc)
+                    for cc in sacct._target_clusters(args) for ss, ee in shards]
+
+        workers = args.workers if args.workers is not None else const.SACCT_SHARD_WORKERS
+        limit = asyncio.Semaphore(max(workers, 1))
+        parse = functools.partial(sacct._parse_sacct_line, header=header)
+
+        async def read(command):
+            async with limit:
+                return await asyncio.wait_for(read_command_async(command, header, parse),
+                                              args.timeout)
+
+        tables = await _gather([read(cc) for cc in commands])
+        table = tables[0] if len(tables) == 1 else sacct._merge_shards(tables)
+        table = sacct._filter_lines(table, args)
+        return sacct._sort_lines(table, args)
+
+
+class SqueueQuery(_Query):
+    """Query of the current user's queued (pending and running) jobs from 'squeue'.
+
+    Arguments
+    ---------
+    state, partition, name : str or None
+        Select only jobs with the given 'State', 'Partition' or 'JobName' (a substring, unless
+        `exact`).
+    jobid : str, list of str, or None
+        JobID specification, see `jobid.parse_spec`.
+    sort : str or None
+        Comma-separated fields to sort by, each prefixed with '-' to reverse-sort (e.g.
+        'State,-Elapsed').
+
+    """
+
+    def __init__(self, state=None, partition=None, name=None, exact=False, jobid=None,
+                 sort=None):
+        self.state = state
+        self.partition = partition
+        self.name = name
+        self.exact = exact
+        self.jobid = jobid
+        self.sort = sort
+        return
+
+    def run(self):
+        """Run this query, blocking until all results are parsed.
+
+        Returns
+        -------
+        table : `slurpy.table.JobTable`
+
+        """
+        from . import squeue
+        return squeue.squeue_results(self.args(), check=True)
+
+    async def _run_async(self):
+        from . import squeue
+        args = self.args()
+        header = list(const.SQUEUE_KEYS)
+        command = squeue._construct_squeue_command(args)
+        parse = functools.partial(squeue._parse_squeue_line, header=header)
+        table = await read_command_async(command, header, parse, types=const.SQUEUE_KEYS_TYPES)
+        return squeue._select_lines(table, args)
+
+
+async def read_command_async(command, header, parse_line, types=None):
+    """Run a command asynchronously and parse each line of its output into a `JobTable`.
+
+    The command is started by the current runner (see `slurpy.runner`), by default with
+    `asyncio.create_subprocess_exec`.
+
+    Lines are parsed as they arrive, and converted into typed columns in chunks of
+    `const.PARSE_CHUNK_SIZE` rows.  If this coroutine is cancelled (e.g. by a timeout), the
+    process is killed; it is always waited on before returning.
+
+    Arguments
+    ---------
+    command : list of str
+    header : list of str
+        Names of the fields of each row.
+    parse_line : callable
+        Function converting a line of output into a list of strings for each field.
+    types : dict or None
+        Type of each field, see `JobTable.from_rows`.
+
+    Returns
+    -------
+    table : `slurpy.table.JobTable`
+
+    """
+    from .table import JobTable
+    size = const.PARSE_CHUNK_SIZE
+
+    proc = await runner.get_runner().popen_async(command)
+    # Read 'stderr' concurrently, so that the process cannot block on a full pipe
+    errors = asyncio.ensure_future(proc.stderr.read())
+
+    chunks = []
+    rows = []
+    finished = False
+    try:
+        async for line in proc.stdout:
+            line = line.decode(errors='replace').rstrip('\n')
+            # skip blank lines
+            if not len(line):
+                continue
+            rows.append(parse_line(line))
+            if len(rows) >= size:
+                chunks.append(JobTable.from_rows(rows, header, types=types))
+                rows = []
+        finished = True
+    finally:
+        # Kill the process if reading was interrupted (e.g. cancelled), and always reap it
+        if not finished and proc.returncode is None:
+            try:
+                proc.kill()
+            except ProcessLookupError:
+                pass
+        err = await errors
+        retcode = await proc.wait()
+
+    if retcode:
+        raise subprocess.CalledProcessError(retcode, command,
+                                            stderr=err.decode(errors='replace'))
+
+    if len(rows) or not len(chunks):
+        chunks.append(JobTable.from_rows(rows, header, types=types))
+
+    return JobTable.concatenate(chunks)
+
+
+async def _gather(coros):
+    """Run coroutines concurrently and return their results, cancelling the rest if any fail.
+
+    Unlike `asyncio.gather`, each remaining task is cancelled only once (including when this
+    coroutine is itself cancelled), and is always waited on, so that it can reap its process.
+    """
+    tasks = [asyncio.ensure_future(cc) for cc in coros]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        pending = [tt for tt in tasks if not tt.done()]
+        for tt in pending:
+            tt.cancel()
+        if len(pending):
+            await asyncio.wait(pending)
+
+    for tt in tasks:
+        if not tt.cancelled() and tt.exception() is not None:
+            raise tt.exception()
+
+    return [tt.result() for tt in tasks]
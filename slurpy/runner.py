@@ -0,0 +1,436 @@
+"""Backends for running SLURM commands ('sacct', 'squeue', 'scancel').
+
+All SLURM commands are started through the current runner (see `get_runner` and `set_runner`),
+which by default runs them as subprocesses (`SubprocessRunner`).  Stand-in backends allow the
+parsing, filtering and formatting code to be used (e.g. tested or benchmarked) without a cluster:
+
+-   `ReplayRunner`    : replays outputs recorded from a cluster (see `record`).
+-   `SyntheticRunner` : generates any number of random (but reproducible) jobs.
+
+For example,
+
+    >>> from slurpy import runner, query
+    >>> with runner.using(runner.SyntheticRunner(100000)):
+    ...     table = query.SacctQuery(shard_days=0).run()
+
+Stand-in backends do not apply filtering flags (e.g. '--state', or the query window), which is
+indicated by `Runner.applies_filters`.  While one is used, no filters are pushed down into the
+commands (see `sacct._plan_sacct_query` and `squeue._plan_squeue_query`), and all of them are
+applied to the results in python instead.  The query window is not applied at all.
+
+Classes
+-------
+-   Runner                - Base class: start commands and return process-like objects.
+-   SubprocessRunner      - Run commands as subprocesses (default).
+-   ReplayRunner          - Replay recorded command outputs.
+-   SyntheticRunner       - Generate synthetic command outputs.
+
+-   _FakeProcess          - Process-like object returning generated output.
+-   _AsyncProcess         - Wrap a process-like object in the interface of `asyncio` processes.
+
+Functions
+---------
+-   get_runner            - Return the runner currently used for SLURM commands.
+-   set_runner            - Set the runner used for SLURM commands.
+-   using                 - Context manager to temporarily use a runner.
+-   record                - Run a command and save its output for `ReplayRunner`.
+
+-   _requested_fields     - Determine the output fields and delimiter requested by a command.
+-   _format_duration      - Format a number of seconds as '[D-]HH:MM:SS'.
+"""
+
+import os
+import io
+import random
+import datetime
+import contextlib
+import subprocess
+
+from . import const
+
+
+class Runner(object):
+    """Base class for running commands, returning objects with the interface of `subprocess.Popen`.
+
+    Process objects must provide `stdout` (an iterable of lines of text, with `close()`),
+    `stderr` (with `read()` and `close()`), `poll()`, `wait()`, `kill()`, `communicate()` and
+    `returncode`.
+
+    `applies_filters` is False for backends which do not apply the filtering flags of commands
+    (e.g. '--state'), in which case all filters are applied to their results in python.
+    """
+
+    applies_filters = True
+
+    def popen(self, command):
+        """Start the given command (list of strings), and return a process-like object.
+        """
+        raise NotImplementedError()
+
+    async def popen_async(self, command):
+        """Start the given command, and return an object like `asyncio.subprocess.Process`.
+
+        By default the output of `popen` is wrapped, which is appropriate for backends which do
+        not need to wait on anything.
+        """
+        return _AsyncProcess(self.popen(command))
+
+    def communicate(self, command):
+        """Run the given command until it finishes.
+
+        Returns
+        -------
+        returncode : int
+        out : str
+        err : str
+
+        """
+        p = self.popen(command)
+        out, err = p.communicate()
+        return p.returncode, out, err
+
+
+class SubprocessRunner(Runner):
+    """Run commands as subprocesses (with text output).
+    """
+
+    def popen(self, command):
+        return subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, errors='replace')
+
+    async def popen_async(self, command):
+        import asyncio
+        return await asyncio.create_subprocess_exec(
+            *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+
+
+class ReplayRunner(Runner):
+    """Replay recorded command outputs, see `record`.
+
+    Recorded outputs are stored in `path` as one file per command (e.g. 'sacct.txt'), where the
+    first line lists the recorded fields (e.g. 'JobID|JobName|State' for 'sacct', or '%i|%j|%T'
+    for 'squeue').  The recorded fields are rearranged to match those requested by each command;
+    fields which were not recorded are empty.  Commands without a recording produce no output.
+    """
+
+    applies_filters = False
+
+    def __init__(self, path):
+        self.path = path
+        return
+
+    def popen(self, command):
+        name = os.path.basename(command[0])
+        fname = os.path.join(self.path, name + '.txt')
+        if not os.path.exists(fname):
+            return _FakeProcess(iter([]))
+
+        fields, delim = _requested_fields(command)
+        return _FakeProcess(self._lines(fname, fields, delim))
+
+    def _lines(self, fname, fields, delim):
+        with open(fname, 'r') as infile:
+            recorded = infile.readline().rstrip('\n').split(const.SACCT_DELIMITER)
+            if fields is None:
+                for line in infile:
+                    yield line
+                return
+
+            idx = [recorded.index(ff) if ff in recorded else None for ff in fields]
+            # Job-names may contain the delimiter, in which case the extra pieces are joined
+            names = [ii for ii, ff in enumerate(recorded) if ff in ['JobName', '%j']]
+            for line in infile:
+                vals = line.rstrip('\n').split(const.SACCT_DELIMITER)
+                extra = len(vals) - len(recorded)
+                if extra > 0 and len(names):
+                    jj = names[0]
+                    vals[jj:jj+extra+1] = [const.SACCT_DELIMITER.join(vals[jj:jj+extra+1])]
+                elif extra != 0:
+                    continue
+                yield delim.join('' if ii is None else vals[ii] for ii in idx) + '\n'
+
+        return
+
+
+class SyntheticRunner(Runner):
+    """Generate synthetic outputs for 'sacct' and 'squeue', with `num` jobs each.
+
+    Jobs are generated with a fixed random `seed`, so results are reproducible.  About 10% of jobs
+    are job-array tasks, and (for 'sacct' with '--steps') each job has 'batch', 'extern' and one
+    numbered job-step.  Other commands (e.g. 'scancel') succeed without any output.
+    """
+
+    applies_filters = False
+
+    _STATES = ['COMPLETED', 'COMPLETED', 'COMPLETED', 'FAILED', 'RUNNING', 'PENDING',
+               'CANCELLED by 1234', 'TIMEOUT', 'OUT_OF_MEMORY']
+    _PARTITIONS = ['hernquist', 'itccluster', 'general', 'shared']
+
+    def __init__(self, num, seed=1234):
+        self.num = num
+        self.seed = seed
+        return
+
+    def popen(self, command):
+        name = os.path.basename(command[0])
+        fields, delim = _requested_fields(command)
+        if fields is None:
+            return _FakeProcess(iter([]))
+
+        steps = (name == 'sacct') and ('--allocations' not in command)
+        if name == 'squeue':
+            inverse = {vv: kk for kk, vv in const.SQUEUE_KEYS_CODES.items()}
+            fields = [inverse.get(ff, ff) for ff in fields]
+
+        return _FakeProcess(self._lines(fields, delim, steps))
+
+    def _lines(self, fields, delim, steps):
+        rand = random.Random(self.seed)
+        base = datetime.datetime(2017, 1, 1)
+        fmt = "%Y-%m-%dT%H:%M:%S"
+        for ii in range(self.num):
+            jid = str(10000000 + ii)
+            if ii % 10 == 9:
+                jid = "{}_{}".format(10000000 + ii - ii % 100, ii % 100)
+            state = rand.choice(self._STATES)
+            submit = base + datetime.timedelta(seconds=60*ii + rand.randint(0, 59))
+            elapsed = rand.randint(0, 3*24*3600)
+            start = submit + datetime.timedelta(seconds=rand.randint(0, 3600))
+            vals = {
+                'JobID': jid,
+                'JobName': "job_{}".format(rand.randint(0, 50)),
+                'State': state,
+                'Submit': submit.strftime(fmt),
+                'Start': 'Unknown' if state == 'PENDING' else start.strftime(fmt),
+                'End': ('Unknown' if state in ['PENDING', 'RUNNING'] else
+                        (start + datetime.timedelta(seconds=elapsed)).strftime(fmt)),
+                'Elapsed': _format_duration(0 if state == 'PENDING' else elapsed),
+                'TimeLeft': _format_duration(rand.randint(0, 24*3600)),
+                'TimeLimit': _format_duration(3*24*3600),
+                'ReqMem': "{}{}".format(rand.choice([1000, 2000, 4000, 16000]),
+                                        rand.choice(['Mn', 'Mc'])),
+                'Partition': rand.choice(self._PARTITIONS),
+                'NodeList': ('None assigned' if state == 'PENDING' else
+                             "holy2a{:02d}[{:03d}-{:03d}]".format(rand.randint(1, 20), 1,
+                                                                   rand.randint(1, 8))),
+                'NumNodes': str(rand.randint(1, 8)),
+                'NumCPUs': str(rand.randint(1, 64)),
+                'AllocCPUS': str(rand.randint(1, 64)),
+                'User': "user{}".format(rand.randint(0, 9)),
+                'Reason': 'Priority' if state == 'PENDING' else 'None',
+            }
+            ncpus = int(vals['AllocCPUS'])
+            nodes = rand.randint(1, 4)
+            mem = int(vals['ReqMem'][:-2]) * (ncpus if vals['ReqMem'].endswith('c') else nodes)
+            vals.update({
+                'AllocNodes': str(nodes),
+                'ReqTRES': "billing={0},cpu={0},mem={1}M,node={2}".format(ncpus, mem, nodes),
+                'CPUTimeRAW': str(0 if state == 'PENDING' else elapsed * ncpus),
+                'TotalCPU': _format_duration(int(rand.random() * elapsed * ncpus)),
+            })
+            yield delim.join(vals.get(ff, '') for ff in fields) + '\n'
+
+            if steps:
+                for step in ['batch', 'extern', '0']:
+                    vals['JobID'] = jid + '.' + step
+                    vals['JobName'] = step
+                    vals['AveVMSize'] = "{}K".format(rand.randint(1000, 10000000))
+                    vals['MaxVMSize'] = "{}K".format(rand.randint(1000, 10000000))
+                    vals['AveDiskRead'] = "{:.2f}M".format(rand.random()*1000)
+                    vals['AveDiskWrite'] = "{:.2f}M".format(rand.random()*1000)
+                    vals['MaxRSS'] = "{}K".format(rand.randint(1000, 10000000))
+                    yield delim.join(vals.get(ff, '') for ff in fields) + '\n'
+
+        return
+
+
+_RUNNER = SubprocessRunner()
+
+
+def get_runner():
+    """Return the runner currently used for SLURM commands.
+    """
+    return _RUNNER
+
+
+def set_runner(runner):
+    """Set the runner used for SLURM commands (`None` for the default `SubprocessRunner`).
+
+    Returns
+    -------
+    previous : `Runner`
+
+    """
+    global _RUNNER
+    previous = _RUNNER
+    _RUNNER = SubprocessRunner() if runner is None else runner
+    return previous
+
+
+@contextlib.contextmanager
+def using(runner):
+    """Context manager to temporarily use the given runner for SLURM commands.
+    """
+    previous = set_runner(runner)
+    try:
+        yield runner
+    finally:
+        set_runner(previous)
+
+
+def record(command, path, runner=None):
+    """Run the given command, and save its output for `ReplayRunner`.
+
+    Arguments
+    ---------
+    command : list of str
+        e.g. from `sacct._construct_sacct_command` or `squeue._construct_squeue_command`.
+    path : str
+        Directory to save the output in (as '<command>.txt').
+    runner : `Runner` or None
+        Runner used for the command, by default `SubprocessRunner` (e.g. `SyntheticRunner`
+        can be used to create large recordings).
+
+    Returns
+    -------
+    fname : str
+        Name of the saved file.
+
+    """
+    fields, delim = _requested_fields(command)
+    if fields is None or delim != const.SACCT_DELIMITER:
+        raise ValueError("Only delimited 'sacct' and 'squeue' commands can be recorded.")
+
+    if runner is None:
+        runner = SubprocessRunner()
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+    fname = os.path.join(path, os.path.basename(command[0]) + '.txt')
+
+    # Write the output as it is read, so that large outputs are not held in memory
+    p = runner.popen(command)
+    with open(fname, 'w') as out_file:
+        out_file.write(delim.join(fields) + '\n')
+        for line in p.stdout:
+            out_file.write(line)
+        err = p.stderr.read()
+        retcode = p.wait()
+
+    if retcode:
+        raise subprocess.CalledProcessError(retcode, command, stderr=err)
+
+    return fname
+
+
+def _requested_fields(command):
+    """Determine the output fields and delimiter requested by a 'sacct' or 'squeue' command.
+
+    Returns
+    -------
+    fields : list of str or None
+        'sacct' field names or 'squeue' format codes; `None` for other commands.
+    delim : str
+
+    """
+    name = os.path.basename(command[0])
+    delim = const.SACCT_DELIMITER
+    fields = None
+    for ii, arg in enumerate(command):
+        if name == 'sacct' and arg == '--format':
+            fields = command[ii + 1].split(',')
+        elif name == 'sacct' and arg.startswith('--delimiter='):
+            delim = arg[len('--delimiter='):]
+        elif name == 'squeue' and arg.startswith('--format='):
+            fields = arg[len('--format='):].split(delim)
+
+    return fields, delim
+
+
+def _format_duration(secs):
+    days, secs = divmod(secs, 24*3600)
+    hours, secs = divmod(secs, 3600)
+    mins, secs = divmod(secs, 60)
+    if days > 0:
+        return "{}-{:02d}:{:02d}:{:02d}".format(days, hours, mins, secs)
+    return "{:02d}:{:02d}:{:02d}".format(hours, mins, secs)
+
+
+class _FakeProcess(object):
+    """Process-like object (see `Runner`) whose output is the given iterator of lines.
+    """
+
+    class _Output(object):
+
+        def __init__(self, lines):
+            self._lines = lines
+            self.closed = False
+
+        def __iter__(self):
+            return self._lines
+
+        def read(self):
+            return "".join(self._lines)
+
+        def close(self):
+            self.closed = True
+
+    def __init__(self, lines, returncode=0, err=""):
+        self.stdout = self._Output(lines)
+        self.stderr = io.StringIO(err)
+        self.returncode = None
+        self._returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        if self.returncode is None:
+            self.returncode = self._returncode
+        return self.returncode
+
+    def kill(self):
+        if self.returncode is None:
+            self.returncode = -9
+        return
+
+    def communicate(self):
+        out = self.stdout.read()
+        err = self.stderr.read()
+        self.wait()
+        return out, err
+
+
+class _AsyncProcess(object):
+    """Wrap a process-like object (see `Runner`) in the interface of `asyncio.subprocess.Process`.
+    """
+
+    class _Output(object):
+
+        def __init__(self, stream):
+            self._stream = stream
+
+        def __aiter__(self):
+            return self._lines()
+
+        async def _lines(self):
+            for line in self._stream:
+                yield line.encode()
+
+        async def read(self):
+            return self._stream.read().encode()
+
+    def __init__(self, proc):
+        self._proc = proc
+        self.stdout = self._Output(proc.stdout)
+        self.stderr = self._Output(proc.stderr)
+
+    @property
+    def returncode(self):
+        return self._proc.poll()
+
+    def kill(self):
+        self._proc.kill()
+
+    async def wait(self):
+        return self._proc.wait()
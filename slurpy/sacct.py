@@ -2,301 +2,911 @@
 
 Functions
 ---------
--   sacct                 -
--   sacct_results         -
--   summary               -
-
-
--   _parse_sacct          -
+-   sacct                 - Call 'sacct', parse and filter results and print to output.
+-   _print_keys           - Fields printed by default for the given arguments.
+-   sacct_results         - Call 'sacct', parse and filter the results into a `JobTable`.
+-   export_results        - Call 'sacct' and write the results in a machine-readable format.
+-   _iter_sacct_results   - Call 'sacct', and yield filtered results as they are read.
+-   _iter_limited         - Read only the rows selected by `--head` or `--tail` from 'sacct'.
+-   _can_stream           - Determine whether results can be printed while they are read.
+-   summary               - Construct a summary of jobs described by the sacct command.
+-   summary_lines         - Construct the lines of text summarizing the jobs in a table.
+-   node_summary          - Print the number of jobs, failures and hours on each node.
+-   arrays                - Print results with the tasks of each job-array combined.
+
+
+-   _parse_sacct          - Call 'sacct' (in concurrent time-shards) and parse the results.
+-   _read_sacct           - Run a single 'sacct' command and parse all of its output.
+-   _shard_window         - Split a long query window into shorter time-shards.
+-   _merge_shards         - Combine the results of sharded queries, removing duplicate jobs.
+-   _parse_sacct_cached   - Parse 'sacct' results using the local cache of finished jobs.
+-   _use_cache            - Determine whether the local cache can be used for a query.
+-   _get_cluster_name     - Name of the current cluster (from the environment or `scontrol`).
+-   _target_clusters      - Names of the clusters to query separately (`args.clusters`).
+-   _iter_sacct_tables    - Run 'sacct' and yield `JobTable`s of rows as they are read.
+-   _iter_sacct_rows      - Run 'sacct' and yield each (split) line of output as it arrives.
+-   _construct_sacct_command -
+-   _plan_sacct_query     - Determine which filters can be applied by 'sacct' itself.
 -   _parse_sacct_line     -
+-   _select_window        - Select the rows in the query window, for results not from 'sacct'.
+-   _steps_in_spec        - Whether job-steps are named in the JobID specification.
 -   _filter_lines         -
 -   _filter_by            -
--   _parse_state_value    - Retrieve the index corresponding to the given state.
+-   _filter_by_jobid      -
 """
 
 import subprocess
+import itertools
+import functools
+import threading
+import getpass
+import datetime
 from collections import OrderedDict
 import numpy as np
 import os
-# import datetime
 
 from . import utils
 from . import const
-from slurpy.const import META_WIDTH, SACCT_KEYS, STATE_KEYS
+from . import jobid
+from . import stats
+from . import runner
+from . import profiling
+from .table import JobTable, parse_sort_keys
+from slurpy.const import SACCT_KEYS
 
 
 def sacct(args):
     """Call the 'sacct', parse and filter results and print to output.
+
+    With `args.stream`, rows are printed as they are read from 'sacct' (when possible, see
+    `_can_stream`).  With `args.output`, results are instead written in that format (see
+    `export`) to `args.output_file`, or stdout.
     """
-    lines, header = sacct_results(args)
-    utils.print_lines_dicts(lines, header, args)
+    if args.output is not None:
+        export_results(args)
+        return
+
+    keys = _print_keys(args)
+    if args.stream and _can_stream(args):
+        utils.print_table_stream(_iter_sacct_results(args), args, keys=keys)
+        return
+
+    table = sacct_results(args, limit=True)
+    utils.print_table(table, args, keys=keys)
     return
 
 
-def sacct_results(args):
+def _print_keys(args):
+    """Fields printed by default, including 'Cluster' and 'User' when querying several of them.
+    """
+    keys = list(const.SACCT_KEYS_PRINT)
+    if args.clusters is not None:
+        keys.append('Cluster')
+    if args.all_users or (args.users is not None):
+        keys.append('User')
+    return keys
+
+
+def sacct_results(args, check=False, limit=False):
     """Call 'sacct', parse and filter the results.
+
+    If `check`, a `subprocess.CalledProcessError` is raised if 'sacct' fails (otherwise a warning
+    is printed).  When the local cache is used, cached results are returned instead.  With
+    `args.history`, only the finished jobs in the local history are returned (see `history`).
+
+    If `limit`, only the rows selected by `args.head` and/or `args.tail` are returned (i.e. the
+    rows which are printed).  These are read from 'sacct' as they arrive when possible, so that
+    'sacct' is stopped as soon as `args.head` rows have been found (see `_iter_limited`), and
+    sorted results only sort the rows which can be selected (see `JobTable.argsort`).
+
+    Returns
+    -------
+    table : `slurpy.table.JobTable`
+
     """
-    lines, header = _parse_sacct(args)
-    # Filter out undesired lines
-    lines = _filter_lines(lines, header, args)
+    # Check the sort fields before running any (slow) queries
+    if args.sort is not None:
+        parse_sort_keys(args.sort, SACCT_KEYS)
+
+    # Use the results of a running server (see `server.py`), if it covers this query
+    served = None
+    if not args.history and getattr(args, 'server', False):
+        from . import server
+        served = server.query('sacct', args)
+    limited = None if (served is not None) or not limit else _iter_limited(args)
+    if served is not None:
+        table = served
+    elif limited is not None:
+        tables = list(limited)
+        table = JobTable.concatenate(tables) if len(tables) else \
+            JobTable.from_rows([], list(SACCT_KEYS))
+    # Read (and filter) finished jobs from the local history, without calling 'sacct'
+    elif args.history:
+        if (args.clusters is not None) or (args.users is not None) or args.all_users:
+            raise ValueError("The local history only includes the current cluster and user, "
+                             "it cannot be used with `--clusters` or `--users`.")
+        from . import history
+        with profiling.stage('history') as entry:
+            table = history.history_results(args)
+            entry.rows_out = len(table)
+    else:
+        # Use the local cache of finished jobs when possible, in which case filters are not
+        #    applied by 'sacct' itself (so that all jobs are cached)
+        pushdown = not _use_cache(args)
+        if pushdown:
+            table = _parse_sacct(args, check=check)
+        else:
+            table = _parse_sacct_cached(args)
+        # Filter out undesired lines
+        with profiling.stage('filter', rows_in=len(table)) as entry:
+            table = _filter_lines(table, args, pushdown=pushdown)
+            entry.rows_out = len(table)
     # Sort results
-    _sort_lines(lines, header, args)
-    return lines, header
+    with profiling.stage('sort', rows_in=len(table)) as entry:
+        table = _sort_lines(table, args, limit=limit)
+        entry.rows_out = len(table)
+    return table
+
+
+def export_results(args):
+    """Call 'sacct' and write the results in the format `args.output` (see `export.FORMATS`).
+
+    All fields are written, with typed values.  Results are written as they are read from
+    'sacct' whenever they do not need to be sorted or cached (see `_can_stream`).
+    """
+    from . import export
+    if _can_stream(args):
+        tables = _iter_sacct_results(args)
+        if args.head is not None:
+            tables = utils.iter_head(tables, int(args.head))
+        elif args.tail is not None:
+            tables = utils.iter_tail(tables, int(args.tail))
+    else:
+        table = sacct_results(args, limit=True)
+        tables = [utils._select_head_tail(table, args.head, args.tail)]
+
+    export.write_tables(tables, args.output, path=args.output_file)
+    return
+
+
+def _iter_sacct_results(args):
+    """Call 'sacct', and yield `JobTable`s of filtered results as they are read.
+
+    Each of `args.clusters` is queried in turn (in order of name, as for `_merge_shards`).  With
+    `args.head`, the first chunks read are small (see `_iter_sacct_tables`), so that reading can
+    stop as soon as enough rows have been found.
+    """
+    timeout = args.timeout if args.timeout is not None else const.SACCT_TIMEOUT
+    size = None if args.head is None else max(int(args.head), 1)
+    clusters = _target_clusters(args)
+    if clusters != [None]:
+        clusters = sorted(clusters)
+    for cluster in clusters:
+        command = _construct_sacct_command(args, cluster=cluster)
+        for table in _iter_sacct_tables(command, list(SACCT_KEYS), size=size, timeout=timeout):
+            with profiling.stage('filter', rows_in=len(table)) as entry:
+                table = _filter_lines(table, args)
+                entry.rows_out = len(table)
+            yield table
+
+    return
+
+
+def _iter_limited(args):
+    """Return an iterator of the `JobTable`s of rows selected by `args.head` or `args.tail`,
+    read from 'sacct' as they arrive, or `None` if these rows cannot be found while reading.
+
+    With `args.head`, 'sacct' is stopped as soon as enough rows have been found (see
+    `utils.iter_head`).  With `args.tail`, only the last rows are kept while reading (see
+    `utils.iter_tail`).  This is only used for a single query (i.e. one cluster, and a window
+    which is not split into shards), whose rows are not reordered (see `_merge_shards`).
+    Results which are sorted, cached, or use both `args.head` and `args.tail`, cannot be
+    limited while reading.
+    """
+    if not _can_stream(args):
+        return None
+
+    shards = _shard_window(args.start, args.end, args.shard_days)
+    if len(shards) > 1 or len(_target_clusters(args)) > 1:
+        return None
+
+    if args.head is not None:
+        return utils.iter_head(_iter_sacct_results(args), int(args.head))
+
+    if args.tail is not None:
+        return utils.iter_tail(_iter_sacct_results(args), int(args.tail))
+
+    return None
+
+
+def _can_stream(args):
+    """Determine whether results can be printed while they are read (i.e. not sorted or cached).
+
+    Only one of `args.head` or `args.tail` can be applied while reading.
+    """
+    if (args.sort is not None) or ((args.head is not None) and (args.tail is not None)):
+        return False
+    if args.history or _use_cache(args):
+        return False
+    # The server module is only imported when a server may be used (see `--no-server`)
+    if getattr(args, 'server', False):
+        from . import server
+        return not server.available(args)
+    return True
 
 
 def summary(args):
     """Construct a summary of jobs described by the sacct command.
     """
-    verbose = args.verbose
     # Call `sacct`, parse results and filter output
-    lines, header = sacct_results(args)
-    num_states = len(STATE_KEYS)
-
-    # Number of jobs in each state
-    state_counts = np.zeros(num_states, dtype=int)
-    # Duration of each job in each state
-    durations = [[] for ii in range(num_states)]
-
-    # Iterate over each job
-    # ---------------------
-    for ii, ll in enumerate(lines):
-        # Find the state of this job
-        state, idx = _parse_state_value(ll['State'])
-        # If 'state' is unrecognized, 'None' is returned; skip
-        if state is None:
-            continue
-
-        state_counts[idx] += 1
-
-        # Store the elapsed duration of time
-        # Format: `[dd-]hh:mm:ss`
-        elap = ll['Elapsed']
-        try:
-            # Look for days
-            dd = elap.split('-')
-            if len(dd) > 1:
-                elap = dd[-1]
-                dd = int(dd[0])
-            else:
-                dd = 0.0
-            hh, mm, ss = [int(ee) for ee in elap.split(':')]
-        except:
-            print("sacct.summary(): Error - split failed on '{}'".format(elap))
-            raise
-        # Convert durations to hours and store
-        dur = dd*24.0 + hh + mm/60.0 + ss/3600.0
-        durations[idx].append(dur)
-
-    # If we are in 'watch' mode (with repeated output), then clear the screen before printing
-    #    This should happen here to minimize the delay between clearing and printing
-    if (args.watch is not None) and args.clear:
-        os.system('cls' if os.name == 'nt' else 'clear')
-    # Report results
-    for ss, cc, dd in zip(STATE_KEYS, state_counts, durations):
-        # Number of jobs in each state
-        print("\t'{}': {}".format(ss, cc))
-        # If verbose is enabled
-        if verbose:
-            # min, max, and median elapsed time for each state.
-            if len(dd):
-                min, max, med = np.min(dd), np.max(dd), np.median(dd)
-            else:
-                min, max, med = 0.0, 0.0, 0.0
-            print("\t\tmin: {:8.4f} [hr], max: {:8.4f} [hr], med: {:8.4f} [hr]".format(min, max, med))
+    table = sacct_results(args)
+    for line in summary_lines(table, args):
+        print(line)
 
     return
 
 
-def _parse_sacct(args):
-    """Call the `sacct` command and parse the output.
+def arrays(args):
+    """Print 'sacct' results with the tasks of each job-array combined into a single row.
+
+    See `stats.collapse_arrays`.  Other jobs are printed individually, and `--head`/`--tail`
+    apply to the combined rows.
     """
-    command = _construct_sacct_command(args)
+    table = sacct_results(args)
+    # Only list the first ranges of failed tasks, unless verbose
+    max_ranges = None if args.verbose else const.ARRAY_FAILED_RANGES
+    with profiling.stage('collapse', rows_in=len(table)) as entry:
+        table = stats.collapse_arrays(table, max_ranges=max_ranges)
+        entry.rows_out = len(table)
+
+    if args.output is not None:
+        table.write(args.output_file, fmt=args.output)
+        return
+
+    utils.print_table(table, args, keys=table.header)
+    return
+
+
+def node_summary(args):
+    """Print the number of jobs, failed jobs and elapsed hours on each node (`--nodes`).
+
+    The nodes with the most failures are listed (`args.head`, or `const.NODES_TOP`), see
+    `stats.summarize_nodes`.
+    """
+    table = sacct_results(args)
+    with profiling.stage('summary', rows_in=len(table)):
+        summ = stats.summarize_nodes(table)
+        top = const.NODES_TOP if args.head is None else int(args.head)
+        lines = stats.format_node_summary(summ, top=top)
+
+    for line in lines:
+        print(line)
+
+    return
+
+
+def summary_lines(table, args):
+    """Construct the lines of text summarizing the jobs in the given table.
+
+    Jobs are counted in each state (and grouped by `args.group_by`, if given), see
+    `stats.summarize`.
+    """
+    with profiling.stage('summary', rows_in=len(table)):
+        summ = stats.summarize(table, by=args.group_by)
+        return stats.format_summary(summ, verbose=args.verbose)
+
+
+def _parse_sacct(args, start=None, pushdown=True, check=False):
+    """Call the `sacct` command and parse the output into a `JobTable`.
+
+    Long query windows are split into shards of `args.shard_days` days (see `_shard_window`),
+    and each shard is queried on each of `args.clusters` (see `_target_clusters`).  All of these
+    targets are queried concurrently by up to `args.workers` (or `const.SACCT_SHARD_WORKERS`)
+    'sacct' processes, from the shared worker pool (see `slurpy.pool`), each parsed as it is
+    read and killed after `args.timeout` seconds.  A target which fails (or times out) is
+    reported with a warning, unless `check`.  Jobs reported by more than one shard (i.e. active
+    across a boundary) are only included once, see `_merge_shards`.
+
+    See `_construct_sacct_command` for a description of the other arguments.
+    """
+    if start is None:
+        start = args.start
+    shards = _shard_window(start, args.end, args.shard_days)
+    commands = [_construct_sacct_command(args, start=ss, end=ee, pushdown=pushdown, cluster=cc)
+                for cc in _target_clusters(args) for ss, ee in shards]
     # if args.verbose:
     #     print("Running: '{}'\n\t'{}'".format(command, " ".join(command)))
-    p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    text = p.stdout.read()
-
-    # Parse results
-    #   Convert from bytes to string
-    raw_lines = text.decode('ascii')
-    raw_lines = raw_lines.split('\n')
-    header = raw_lines.pop(0)
-    header = header.split()
-
-    # Remove the separation line between header and content
-    raw_lines = raw_lines[1:]
-    lines = []
-    for ii, ll in enumerate(raw_lines):
-        # skip blank lines (last one is blank)
-        if not len(ll):
-            continue
-        comps = _parse_sacct_line(ll, header)
-        lines.append(comps)
-
-    return lines, header
-
-
-def _construct_sacct_command(args):
+    workers = args.workers if args.workers is not None else const.SACCT_SHARD_WORKERS
+    timeout = args.timeout if args.timeout is not None else const.SACCT_TIMEOUT
+    func = functools.partial(_read_sacct, header=list(SACCT_KEYS), check=check, timeout=timeout)
+    tables = utils.map_bounded(func, commands, workers=workers)
+    if len(tables) == 1:
+        return tables[0]
+
+    with profiling.stage('merge', rows_in=sum(len(tt) for tt in tables)) as entry:
+        table = _merge_shards(tables)
+        entry.rows_out = len(table)
+    return table
+
+
+def _read_sacct(command, header, check=False, timeout=None):
+    """Run a single `sacct` command and parse all of its output into a `JobTable`.
+    """
+    chunks = list(_iter_sacct_tables(command, header, check=check, timeout=timeout))
+    if not len(chunks):
+        return JobTable.from_rows([], header)
+
+    return JobTable.concatenate(chunks)
+
+
+def _shard_window(start, end, days):
+    """Split the query window from `start` to `end` (or now) into shards of `days` days each.
+
+    Returns a single shard of the full window if `days` is not positive, if the window is not
+    longer than one shard, or if `start` is not in a standard format (e.g. 'now-7days').  The
+    last shard always ends at `end`, so that it includes currently active jobs when no end is
+    given.  The last shard may be longer than the others by up to `const.SACCT_SHARD_SLACK` of a
+    shard, rather than adding a (very short) extra shard.
+
+    Returns
+    -------
+    shards : list of (str, str or None)
+        Start and end times of each shard.
+
+    """
+    if (start is None) or (days is None) or (days <= 0):
+        return [(start, end)]
+
+    try:
+        beg = np.datetime64(start, 's')
+        fin = np.datetime64(end, 's') if end is not None else \
+            np.datetime64(datetime.datetime.now().replace(microsecond=0), 's')
+    except ValueError:
+        return [(start, end)]
+
+    step = np.timedelta64(int(days * 24 * 3600), 's')
+    num = int(np.ceil((fin - beg) / step - const.SACCT_SHARD_SLACK))
+    if num <= 1:
+        return [(start, end)]
+
+    edges = [str(beg + ii*step) for ii in range(num)]
+    return list(zip(edges, edges[1:] + [end]))
+
+
+def _merge_shards(tables):
+    """Combine the results of sharded queries, keeping only the first row for each JobID.
+
+    JobIDs are only unique within a cluster, so rows of different clusters are kept separately.
+    Rows are ordered by cluster, and then by JobID number (as reported by a single 'sacct'
+    query).
+    """
+    table = JobTable.concatenate(tables)
+    ids = table['JobID']
+    keys = np.empty(len(table), dtype=[('cluster', np.int64), ('jobid', ids.dtype)])
+    keys['cluster'] = np.unique(table['Cluster'], return_inverse=True)[1].reshape(-1)
+    keys['jobid'] = ids
+    _, first = np.unique(keys, return_index=True)
+    first = np.sort(first)
+    idx = np.lexsort((ids['id'][first], keys['cluster'][first]))
+    return table[first[idx]]
+
+
+def _parse_sacct_cached(args):
+    """Parse 'sacct' results for finished jobs from the local cache, and for all others from
+    a (much smaller) 'sacct' query of the jobs active since the last sync.
+
+    See `slurpy.cache`.  No filters are applied by 'sacct' in this case, so that all jobs in the
+    query window can be cached.  If 'sacct' fails, only the cached jobs are returned (ordered in
+    the same way, and filtered by the caller as usual).
+    """
+    from . import cache
+    header = list(SACCT_KEYS)
+    start = np.datetime64(args.start, 's')
+    now = np.datetime64(datetime.datetime.now().replace(microsecond=0), 's')
+
+    path = cache.cache_path(_get_cluster_name(), getpass.getuser(), steps=args.steps)
+    cc = cache.SacctCache(path, header, const.SACCT_KEYS_TYPES)
+    try:
+        synced = cc.synced
+        covered = cc.covered
+        # Query the full window if it is not entirely covered by the cache
+        if (synced is None) or (covered is None) or (start < covered):
+            query_start = start
+        # Otherwise only query jobs which have been active since the last sync, which includes all
+        #    of those which had not finished by then
+        else:
+            query_start = synced - np.timedelta64(const.CACHE_SYNC_OVERLAP, 's')
+            query_start = max(query_start, start)
+
+        try:
+            fresh = _parse_sacct(args, start=str(query_start), pushdown=False, check=True)
+        except subprocess.CalledProcessError as err:
+            print("WARNING: `{}` failed ('{}'), using cached results only.".format(
+                err.cmd[0], err.stderr.strip()))
+            fresh = None
+
+        with profiling.stage('cache-load') as entry:
+            table = cc.load(start)
+            entry.rows_out = len(table)
+
+        if fresh is not None:
+            table = table.update(fresh)
+            # Store all of the newly finished jobs
+            done = np.isin(stats.normalize_states(fresh['State']), const.TERMINAL_STATES)
+            with profiling.stage('cache-save', rows_in=int(done.sum())):
+                cc.store(fresh[done], synced=now, covered=start)
+                cc.evict(now)
+    finally:
+        cc.close()
+
+    # Restore the ordering of 'sacct' output
+    idx = np.argsort(table['JobID']['id'], kind='stable')
+    return table[idx]
+
+
+def _use_cache(args):
+    """Determine whether the local cache of finished jobs can be used for this query.
+
+    The cache only includes the current cluster and user, so it is not used with
+    `args.clusters` or `args.users`.
+    """
+    if not args.cache or (args.start is None) or (args.end is not None):
+        return False
+
+    if (args.clusters is not None) or (args.users is not None) or args.all_users:
+        return False
+
+    # Job-steps named in `args.jobid` are not included in a cache of job allocations
+    if _steps_in_spec(args):
+        return False
+
+    # The cache requires the start time to be in a standard format, e.g. 'YYYY-MM-DDTHH:MM'
+    try:
+        np.datetime64(args.start, 's')
+    except ValueError:
+        return False
+
+    return True
+
+
+@functools.lru_cache(maxsize=None)
+def _get_cluster_name():
+    """Name of the current cluster, used to distinguish cache (and history) files.
+
+    It is only looked up for `--cache`, `--history` (and `slurpy sync`) and `slurpy serve`,
+    since 'scontrol' sends a request to the SLURM controller.
+
+    The name is taken from `$SLURM_CLUSTER_NAME` (set within jobs), otherwise from the
+    'ClusterName' of `scontrol show config` (e.g. on login nodes), and is 'default' if neither
+    is available.  It is only determined once per process.
+    """
+    name = os.environ.get('SLURM_CLUSTER_NAME')
+    if name:
+        return name
+
+    try:
+        retcode, out, err = runner.get_runner().communicate(['scontrol', 'show', 'config'])
+    except OSError:
+        return 'default'
+
+    if not retcode:
+        for line in out.splitlines():
+            key, _, val = line.partition('=')
+            if key.strip() == 'ClusterName' and len(val.strip()):
+                return val.strip()
+
+    return 'default'
+
+
+def _target_clusters(args):
+    """Names of the clusters to query separately, from `args.clusters` (e.g. 'odyssey,cannon').
+
+    Returns `[None]` (i.e. only the current cluster) if no clusters are given.  Duplicates are
+    removed, keeping the given order.
+    """
+    if args.clusters is None:
+        return [None]
+
+    names = [cc.strip() for cc in args.clusters.split(',')]
+    names = list(OrderedDict.fromkeys(cc for cc in names if len(cc)))
+    if not len(names):
+        raise ValueError("No cluster names given in `--clusters '{}'`".format(args.clusters))
+    return names
+
+
+def _iter_sacct_tables(command, header, size=None, check=False, timeout=None):
+    """Run the `sacct` command and yield `JobTable`s of rows as they are read.
+
+    Each chunk of rows is converted into typed columns as soon as it has been read, so that only
+    `const.PARSE_CHUNK_SIZE` rows of raw strings are held in memory at a time.  If a smaller
+    `size` is given, the first chunk has `size` rows, and each one after is twice as large (up to
+    `const.PARSE_CHUNK_SIZE`), so that the first rows are available quickly (e.g. for `--head`).
+    """
+    if size is None:
+        size = const.PARSE_CHUNK_SIZE
+
+    rows = _iter_sacct_rows(command, header, check=check, timeout=timeout)
+    try:
+        while True:
+            # Time spent waiting on 'sacct' is included in 'read' (see `slurpy.profiling`)
+            with profiling.stage('read') as entry:
+                chunk = list(itertools.islice(rows, size))
+                entry.rows_out = len(chunk)
+            if not len(chunk):
+                break
+            with profiling.stage('convert', rows_in=len(chunk)) as entry:
+                table = JobTable.from_rows(chunk, header)
+                entry.rows_out = len(table)
+            yield table
+            size = min(size*2, max(size, const.PARSE_CHUNK_SIZE))
+    finally:
+        # Stop 'sacct' if reading is stopped early (see `_iter_sacct_rows`)
+        rows.close()
+
+    return
+
+
+def _iter_sacct_rows(command, header, check=False, timeout=None):
+    """Run the `sacct` command and yield each row of output (a list of strings) as it arrives.
+
+    The command is started by the current runner, see `slurpy.runner`.  If it has not finished
+    after `timeout` seconds, it is killed (and only the rows already read are returned).
+
+    If `check` is True, a `subprocess.CalledProcessError` (or `subprocess.TimeoutExpired`) is
+    raised if 'sacct' fails (or times out), otherwise a warning is printed.
+    """
+    p = runner.get_runner().popen(command)
+    expired = threading.Event()
+    timer = None
+    if timeout is not None:
+        def _expire():
+            expired.set()
+            p.kill()
+
+        timer = threading.Timer(timeout, _expire)
+        timer.daemon = True
+        timer.start()
+
+    finished = False
+    # Count the characters read only when profiling, to keep this loop fast
+    counting = profiling.enabled()
+    nbytes = 0
+    try:
+        for line in p.stdout:
+            if counting:
+                nbytes += len(line)
+            line = line.rstrip('\n')
+            # skip blank lines
+            if not len(line):
+                continue
+            yield _parse_sacct_line(line, header)
+        finished = True
+    finally:
+        # Make sure the process is finished if the generator is closed early (otherwise it may
+        #    still be exiting after closing its output, and is waited on instead)
+        if not finished and p.poll() is None:
+            p.kill()
+        err = p.stderr.read()
+        retcode = p.wait()
+        if timer is not None:
+            timer.cancel()
+        p.stdout.close()
+        p.stderr.close()
+        if counting:
+            profiling.add('read', bytes=nbytes)
+
+    if expired.is_set():
+        if check:
+            raise subprocess.TimeoutExpired(command, timeout, stderr=err)
+        print("WARNING: `{}` timed out after {} s: '{}'".format(
+            command[0], timeout, " ".join(command)))
+    elif retcode:
+        if check:
+            raise subprocess.CalledProcessError(retcode, command, stderr=err)
+        print("WARNING: `{}` returned '{}': '{}'".format(command[0], retcode, err.strip()))
+
+    return
+
+
+def _construct_sacct_command(args, start=None, end=None, pushdown=True, cluster=None):
     """Construct the command (list of strings) to call 'sacct' (using `subprocess.Popen`).
 
-    NOTE: currently `format` argument does nothing... make it do... something...
+    Results are requested in the `--parsable2` format, with fields separated by
+    `const.SACCT_DELIMITER`, and without a header.  Filters which 'sacct' can apply itself are
+    added as command-line flags (see `_plan_sacct_query`).
+
+    Arguments
+    ---------
+    args : `argparse.Namespace`
+    start : str or None
+        Start time for the query, overriding `args.start`.
+    end : str or None
+        End time for the query, overriding `args.end`.
+    pushdown : bool
+        Whether filters should be applied by 'sacct' itself.
+    cluster : str or None
+        Cluster to query (default: the current cluster).
+
     """
     # Determine the keys to include in the sacct results (i.e. sacct output format)
-    use_keys = [kk + "%{}".format(META_WIDTH) for kk in SACCT_KEYS]
-    keys = ",".join(use_keys)
+    keys = ",".join(SACCT_KEYS)
 
     # Get results from `sacct`
-    command = ['sacct', '--format', keys]
+    command = ['sacct', '--parsable2', '--noheader',
+               '--delimiter=' + const.SACCT_DELIMITER, '--format', keys]
 
     # Add starttime
-    if args.start is not None:
-        command.extend(['--starttime', args.start])
-
+    if start is None:
+        start = args.start
+    if start is not None:
+        command.extend(['--starttime', start])
+
+    # Select the cluster and users (by default, only the current ones)
+    if cluster is not None:
+        command.extend(['--clusters', cluster])
+    if args.all_users:
+        command.append('--allusers')
+    elif args.users is not None:
+        command.extend(['--user', args.users])
+
+    flags, residual = _plan_sacct_query(args, end=end, pushdown=pushdown)
+    command.extend(flags)
     return command
 
 
+def _plan_sacct_query(args, end=None, pushdown=True):
+    """Determine which filters can be applied by 'sacct' itself, and which must be done here.
+
+    Filters are 'pushed down' into the 'sacct' command whenever 'sacct' can express them, so that
+    'slurmdbd' does not need to send (and we do not need to parse) jobs that are thrown away.
+
+    -   'state'    : '--state' selects jobs which were in a state at any time during the query
+                     window, so the (exact) filter on the current state is still applied here.
+    -   'partition': '--partition' (unless the given partition is empty).
+    -   'name'     : '--name' only matches exactly, so it is used only with `args.exact`;
+                     otherwise the substring match is applied here.
+    -   'jobid'    : '--jobs' for lists of IDs, with ranges (of IDs or array tasks) expanded if
+                     there are at most `const.PUSHDOWN_MAX_JOBIDS` IDs in total; otherwise
+                     the specification is applied here.
+    -   'steps'    : '--allocations' unless job-steps are requested (`args.steps`), otherwise
+                     '.batch' and '.extern' steps are removed here (unless `args.steps` is
+                     'all', e.g. for `efficiency`).  Job-steps named in `args.jobid` (e.g.
+                     '123.0') are also queried, see `_steps_in_spec`.
+
+    Arguments
+    ---------
+    args : `argparse.Namespace`
+    end : str or None
+        End time for the query, overriding `args.end`.
+    pushdown : bool
+        If False, only job-steps are selected by 'sacct', and all other filters are applied here.
+        This is also the case when the current runner does not apply filters at all (see
+        `runner.Runner.applies_filters`), in which case job-steps are also removed here.
+
+    Returns
+    -------
+    flags : list of str
+        Additional command-line arguments for 'sacct'.
+    residual : set of str
+        Names of the filters which must still be applied to the parsed results,
+        see `_filter_lines`.
+
+    """
+    flags = []
+    residual = set()
+
+    if end is None:
+        end = args.end
+    if end is not None:
+        flags.extend(['--endtime', end])
+
+    # Stand-in runners (e.g. for testing, see `slurpy.runner`) do not apply any filters
+    applied = runner.get_runner().applies_filters
+    if not applied:
+        pushdown = False
+
+    # Job-steps
+    spec_steps = _steps_in_spec(args)
+    if args.steps:
+        if args.steps != 'all':
+            residual.add('steps')
+    elif not spec_steps:
+        flags.append('--allocations')
+        if not applied:
+            residual.add('allocations')
+
+    if not pushdown:
+        residual.update(kk for kk, vv in [('state', args.state), ('partition', args.partition),
+                                          ('name', args.name), ('jobid', args.jobid)]
+                        if vv is not None)
+        return flags, residual
+
+    # State
+    if args.state is not None:
+        flags.extend(['--state', args.state])
+        # 'sacct' requires an end-time to select by state
+        if end is None:
+            flags.extend(['--endtime', 'now'])
+        residual.add('state')
+
+    # Partition
+    if args.partition:
+        flags.extend(['--partition', args.partition])
+    elif args.partition is not None:
+        residual.add('partition')
+
+    # Job name
+    if args.name is not None:
+        if args.exact:
+            flags.extend(['--name', args.name])
+        else:
+            residual.add('name')
+
+    # Job ID numbers
+    if args.jobid is not None:
+        jobs = jobid.pushdown_spec(jobid.parse_spec(args.jobid), const.PUSHDOWN_MAX_JOBIDS)
+        if jobs is not None and len(jobs):
+            flags.extend(['--jobs', ",".join(jobs)])
+        else:
+            residual.add('jobid')
+        # 'sacct' also returns the steps of the other jobs, which are removed here
+        if spec_steps:
+            residual.add('jobid')
+
+    return flags, residual
+
+
 def _parse_sacct_line(line, header):
-    """Parse a single line of results from `sacct` with the given header.
+    """Parse a single (delimited) line of results from `sacct` into a list of strings.
     """
-    num_keys = len(header)
-    # Break up in 'sacct'-output line based on constant number-of-character sections for each key
-    _comps = [line[ii*(META_WIDTH+1):(ii+1)*(META_WIDTH+1)][:-1] for ii in range(num_keys)]
-    comps = OrderedDict()
-    # Each line is a dict of key: value pairs, where the key is from the header line
-    for key, _val in zip(header, _comps):
-        val = _val.strip()
-        if const.REFORMAT_TIMES and key in const.SACCT_KEYS_TIMES:
-            match = const._REGEX_TIMES_PATTERN.match(val)
-            if match is not None and len(match.groups()) == 2:
-                val = const.REFORMAT_TIMES_SEP_CHAR.join(match.groups())
-        comps[key] = val
+    delim = const.SACCT_DELIMITER
+    comps = line.split(delim)
+    # If the delimiter appears within a value (most likely a job-name), join the extra pieces
+    extra = len(comps) - len(header)
+    if extra > 0 and 'JobName' in header:
+        jj = header.index('JobName')
+        comps[jj:jj+extra+1] = [delim.join(comps[jj:jj+extra+1])]
+    # Pad incomplete lines with empty values
+    elif extra < 0:
+        comps.extend([''] * (-extra))
 
     return comps
 
 
-def _sort_lines(lines, header, args):
-    """Sort the lines based on the `args.sort` parameter---matching one of the header keys.
+def _sort_lines(table, args, limit=False):
+    """Sort the table by the fields in `args.sort`, e.g. 'State,-Elapsed' (see `JobTable.sort`).
+
+    If `limit`, only the first `args.head` and/or last `args.tail` rows are returned (without
+    sorting the full table).  Raises a `ValueError` if any field is not in the table.
     """
     # No sort parameter, do not sort
     if args.sort is None:
-        return lines
+        if limit:
+            return utils._select_head_tail(table, args.head, args.tail)
+        return table
 
-    sort = args.sort
-    rev = False
-    # If the sort parameter starts with '-', then reverse the sorting order
-    if sort.startswith('-'):
-        rev = True
-        sort = sort[1:]
+    if limit:
+        head = None if args.head is None else int(args.head)
+        tail = None if args.tail is None else int(args.tail)
+        return table.sort(args.sort, head=head, tail=tail)
+
+    return table.sort(args.sort)
 
-    # Sort each line by the target key
-    lines.sort(key=lambda item: item[sort], reverse=rev)
-    return None
 
+def _select_window(table, args):
+    """Boolean mask of the rows in the query window (`args.start` to `args.end`) which are
+    selected by `args.steps`, for results which were not queried with these arguments (e.g.
+    from the local history, or a server).
 
-def _filter_lines(lines, header, args):
-    """Filter the given lines based on some parameter (e.g. state).
+    As for 'sacct', jobs are included if they ended after the start (or have not ended), and
+    started (or were submitted) before the end.
     """
-    clean = list(lines)
+    sel = np.ones(len(table), dtype=bool)
+    if args.start is not None:
+        start = np.datetime64(args.start, 's')
+        sel &= np.isnat(table['End']) | (table['End'] >= start)
+    if args.end is not None:
+        end = np.datetime64(args.end, 's')
+        starts = np.where(np.isnat(table['Start']), table['Submit'], table['Start'])
+        sel &= (starts <= end)
+    # Only job allocations, unless job-steps are requested (other steps, see `_filter_lines`)
+    if not args.steps and not _steps_in_spec(args):
+        sel &= (table['JobID']['step'] == -1)
+    return sel
+
+
+def _steps_in_spec(args):
+    """Whether job-steps are named in `args.jobid` (e.g. '123.0'), without `args.steps`.
+
+    These steps are then queried from 'sacct' (i.e. without '--allocations'), and only the
+    allocations of the other jobs in the specification are kept (see `_filter_by_jobid`).
+    """
+    if args.steps or (args.jobid is None):
+        return False
+
+    try:
+        terms = jobid.parse_spec(args.jobid)
+    except ValueError:
+        return False
+    return any(tt.step is not None for tt in terms)
+
+
+def _filter_lines(table, args, pushdown=True, residual=None):
+    """Filter the rows of the given table based on some parameter (e.g. state).
+
+    Only the filters which could not be applied by 'sacct' itself are used here,
+    see `_plan_sacct_query`.  Alternatively, the names of the filters to apply can be given
+    explicitly as `residual` (e.g. for 'squeue' results).
+    """
+    if residual is None:
+        flags, residual = _plan_sacct_query(args, pushdown=pushdown)
+    sel = np.ones(len(table), dtype=bool)
+
+    # Remove all job-steps (which 'sacct' does with '--allocations')
+    if 'allocations' in residual:
+        sel &= (table['JobID']['step'] == jobid.NONE)
+
     # Remove 'extern' and 'batch' entries
-    clean = [cc for cc in clean
-             if not (cc['JobID'].endswith('extern') or cc['JobID'].endswith('batch'))]
+    if 'steps' in residual:
+        steps = table['JobID']['step']
+        sel &= ~np.isin(steps, [jobid.STEP_NAMES['batch'], jobid.STEP_NAMES['extern']])
 
     # Filter by 'State'
-    if args.state is not None:
-        clean = _filter_by(clean, args.state, 'State', header)
+    if 'state' in residual:
+        sel &= (stats.normalize_states(table['State']) == args.state)
     # Filter by 'Partition'
-    if args.partition is not None:
-        clean = _filter_by(clean, args.partition, 'Partition', header)
+    if 'partition' in residual:
+        sel &= _filter_by(table, args.partition, 'Partition')
 
     # Filter by job name
-    if args.name is not None:
-        clean = _filter_by_name(clean, args.name, header)
+    if 'name' in residual:
+        sel &= _filter_by_name(table, args.name, exact=args.exact)
 
     # Filter by job ID number
-    if args.jobid is not None:
-        clean = _filter_by_jobid(clean, args.jobid, header)
-
-    return clean
+    if 'jobid' in residual:
+        sel &= _filter_by_jobid(table, args.jobid, allocations=not args.steps)
 
+    return table[sel]
 
-def _filter_by(line, var, key, header):
-    if key in header:
-        clean = [cc for cc in line if cc[key] == var]
-        return clean
 
-    print("WARNING: '{}' not in header: '{}'".format(key, header))
-    return line
+def _filter_by(table, var, key):
+    """Return a boolean mask selecting rows where the field `key` matches the value `var`.
+    """
+    if key in table:
+        return (table[key] == var)
 
+    print("WARNING: '{}' not in header: '{}'".format(key, table.header))
+    return np.ones(len(table), dtype=bool)
 
-def _filter_by_jobid(lines, idstr, header):
-    """Filter out lines with JobID numbers matching the input specification.
 
-    Currently the `idstr` specification can be:
-    - one or multiple ID numbers (comma or space separated)
-    - An interval of ID numbers in the form `LO_ID : HI_ID` (spaces are optional).
+def _filter_by_jobid(table, idstr, allocations=False):
+    """Select rows with JobID numbers matching the input specification.
 
     Arguments
     ---------
-    lines : (N,) list of dict
-    idstr : str
-        Specification of which ID numbers to include.
-    header : dict
+    table : `JobTable`
+    idstr : str or list of str
+        Specification of which ID numbers to include, see `jobid.parse_spec`.
+    allocations : bool
+        Terms of the specification without a job-step (e.g. '123', but not '123.0') only select
+        job allocations, and not their steps.
 
     Returns
     -------
-    clean : (M,) list of dict
+    sel : (N,) array of bool
 
     """
-    _ids = " ".join(idstr)
-
-    # Parse the specification string for which jobID numbers to include
-    id_list = None
-    id_lo = None
-    id_hi = None
-
-    # Look for a range of values using ':', e.g. `84513996 : 84514000`
-    _ids = [ss.strip() for ss in _ids.split(':')]
-    if len(_ids) == 2:
-        id_lo = int(_ids[0])
-        id_hi = int(_ids[1])
-        # print("id_lo : '{}'".format(id_lo))
-        # print("id_hi : '{}'".format(id_hi))
-    elif len(_ids) == 1:
-        id_list = [tt for ss in _ids[0].split() for tt in ss.split(',')]
-        # Clean up each element and remove empty ones
-        id_list = [tt.strip() for tt in id_list if len(tt.strip()) > 0]
-        # print("id_list : '{}'".format(id_list))
-    else:
-        raise ValueError("Could not parse input jobids '{}'".format(idstr))
-
-    clean = [nn for nn in lines if (id_list is None) or (nn['JobID'] in id_list)]
-    clean = [nn for nn in clean if (id_lo is None) or (int(nn['JobID']) >= id_lo)]
-    clean = [nn for nn in clean if (id_hi is None) or (int(nn['JobID']) <= id_hi)]
-    return clean
-
-
-def _filter_by_name(lines, name, header):
-    if name is None:
-        return lines
-    clean = [nn for nn in lines if name in nn['JobName']]
-    return clean
+    terms = jobid.parse_spec(idstr)
+    if allocations:
+        terms = [tt if tt.step is not None else tt._replace(step=jobid.NONE) for tt in terms]
+    index = jobid.JobIDIndex(table['JobID'])
+    return index.select(terms)
 
 
-def _parse_state_value(state):
-    """Retrieve the index corresponding to the given state (as returned by 'sacct').
-
-    The 'CANCELLED' state needs special filtering.
+def _filter_by_name(table, name, exact=False):
+    """Return a boolean mask selecting rows where `name` is contained in (or, if `exact`, equal
+    to) the 'JobName'.
     """
-
-    # Handle 'CANCELLED' specially
-    #    e.g. 'CANCELLED by 56895'
-    if state.lower().startswith('cancelled'):
-        state = state.split(' by ')[0]
-
-    try:
-        idx = STATE_KEYS.index(state)
-    except:
-        print("WARNING: state '{}' not in keys".format(state))
-        return None, None
-
-    return state, idx
+    if exact:
+        return (table['JobName'] == name)
+    return (np.char.find(table['JobName'], name) >= 0)
@@ -4,38 +4,205 @@ Functions
 ---------
 -   scancel           - Cancel submitted jobs.
 
+-   _collapse_jobids  - Combine the tasks of each job-array into a single 'jobid_[a-b]' specification.
+-   _chunk_arguments  - Split JobIDs into groups which each fit on a single command-line.
+-   _run_scancel      - Call 'scancel' on a group of JobIDs, and determine which have failed.
+-   _index_specs      - Parse JobID specifications, grouped by their ID numbers.
+-   _find_spec        - Find the JobID specification which includes a job reported in an error.
+
 """
 
-import subprocess
+import os
+import re
+import argparse
 from collections import OrderedDict
 import numpy as np
-import datetime
 
-from . import utils
 from . import sacct
-# from slurpy.const import META_WIDTH, SACCT_KEYS, SEP_CHAR, STATE_KEYS
+from . import jobid
+from . import utils
+from . import const
+from . import runner
+
+# e.g. "scancel: error: Kill job error on job id 1234_5: Invalid job id specified"
+_REGEX_ERROR_PATTERN = re.compile(r'error.* job id (\S+?):?\s+(.*)')
 
 
 def scancel(args):
     """Cancel submitted jobs.
+
+    Jobs are cancelled with as few calls to 'scancel' as possible, each given many JobIDs (with
+    the tasks of each job-array combined into 'jobid_[a-b]' ranges).  If `args.workers` is given,
+    up to that many calls are run concurrently.  Jobs are always queried from 'sacct' itself,
+    never from a server (see `server.query`).
+
+    Returns
+    -------
+    results : `OrderedDict`
+        For each JobID specification, the error message if it failed, or `None` on success.
+
+    """
+    # Get filtered job information (from 'sacct', not a possibly outdated server)
+    args = argparse.Namespace(**dict(vars(args), server=False))
+    table = sacct.sacct_results(args)
+    if args.verbose:
+        for jj, nn in zip(table.render('JobID'), table['JobName']):
+            print("Cancelling job '{}' - '{}'".format(jj, nn))
+
+    # Construct JobID specifications, and group them to fit on command-lines
+    specs = _collapse_jobids(table)
+    chunks = _chunk_arguments(specs)
+    print("Cancelling {} jobs with {} call(s) to 'scancel'".format(len(table), len(chunks)))
+
+    results = OrderedDict()
+    for res in utils.map_bounded(_run_scancel, chunks, workers=args.workers):
+        results.update(res)
+
+    # Report results
+    failed = [(kk, vv) for kk, vv in results.items() if vv is not None]
+    for spec, msg in failed:
+        print("\tFailed to cancel '{}': '{}'".format(spec, msg))
+    print("Cancelled {}/{} job specifications".format(len(results) - len(failed), len(results)))
+    return results
+
+
+def _collapse_jobids(table):
+    """Combine the tasks of each job-array into a single 'jobid_[a-b,c]' specification.
+
+    Returns
+    -------
+    specs : list of str
+        JobID specifications, each of which can be passed to 'scancel'.
+
     """
-    # Get filtered job information
-    lines, header = sacct.sacct_results(args)
-    # utils.print_lines_dicts(lines, header, args)
-
-    # Extract JobID numbers
-    jids = [jj['JobID'] for jj in lines]
-
-    form = utils._calculate_formatting(lines, header)
-    for ii, (jj, ll) in enumerate(zip(jids, lines)):
-        # print(ii, jj, utils._format_line(ll, form))
-        command = ['scancel', jj]
-        print("Cancelling job '{}' - '{}'".format(jj, ll['JobName']))
-        p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        # decome from bytes to strings
-        text = p.stdout.read().decode('ascii')
-        if text:
-            print("\tRecieved: '{}'".format(text))
-        # break
-
-    return
+    jobids = table['JobID']
+    # Job-array tasks (but not their steps)
+    sel = (jobids['task'] != jobid.NONE) & (jobids['step'] == jobid.NONE)
+
+    specs = table.render('JobID')[~sel].tolist()
+    ids = jobids['id'][sel]
+    tasks = jobids['task'][sel]
+    # Group the tasks of each array, in order of first appearance
+    uniq, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+    for ii in np.argsort(first):
+        vals = tasks[inverse == ii]
+        specs.append("{}_[{}]".format(uniq[ii], utils.compress_ranges(vals)))
+
+    return specs
+
+
+def _chunk_arguments(specs, command=('scancel',)):
+    """Split JobID specifications into groups, such that each group fits on one command-line.
+
+    The total length of each command-line is kept below `const.SCANCEL_MAX_ARG_BYTES` (or a
+    quarter of the system's `ARG_MAX`, if that is smaller).
+    """
+    try:
+        limit = os.sysconf('SC_ARG_MAX') // 4
+    except (ValueError, OSError, AttributeError):
+        limit = const.SCANCEL_MAX_ARG_BYTES
+    limit = min(limit, const.SCANCEL_MAX_ARG_BYTES)
+
+    base = sum(len(cc) + 1 for cc in command)
+    chunks = []
+    chunk = []
+    size = base
+    for ss in specs:
+        if len(chunk) and size + len(ss) + 1 > limit:
+            chunks.append(chunk)
+            chunk = []
+            size = base
+        chunk.append(ss)
+        size += len(ss) + 1
+
+    if len(chunk):
+        chunks.append(chunk)
+
+    return chunks
+
+
+def _run_scancel(specs):
+    """Call 'scancel' on the given JobID specifications, and determine which have failed.
+
+    Returns
+    -------
+    results : `OrderedDict`
+        For each specification, the error message if it failed, or `None` on success.
+
+    """
+    command = ['scancel'] + list(specs)
+    retcode, out, err = runner.get_runner().communicate(command)
+
+    results = OrderedDict((ss, None) for ss in specs)
+    index = None
+    errors = 0
+    for line in err.splitlines():
+        match = _REGEX_ERROR_PATTERN.search(line)
+        if match is None:
+            continue
+        name, msg = match.group(1), match.group(2).strip()
+        # Errors for individual array-tasks (e.g. '1234_5') mark the specification which
+        #    includes them (e.g. '1234_[1-10]') as failed
+        if name in results:
+            spec = name
+        else:
+            # Specifications are only parsed (once) if errors do not name them directly
+            if index is None:
+                index = _index_specs(specs)
+            spec = _find_spec(name, index)
+        if spec is None:
+            continue
+        if spec != name:
+            msg = "{}: {}".format(name, msg)
+        results[spec] = msg if results[spec] is None else "{}; {}".format(results[spec], msg)
+        errors += 1
+
+    # If 'scancel' failed without identifying particular jobs, they have all failed
+    if retcode and not errors:
+        msg = err.strip() or "'scancel' returned {}".format(retcode)
+        results = OrderedDict((ss, msg) for ss in specs)
+
+    return results
+
+
+def _index_specs(specs):
+    """Parse JobID specifications into a `dict` of the (spec, `jobid.SpecTerm`) pairs of each ID.
+
+    Terms covering a range of IDs (e.g. '1234:1240') are stored under the key `None`.
+    """
+    index = {}
+    for ss in specs:
+        for tt in jobid.parse_spec(ss):
+            key = tt.id_lo if tt.id_lo == tt.id_hi else None
+            index.setdefault(key, []).append((ss, tt))
+
+    return index
+
+
+def _find_spec(name, index):
+    """The specification (of those in `index`, see `_index_specs`) which includes the job `name`
+    reported in an error.
+
+    e.g. '1234_5' is included in '1234_[1-3,5]', and '1234.0' in '1234'.  Returns `None` if no
+    specification includes it.
+    """
+    try:
+        terms = jobid.parse_spec(name)
+    except ValueError:
+        return None
+    if len(terms) != 1:
+        return None
+
+    job = terms[0]
+    task = None if job.tasks is None else job.tasks[0][0]
+    for ss, tt in index.get(job.id_lo, []) + index.get(None, []):
+        if not (tt.id_lo <= job.id_lo <= tt.id_hi):
+            continue
+        if (tt.step is not None) and (tt.step != job.step):
+            continue
+        if (tt.tasks is not None) and not (
+                (task is not None) and any(lo <= task <= hi for lo, hi in tt.tasks)):
+            continue
+        return ss
+
+    return None
@@ -0,0 +1,616 @@
+"""Server which queries 'sacct' and 'squeue' periodically and answers queries of local clients.
+
+`slurpy serve` queries 'sacct' (including job-steps, without filters) and 'squeue' once every
+`--interval` seconds, keeping the parsed tables in memory (each 'sacct' query only covers the
+jobs active since the previous one, see `watch._SacctSource`).  Clients connect to a Unix socket
+(`--socket`, by default `const.SERVER_SOCKET` in the user's directory, see `socket_path`) and
+send filtered queries, which are answered from the latest tables, so that many clients (e.g.
+`slurpy --watch` on a login node) do not each call 'sacct'.  The CLI uses a running server
+automatically (see `query`), and otherwise calls 'sacct' (or 'squeue') directly; use
+`--no-server` to always call them directly.  Jobs are never cancelled based on the results of
+a server.
+
+Start the server with the users (e.g. `--all-users`) and clusters (`--clusters`) that it should
+cover, and the earliest `--start` time.  The query window keeps its length, i.e. its start moves
+forward with each query (but not past the start time of any recent request, e.g. of a `--watch`
+client), and jobs which ended before it are removed.  Queries which it does not cover (e.g. an
+earlier start time, or other users) are answered with a 'miss', and clients then call 'sacct'
+themselves.  Clients without `--users` or `--all-users` are served the jobs of the user they
+are connected as.
+
+A single server can be shared by all users (e.g. of a login node) with `slurpy serve --shared
+--all-users`, run by an account in `const.SERVER_TRUSTED_USERS`, on `const.SERVER_SHARED_SOCKET`
+(in a directory set up by an administrator) or `--socket`.  Its socket can be used by all local
+users, and clients use it whenever they do not have a server of their own.
+
+NOTE: the default socket is in a directory which only the current user can access (see
+      `_make_socket_dir`), and clients only connect to sockets owned by themselves or by
+      `const.SERVER_TRUSTED_USERS` (see `_is_trusted`).  Unless the server was started with
+      `--all-users`, each client is only served the jobs of the user it is connected as (see
+      `_peer_user`).  A shared server makes all jobs visible to all local users (as 'sacct'
+      does, unless SLURM's 'PrivateData' is set).
+
+Protocol
+--------
+Each message is a 4-byte (big-endian) length followed by that many bytes.  Requests are a
+single JSON message,
+
+    {"version": 1, "kind": "sacct" | "squeue" | "status", "format": "npz" | "json",
+     "args": {"start": ..., "state": ..., ...}}
+
+with the arguments in `_REQUEST_ARGS`.  Responses are a JSON header (with a "status" of 'ok',
+'miss' or 'error', and a "message" otherwise) followed by the results as a `numpy` archive
+('npz', one array per field, loaded by `_decode_table`) or as JSON columns with the values of
+`export._export_columns` ('json').
+
+Classes
+-------
+-   Server                - Poll 'sacct' and 'squeue', and answer queries on a Unix socket.
+
+Functions
+---------
+-   serve                 - Run a server with the given (command-line) arguments.
+-   query                 - Retrieve filtered results from a running server, if possible.
+-   available             - Whether a server may be used for the given arguments.
+-   request               - Send a single request to the server, and return its response.
+-   socket_path           - Path of the server's socket in the current user's directory.
+
+-   _Handler              - Answer the request of each client connection.
+-   _Snapshot             - Tables of the most recent queries.
+-   _get_path             - Path of the socket given by the arguments, or a default one.
+-   _socket_dir           - Directory of the current user's sockets.
+-   _make_socket_dir      - Create the directory of the current user's sockets, if needed.
+-   _is_trusted           - Whether a socket is owned by the current user (or a trusted one).
+-   _requested_users      - Users whose jobs are requested by a client.
+-   _fill_step_users      - Set the 'User' of job-steps to that of their allocation.
+-   _send / _recv         - Write and read a single (length-prefixed) message.
+-   _encode_table         - Convert a `JobTable` into bytes in the requested format.
+-   _decode_table         - Convert an 'npz' response back into a `JobTable`.
+-   _peer_user            - Name of the user connected to a socket (on Linux).
+"""
+
+import io
+import os
+import sys
+import json
+import stat
+import time
+import socket
+import struct
+import getpass
+import argparse
+import threading
+import datetime
+import traceback
+import socketserver
+from collections import namedtuple, OrderedDict
+import numpy as np
+
+from . import const
+from .table import JobTable
+
+# Query arguments sent by clients (all other arguments only affect the output)
+_REQUEST_ARGS = ['start', 'end', 'state', 'partition', 'name', 'exact', 'jobid', 'steps',
+                 'clusters', 'users', 'all_users']
+_FORMATS = ['npz', 'json']
+_LENGTH = struct.Struct('!I')
+
+# Tables of the most recent queries (replaced as a whole after each query)
+#    sacct, squeue : `JobTable` (or `None` before the first successful query)
+#    synced : `datetime64` time of the most recent (successful) 'sacct' query
+_Snapshot = namedtuple('_Snapshot', ['sacct', 'squeue', 'synced'])
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Poll 'sacct' and 'squeue' every `interval` seconds, and answer queries on a Unix socket.
+
+    Arguments
+    ---------
+    path : str
+        Path of the Unix socket.
+    args : `argparse.Namespace`
+        Arguments of the queries (e.g. `start`, `clusters`, `users` and `all_users`).
+    interval : float
+        Seconds between queries.
+    shared : bool
+        Allow all local users to connect (otherwise only the current user can).
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, args, interval, shared=False):
+        from . import sacct
+        # Query all job-steps, without filters, which are applied to each request
+        self.args = argparse.Namespace(**dict(
+            vars(args), steps='all', state=None, partition=None, name=None, jobid=None,
+            sort=None, cache=False, history=False, server=False))
+        self.interval = interval
+        self.start = np.datetime64(self.args.start, 's')
+        # Length of the query window, which moves forward with each query (see `poll`)
+        self.span = np.datetime64(datetime.datetime.now().replace(microsecond=0), 's') - self.start
+        # Start times of recent requests, and when they were last requested (see `poll`)
+        self._requests = {}
+        self._lock = threading.Lock()
+        self.clusters = sacct._target_clusters(self.args)
+        # Name of the current cluster, reported to clients (which do not look it up themselves)
+        self.cluster = sacct._get_cluster_name()
+        if self.args.all_users:
+            self.users = None
+        elif self.args.users is None:
+            self.users = [getpass.getuser()]
+        else:
+            self.users = self.args.users.split(',')
+
+        self.snapshot = _Snapshot(None, None, None)
+        self._stop = threading.Event()
+
+        # Remove a socket left by a server which is no longer running
+        if os.path.exists(path):
+            try:
+                request(path, {'kind': 'status'}, timeout=1.0)
+            except (OSError, ValueError):
+                os.remove(path)
+            else:
+                raise RuntimeError("A server is already running on '{}'".format(path))
+
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        # Only allow the current user to connect, unless the server is shared
+        os.chmod(path, 0o666 if shared else 0o600)
+        self.path = path
+        return
+
+    def poll(self):
+        """Repeatedly query 'sacct' and 'squeue' (every `interval` seconds) until stopped.
+
+        Before each query, the start of the window is moved forward (keeping its length,
+        `span`), and jobs which ended before it are removed (see `watch._SacctSource.trim`).
+        The window is not moved past the start time of any request within the last
+        `const.SERVER_REQUEST_EXPIRY` seconds, so that clients which keep their start time
+        (e.g. `--watch`) are still served.
+        """
+        from . import watch, squeue
+        source = watch._SacctSource(self.args)
+        command = squeue._construct_squeue_command(self.args, pushdown=False)
+        next_tick = time.time()
+        while not self._stop.is_set():
+            now = np.datetime64(datetime.datetime.now().replace(microsecond=0), 's')
+            snap = self.snapshot
+            # Requests before the new start are missed, so the previous results remain valid
+            with self._lock:
+                start = now - self.span
+                expired = time.time() - const.SERVER_REQUEST_EXPIRY
+                self._requests = dict((kk, vv) for kk, vv in self._requests.items()
+                                      if vv >= expired)
+                if len(self._requests):
+                    start = min(start, min(self._requests))
+                self.start = max(self.start, start)
+            source.trim(self.start)
+            try:
+                jobs = _fill_step_users(source.refresh())
+                snap = snap._replace(sacct=jobs, synced=now)
+                snap = snap._replace(squeue=squeue._parse_squeue(self.args, command=command))
+            except Exception:
+                print("WARNING: query failed, serving previous results.", file=sys.stderr)
+                traceback.print_exc()
+            self.snapshot = snap
+
+            next_tick = max(next_tick + self.interval, time.time())
+            self._stop.wait(next_tick - time.time())
+
+        return
+
+    def answer(self, req, peer=None):
+        """Answer a (decoded) request, returning the response header and the results (or `None`).
+        """
+        if req.get('version') != const.SERVER_PROTOCOL:
+            return {'status': 'error', 'message': "Unsupported protocol version '{}'".format(
+                req.get('version'))}, None
+
+        snap = self.snapshot
+        kind = req.get('kind')
+        header = OrderedDict([('status', 'ok'), ('synced', str(snap.synced)),
+                              ('start', str(self.start)), ('users', self.users),
+                              ('cluster', self.cluster), ('clusters', self.clusters)])
+        if kind == 'status':
+            return header, None
+        if kind not in ['sacct', 'squeue']:
+            return {'status': 'error', 'message': "Unknown kind '{}'".format(kind)}, None
+
+        fmt = req.get('format', 'json')
+        if fmt not in _FORMATS:
+            return {'status': 'error', 'message': "Unknown format '{}'".format(fmt)}, None
+
+        params = dict((kk, None) for kk in _REQUEST_ARGS)
+        params.update(req.get('args', {}))
+        args = argparse.Namespace(**params)
+        table = snap.sacct if kind == 'sacct' else snap.squeue
+        miss = self._miss(kind, args, peer)
+        if table is None:
+            miss = "no results yet"
+        if miss is not None:
+            return {'status': 'miss', 'message': miss}, None
+
+        try:
+            table = self._select(kind, table, args, peer)
+            payload = _encode_table(table, fmt)
+        except Exception as err:
+            return {'status': 'error', 'message': "{}: {}".format(type(err).__name__, err)}, None
+
+        header['rows'] = len(table)
+        header['format'] = fmt
+        return header, payload
+
+    def _miss(self, kind, args, peer):
+        """Reason that the request is not covered by this server's queries, or `None`.
+        """
+        users = _requested_users(args, peer)
+        # Without `--all-users`, only the jobs of the connected user are served
+        if self.users is not None:
+            if peer is None:
+                return "unknown user"
+            if users is None:
+                return "all users are not included"
+            if not set(users) <= (set(self.users) & set([peer])):
+                return "users are not included"
+
+        # 'squeue' is always queried on the current cluster
+        if kind == 'squeue':
+            return None
+
+        if args.clusters is not None:
+            from . import sacct
+            if not set(sacct._target_clusters(args)) <= set(self.clusters):
+                return "clusters are not included"
+        elif self.clusters != [None]:
+            return "the current cluster is not included"
+
+        if args.start is None:
+            return "no start time"
+        try:
+            start = np.datetime64(args.start, 's')
+        except ValueError:
+            return "unrecognized start time '{}'".format(args.start)
+        with self._lock:
+            if start < self.start:
+                return "start time is before '{}'".format(self.start)
+            # Keep the window from moving past this start time (see `poll`)
+            self._requests[start] = time.time()
+
+        return None
+
+    def _select(self, kind, table, args, peer):
+        """Apply the filters of a request to the stored results.
+        """
+        from . import sacct, squeue
+        users = _requested_users(args, peer)
+        sel = np.ones(len(table), dtype=bool)
+        if users is not None:
+            sel &= np.isin(table['User'], users)
+        if kind == 'squeue':
+            flags, residual = squeue._plan_squeue_query(args)
+            # 'squeue' was queried without filters
+            residual.update(kk for kk in ['state', 'partition', 'name']
+                            if getattr(args, kk) is not None)
+            return sacct._filter_lines(table[sel], args, residual=residual)
+
+        if args.clusters is not None:
+            sel &= np.isin(table['Cluster'], sacct._target_clusters(args))
+        sel &= sacct._select_window(table, args)
+        return sacct._filter_lines(table[sel], args, pushdown=False)
+
+    def serve(self):
+        """Start polling (in a background thread), and answer requests until interrupted.
+        """
+        poller = threading.Thread(target=self.poll, name='slurpy-poll', daemon=True)
+        poller.start()
+        try:
+            self.serve_forever()
+        finally:
+            self._stop.set()
+            self.server_close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+        return
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """Answer the request of each client connection.
+    """
+
+    def handle(self):
+        self.request.settimeout(const.SERVER_TIMEOUT)
+        try:
+            req = json.loads(_recv(self.request).decode('utf-8'))
+            header, payload = self.server.answer(req, peer=_peer_user(self.request))
+        except (OSError, ValueError) as err:
+            header = {'status': 'error', 'message': "Invalid request: {}".format(err)}
+            payload = None
+
+        try:
+            _send(self.request, json.dumps(header).encode('utf-8'))
+            if payload is not None:
+                _send(self.request, payload)
+        except OSError:
+            pass
+
+        return
+
+
+def serve(args):
+    """Run a server with the given (command-line) arguments, until interrupted.
+    """
+    import signal
+    shared = getattr(args, 'shared', False)
+    path = getattr(args, 'socket', None)
+    if shared:
+        if path is None:
+            path = const.SERVER_SHARED_SOCKET
+        if path is None:
+            raise RuntimeError("A shared server requires `--socket` (or "
+                               "`const.SERVER_SHARED_SOCKET`)")
+        if not args.all_users:
+            raise RuntimeError("A shared server must include all users (`--all-users`)")
+    elif path is None:
+        path = socket_path()
+        _make_socket_dir(os.path.dirname(path))
+    server = Server(path, args, interval=args.interval, shared=shared)
+    # Exit normally when terminated, so that the socket is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Serving 'sacct' results of '{}' since '{}' on '{}' (every {} s).".format(
+        server.cluster, server.start, path, args.interval))
+    try:
+        server.serve()
+    except KeyboardInterrupt:
+        pass
+
+    return
+
+
+def query(kind, args):
+    """Retrieve the filtered results of a 'sacct' or 'squeue' query from a running server.
+
+    Returns `None` if the results should instead be queried directly, i.e. if `args.server`
+    is False, if no server is running (or it does not respond), or if it does not cover the
+    query (see `Server`).
+
+    Returns
+    -------
+    table : `slurpy.table.JobTable` or None
+
+    """
+    if not available(args):
+        return None
+
+    path = _get_path(args)
+
+    from . import profiling
+    req = {'kind': kind, 'format': 'npz',
+           'args': dict((kk, getattr(args, kk, None)) for kk in _REQUEST_ARGS)}
+    with profiling.stage('server') as entry:
+        try:
+            header, payload = request(path, req)
+        except (ConnectionRefusedError, FileNotFoundError):
+            # The server is not running (its socket is left over)
+            return None
+        except (OSError, ValueError) as err:
+            print("WARNING: no response from server on '{}' ({}), querying directly.".format(
+                path, err))
+            return None
+
+        if header.get('status') == 'error':
+            print("WARNING: server on '{}' failed ('{}'), querying directly.".format(
+                path, header.get('message')))
+        if header.get('status') != 'ok':
+            return None
+
+        table = _decode_table(payload)
+        entry.bytes = len(payload)
+        entry.rows_out = len(table)
+
+    return table
+
+
+def available(args):
+    """Whether a server may be used for queries with the given arguments, i.e. its socket exists
+    and is owned by the current user (or a trusted one), see `_is_trusted`.
+    """
+    if not getattr(args, 'server', False):
+        return False
+
+    return _is_trusted(_get_path(args))
+
+
+def request(path, req, timeout=None):
+    """Send a single request (`dict`) to the server on `path`, and return its response.
+
+    Returns
+    -------
+    header : dict
+    payload : bytes or None
+        Results (only when the status is 'ok', and the request was for a table).
+
+    """
+    req = dict(req, version=const.SERVER_PROTOCOL)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(const.SERVER_TIMEOUT if timeout is None else timeout)
+        sock.connect(path)
+        _send(sock, json.dumps(req).encode('utf-8'))
+        header = json.loads(_recv(sock).decode('utf-8'))
+        payload = None
+        if header.get('status') == 'ok' and req.get('kind') != 'status':
+            payload = _recv(sock)
+    finally:
+        sock.close()
+
+    return header, payload
+
+
+def socket_path():
+    """Path of the server's socket (`const.SERVER_SOCKET`), within the current user's directory
+    (see `_socket_dir`).
+
+    The name of the cluster is only included if it is set in the environment, so that finding
+    the socket never requires querying SLURM (see `sacct._get_cluster_name`).
+    """
+    cluster = os.environ.get('SLURM_CLUSTER_NAME')
+    if cluster:
+        name = const.SERVER_SOCKET_CLUSTER.format(cluster=cluster)
+    else:
+        name = const.SERVER_SOCKET
+    return os.path.join(_socket_dir(), name)
+
+
+def _get_path(args):
+    """Path of the socket given by `args.socket`, otherwise the current user's (see
+    `socket_path`) if it exists, otherwise the shared one (`const.SERVER_SHARED_SOCKET`).
+    """
+    path = getattr(args, 'socket', None)
+    if path is not None:
+        return path
+
+    path = socket_path()
+    if const.SERVER_SHARED_SOCKET is not None and not os.path.exists(path):
+        return const.SERVER_SHARED_SOCKET
+    return path
+
+
+def _socket_dir():
+    """Directory of the current user's sockets: 'slurpy' within '$XDG_RUNTIME_DIR' (if it is set),
+    otherwise `const.SERVER_DIR`.
+    """
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'slurpy')
+    return const.SERVER_DIR.format(uid=os.getuid())
+
+
+def _make_socket_dir(path):
+    """Create the directory of the current user's sockets (with permissions '0o700'), if needed.
+
+    Raises a `RuntimeError` if it exists, but is not a directory which only the current user
+    can access (e.g. it was created by another user).
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or
+            stat.S_IMODE(info.st_mode) & 0o077):
+        raise RuntimeError("'{}' must be a directory which only the current user can "
+                           "access".format(path))
+    return
+
+
+def _is_trusted(path):
+    """Whether `path` is a socket owned by the current user, or one of `const.SERVER_TRUSTED_USERS`.
+
+    Sockets of other users are never used, as they could serve arbitrary results.
+    """
+    import pwd
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    if not stat.S_ISSOCK(info.st_mode):
+        return False
+    if info.st_uid == os.getuid():
+        return True
+    try:
+        return pwd.getpwuid(info.st_uid).pw_name in const.SERVER_TRUSTED_USERS
+    except KeyError:
+        return False
+
+
+def _requested_users(args, peer):
+    """Users whose jobs are requested (`None` for all), by default the connected user.
+    """
+    if args.all_users:
+        return None
+    if args.users is not None:
+        return args.users.split(',')
+    return None if peer is None else [peer]
+
+
+def _fill_step_users(table):
+    """Set the 'User' of job-steps (which 'sacct' leaves empty) to that of their allocation.
+    """
+    ids = table['JobID']
+    users = table['User']
+    missing = (users == '') & (ids['step'] != -1)
+    if not np.any(missing):
+        return table
+
+    keys = np.stack([np.unique(table['Cluster'], return_inverse=True)[1].reshape(-1),
+                     ids['id'], ids['task'], ids['het']], axis=1).tolist()
+    alloc = np.flatnonzero(ids['step'] == -1)
+    lookup = dict((tuple(keys[ii]), users[ii]) for ii in alloc)
+    users = users.copy()
+    for ii in np.flatnonzero(missing):
+        users[ii] = lookup.get(tuple(keys[ii]), '')
+
+    columns = OrderedDict(table.columns)
+    columns['User'] = users
+    return JobTable(columns, table.header, types=table.types)
+
+
+def _send(sock, data):
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+    return
+
+
+def _recv(sock):
+    size = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))[0]
+    return _recv_exactly(sock, size)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 2**20))
+        if not len(chunk):
+            raise ValueError("Connection closed before the end of the message")
+        chunks.append(chunk)
+        size -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _encode_table(table, fmt):
+    """Convert a `JobTable` into bytes: a `numpy` archive ('npz') or JSON columns ('json').
+    """
+    if fmt == 'json':
+        from . import export
+        columns = export._export_columns(table, text=True)
+        data = OrderedDict((kk, vv.tolist()) for kk, vv in columns.items())
+        return json.dumps(data).encode('utf-8')
+
+    buf = io.BytesIO()
+    types = json.dumps([table.header, table.types])
+    np.savez(buf, _header=np.array(types), **table.columns)
+    return buf.getvalue()
+
+
+def _decode_table(payload):
+    """Convert an 'npz' response (see `_encode_table`) back into a `JobTable`.
+    """
+    with np.load(io.BytesIO(payload), allow_pickle=False) as data:
+        header, types = json.loads(str(data['_header']))
+        columns = OrderedDict((kk, data[kk]) for kk in header)
+
+    return JobTable(columns, header, types=types)
+
+
+def _peer_user(sock):
+    """Name of the user connected to the given Unix socket, or `None` if it cannot be determined.
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+
+    import pwd
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        pid, uid, gid = struct.unpack('3i', creds)
+        return pwd.getpwuid(uid).pw_name
+    except (OSError, KeyError):
+        return None
@@ -1,76 +1,207 @@
 """Methods for interacting with the SLURM `squeue` command.
+
+Functions
+---------
+-   squeue                    - Call 'squeue', parse the results and print to output.
+-   squeue_results            - Call 'squeue', parse and filter the results into a `JobTable`.
+-   merged                    - Print 'sacct' results combined with live 'squeue' information.
+-   merged_results            - Join 'sacct' results with live 'squeue' information by JobID.
+
+-   _parse_squeue             -
+-   _select_lines             - Filter and sort parsed 'squeue' results.
+-   _construct_squeue_command -
+-   _plan_squeue_query        - Determine which filters can be applied by 'squeue' itself.
+-   _parse_squeue_line        -
 """
 
+import getpass
+import argparse
 import subprocess
-from collections import OrderedDict
-import numpy as np
-import datetime
 
+from . import const
+from . import sacct
+from . import runner
+from . import profiling
 from . import utils
-from slurpy.const import META_WIDTH, SQUEUE_KEYS, SEP_CHAR, STATE_KEYS
+from .table import JobTable, parse_sort_keys
+from slurpy.const import SQUEUE_KEYS, SACCT_KEYS
 
 
 def squeue(args):
-    lines, header = _parse_squeue()
-    # lines = _filter_lines(lines, header, state=state)
-    utils.print_lines_dicts(lines, header, args)
+    """Call 'squeue', parse the results and print to output (or export them, see `args.output`).
+    """
+    table = squeue_results(args)
+    if args.output is not None:
+        table.write(args.output_file, fmt=args.output)
+        return
+
+    utils.print_table(table, args, keys=const.SQUEUE_KEYS_PRINT)
     return
 
 
-def _parse_squeue():
-    """Call the `squeue` command and parse the output.
+def squeue_results(args, check=False):
+    """Call 'squeue', parse and filter the results into a `JobTable`.
+
+    The same filters as for 'sacct' are used (e.g. `args.state`, `args.partition`,
+    `args.name` and `args.jobid`), see `_plan_squeue_query`.
+
+    If `check`, a `subprocess.CalledProcessError` is raised if 'squeue' fails (otherwise a
+    warning is printed).
     """
-    # Determine the keys to include in the sacct results (i.e. sacct output format)
-    use_keys = [kk + ":{}".format(META_WIDTH) for kk in SQUEUE_KEYS]
-    # num_keys = len(use_keys)
-    keys = "\"" + ",".join(use_keys) + "\""
-    # keys = "username,jobid,name,timeleft"
-    # print("'{}'".format(keys))
-    # print("Keys: {} - {}".format(num_keys, keys))
-
-    # Get results from `sacct`
-    # _com = "squeue"
-    _com = "/usr/bin/squeue"
-    command = [_com, '--Format=' + keys]
-    # command = command[0] + " " + command[1] + command[2]
-    # command = "/usr/bin/squeue"
-    print("Calling:\n", command, "\n")
-    p = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    text = p.stdout.read()
-    # print(text)
-    retcode = p.wait()
+    # Check the sort fields before running 'squeue'
+    if args.sort is not None:
+        parse_sort_keys(args.sort, SQUEUE_KEYS)
+
+    # Use the results of a running server (see `server.py`), which are already filtered
+    from . import server
+    table = server.query('squeue', args)
+    if table is not None:
+        return sacct._sort_lines(table, args)
+
+    table = _parse_squeue(args, check=check)
+    return _select_lines(table, args)
+
+
+def merged(args):
+    """Print 'sacct' results combined with live 'squeue' information (e.g. 'TimeLeft', 'Reason').
+    """
+    table = merged_results(args)
+    if args.output is not None:
+        table.write(args.output_file, fmt=args.output)
+        return
+
+    utils.print_table(table, args, keys=const.SACCT_KEYS_PRINT + const.SQUEUE_MERGE_KEYS)
+    return
+
+
+def merged_results(args, check=False):
+    """Join 'sacct' results with the live 'squeue' fields in `const.SQUEUE_MERGE_KEYS`, by JobID.
+
+    All (filtered) 'sacct' results are included; jobs which are no longer queued have missing
+    values for the 'squeue' fields (see `JobTable.join`).
+
+    Returns
+    -------
+    table : `slurpy.table.JobTable`
+
+    """
+    # Sort after joining, so that the 'squeue' fields can also be sorted by
+    if args.sort is not None:
+        parse_sort_keys(args.sort, list(SACCT_KEYS) + const.SQUEUE_MERGE_KEYS)
+    table = sacct.sacct_results(argparse.Namespace(**dict(vars(args), sort=None)), check=check)
+    # Filters are not used for 'squeue', as they refer to the 'sacct' results
+    unfiltered = argparse.Namespace(**dict(vars(args), state=None, partition=None, name=None,
+                                           jobid=None))
+    from . import server
+    live = server.query('squeue', unfiltered)
+    if live is None:
+        command = _construct_squeue_command(args, pushdown=False)
+        live = _parse_squeue(args, check=check, command=command)
+    table = table.join(live, const.SQUEUE_MERGE_KEYS)
+    return sacct._sort_lines(table, args)
+
+
+def _parse_squeue(args, check=False, command=None):
+    """Call the `squeue` command and parse the output into a `JobTable`.
+    """
+    if command is None:
+        command = _construct_squeue_command(args)
+    with profiling.stage('read') as entry:
+        retcode, text, err = runner.get_runner().communicate(command)
+        entry.bytes = len(text)
     if retcode:
-        print("retcode = '{}'".format(retcode))
-
-    # Parse results
-    # Convert from bytes to string
-    raw_lines = text.decode('ascii')
-    raw_lines = raw_lines.split('\n')
-    header = raw_lines.pop(0)
-    header = header.split()
-    print("header:\n", header)
-    print()
-
-    # Remove the separation line between header and content
-    raw_lines = raw_lines[1:]
-    lines = []
-    for ii, ll in enumerate(raw_lines):
-        # skip blank lines (last one is blank)
-        if not len(ll):
-            continue
-        comps = _parse_squeue_line(ll, header)
-        lines.append(comps)
-
-    return lines, header
+        if check:
+            raise subprocess.CalledProcessError(retcode, command, output=text, stderr=err)
+        print("WARNING: `{}` returned '{}': '{}'".format(command[0], retcode, err.strip()))
 
+    # Parse results, skipping blank lines (last one is blank)
+    header = list(SQUEUE_KEYS)
+    with profiling.stage('convert') as entry:
+        rows = [_parse_squeue_line(ll, header) for ll in text.split('\n') if len(ll)]
+        table = JobTable.from_rows(rows, header, types=const.SQUEUE_KEYS_TYPES)
+        entry.rows_out = len(table)
+    return table
+
+
+def _select_lines(table, args):
+    """Apply the filters which 'squeue' could not apply itself, and sort the results.
+    """
+    flags, residual = _plan_squeue_query(args)
+    table = sacct._filter_lines(table, args, residual=residual)
+    return sacct._sort_lines(table, args)
+
+
+def _construct_squeue_command(args, pushdown=True):
+    """Construct the command (list of strings) to call 'squeue' (using `subprocess.Popen`).
+
+    Only the fields in `SQUEUE_KEYS` are requested, separated by `const.SACCT_DELIMITER`, and
+    without a header.  Jobs of the current user are requested, unless `args.users` or
+    `args.all_users` are given.  Filters which 'squeue' can apply itself are added as
+    command-line flags (see `_plan_squeue_query`).
+    """
+    codes = const.SACCT_DELIMITER.join(const.SQUEUE_KEYS_CODES[kk] for kk in SQUEUE_KEYS)
+    command = ['squeue', '--noheader', '--format=' + codes]
+    if not args.all_users:
+        users = getpass.getuser() if args.users is None else args.users
+        command.extend(['--user', users])
+    if pushdown:
+        flags, residual = _plan_squeue_query(args)
+        command.extend(flags)
+
+    return command
+
+
+def _plan_squeue_query(args):
+    """Determine which filters can be applied by 'squeue' itself, and which must be done here.
+
+    -   'state'    : '--states' (which matches the current state exactly).
+    -   'partition': '--partition' (unless the given partition is empty).
+    -   'name'     : '--name' with `args.exact`, otherwise the substring match is applied here.
+    -   'jobid'    : always applied here, as 'squeue' fails when given JobIDs which are no
+                     longer queued (and there are relatively few queued jobs).
+
+    When the current runner does not apply filters (see `runner.Runner.applies_filters`), all of
+    them are applied here.
+
+    Returns
+    -------
+    flags : list of str
+        Additional command-line arguments for 'squeue'.
+    residual : set of str
+        Names of the filters which must still be applied, see `sacct._filter_lines`.
 
-def _parse_squeue_line(line, header):
-    """Parse a single line of results from `sacct` with the given header.
     """
-    num_keys = len(header)
-    _comps = [line[ii*(META_WIDTH+1):(ii+1)*(META_WIDTH+1)][:-1] for ii in range(num_keys)]
-    comps = OrderedDict()
-    for key, val in zip(header, _comps):
-        comps[key] = val.strip()
+    flags = []
+    residual = set()
+
+    # Stand-in runners (e.g. for testing, see `slurpy.runner`) do not apply any filters
+    if not runner.get_runner().applies_filters:
+        residual.update(kk for kk in ['state', 'partition', 'name', 'jobid']
+                        if getattr(args, kk) is not None)
+        return flags, residual
+
+    if args.state is not None:
+        flags.extend(['--states', args.state])
+
+    if args.partition:
+        flags.extend(['--partition', args.partition])
+    elif args.partition is not None:
+        residual.add('partition')
+
+    if args.name is not None:
+        if args.exact:
+            flags.extend(['--name', args.name])
+        else:
+            residual.add('name')
 
-    return comps
+    if args.jobid is not None:
+        residual.add('jobid')
+
+    return flags, residual
+
+
+def _parse_squeue_line(line, header):
+    """Parse a single (delimited) line of results from `squeue` into a list of strings.
+    """
+    # The format is the same as for 'sacct'
+    return sacct._parse_sacct_line(line, header)
@@ -0,0 +1,372 @@
+"""Summary statistics of jobs, computed over the typed columns of a `JobTable`.
+
+Functions
+---------
+-   summarize             - Count jobs and compute duration percentiles per state (and group).
+-   format_summary        - Format the results of `summarize` into lines of text.
+-   normalize_states      - Remove extra information from 'State' values (e.g. 'CANCELLED by 123').
+-   state_codes           - Convert 'State' values into indices of `const.SLURM_STATES`.
+-   summarize_nodes       - Count jobs, failures and elapsed hours on each node.
+-   collapse_arrays       - Combine the tasks of each job-array into a single row.
+-   format_node_summary   - Format the results of `summarize_nodes` into lines of text.
+
+-   _grouped_percentiles  - Percentiles of values within each (integer-labeled) group.
+-   _group_arrays         - Label the tasks of each job-array (and each other job) by one integer.
+-   _count_tasks          - Number of tasks of each (pending) job-array specification.
+"""
+
+from collections import namedtuple
+import numpy as np
+
+from . import const
+
+# Results of `summarize`.
+#    groups : (G,) array of group values (a single empty value when not grouping)
+#    states : (S,) list of state names, `const.SLURM_STATES` followed by `const.OTHER_STATE`
+#    counts : (G, S) array of the number of jobs in each group and state
+#    percentiles : (P,) list of percentiles (in [0, 100])
+#    durations : (G, S, P) array of percentiles of elapsed time [hr] (NaN when no jobs)
+Summary = namedtuple('Summary', ['key', 'groups', 'states', 'counts', 'percentiles', 'durations'])
+
+# Results of `summarize_nodes`, arrays have one value per node.
+#    nodes : (M,) array of node names (sorted)
+#    jobs : (M,) number of jobs which ran on each node
+#    failed : (M,) number of those jobs in one of `const.NODE_FAILURE_STATES`
+#    hours : (M,) total elapsed time of those jobs [hr]
+NodeSummary = namedtuple('NodeSummary', ['nodes', 'jobs', 'failed', 'hours'])
+
+
+def summarize(table, by=None, percentiles=None):
+    """Count jobs and compute percentiles of elapsed time in each state, and optionally group.
+
+    All work is done in a single pass over integer labels for each row: the groups and states are
+    combined into one label, counted with `np.bincount`, and percentiles are taken from a single
+    sort of the elapsed times by label.
+
+    Arguments
+    ---------
+    table : `JobTable`
+    by : str or None
+        Field to group jobs by (e.g. 'Partition', 'JobName', 'User').
+    percentiles : list of float or None
+        Percentiles of elapsed time to compute, default: `const.SUMMARY_PERCENTILES`.
+
+    Returns
+    -------
+    summ : `Summary`
+
+    """
+    if percentiles is None:
+        percentiles = const.SUMMARY_PERCENTILES
+
+    states = list(const.SLURM_STATES) + [const.OTHER_STATE]
+    num_states = len(states)
+    codes = state_codes(table['State'])
+
+    if by is None:
+        groups = np.array([''])
+        labels = np.zeros(len(table), dtype=np.int64)
+    else:
+        if by not in table:
+            raise ValueError("Cannot group by '{}', not one of: {}".format(by, table.header))
+        groups, labels = np.unique(table.render(by), return_inverse=True)
+        labels = labels.reshape(-1)
+
+    num_groups = len(groups)
+    labels = labels * num_states + codes
+    counts = np.bincount(labels, minlength=num_groups*num_states)
+
+    # Convert durations from seconds to hours
+    hours = np.maximum(table['Elapsed'], 0) / 3600.0
+    durations = _grouped_percentiles(hours, labels, counts, percentiles)
+
+    counts = counts.reshape(num_groups, num_states)
+    durations = durations.reshape(num_groups, num_states, len(percentiles))
+    return Summary(by, groups, states, counts, list(percentiles), durations)
+
+
+def format_summary(summ, verbose=False):
+    """Format the results of `summarize` into lines of text.
+
+    The states in `const.STATE_KEYS` are always included, other states only when there are jobs
+    in them.  If `verbose`, the percentiles of elapsed time are included for each state.
+    """
+    lines = []
+    indent = "\t" if summ.key is None else "\t\t"
+    for gg, group in enumerate(summ.groups):
+        if summ.key is not None:
+            lines.append("{} '{}': {}".format(summ.key, group, summ.counts[gg].sum()))
+
+        for ss, state in enumerate(summ.states):
+            num = summ.counts[gg, ss]
+            if num == 0 and state not in const.STATE_KEYS:
+                continue
+            # Number of jobs in each state
+            lines.append("{}'{}': {}".format(indent, state, num))
+            # If verbose is enabled, elapsed time percentiles for each state
+            if verbose:
+                durs = np.nan_to_num(summ.durations[gg, ss])
+                stats = ["{}: {:8.4f} [hr]".format(_percentile_label(pp), dd)
+                         for pp, dd in zip(summ.percentiles, durs)]
+                lines.append(indent + "\t" + ", ".join(stats))
+
+    return lines
+
+
+def normalize_states(states):
+    """Remove additional information from 'State' values, e.g. 'CANCELLED by 56895'.
+    """
+    states = np.asarray(states, dtype=str)
+    if not len(states):
+        return states
+    return np.char.partition(states, ' by ')[..., 0]
+
+
+def state_codes(states):
+    """Convert 'State' values into indices of `const.SLURM_STATES`.
+
+    Unrecognized states are given the index `len(const.SLURM_STATES)` (i.e. `const.OTHER_STATE`).
+    Each distinct value is only looked up once.
+    """
+    uniq, inverse = np.unique(np.asarray(states, dtype=str), return_inverse=True)
+    uniq = normalize_states(uniq)
+    lookup = {ss: ii for ii, ss in enumerate(const.SLURM_STATES)}
+    other = len(const.SLURM_STATES)
+    codes = np.array([lookup.get(ss.rstrip('+'), other) for ss in uniq], dtype=np.int64)
+    return codes[inverse].reshape(-1)
+
+
+def summarize_nodes(table):
+    """Count the jobs, failed jobs and elapsed hours on each node (from the 'NodeList' field).
+
+    Each distinct node-list is expanded only once (see `hostlist.node_codes`), and the values
+    of all (row, node) pairs are then summed with `np.bincount`.  Only job allocations (not
+    job-steps) are included.
+
+    Returns
+    -------
+    summ : `NodeSummary`
+
+    """
+    from . import hostlist
+    table = table[table['JobID']['step'] == -1]
+    nodes, rows, codes = hostlist.node_codes(table['NodeList'])
+    num = len(nodes)
+
+    failed = np.isin(normalize_states(table['State']), const.NODE_FAILURE_STATES)
+    hours = np.maximum(table['Elapsed'], 0) / 3600.0
+    jobs = np.bincount(codes, minlength=num)
+    fails = np.bincount(codes, weights=failed[rows], minlength=num).astype(np.int64)
+    hours = np.bincount(codes, weights=hours[rows], minlength=num)
+    return NodeSummary(nodes, jobs, fails, hours)
+
+
+def format_node_summary(summ, top=None):
+    """Format the results of `summarize_nodes` into lines of text.
+
+    The `top` nodes with the most failed jobs (and the largest fraction of failures) are listed,
+    followed by a compact list of all nodes without any failures.
+    """
+    from . import hostlist
+    if top is None:
+        top = const.NODES_TOP
+
+    lines = ["Nodes: {}, with failed jobs: {}".format(len(summ.nodes), np.sum(summ.failed > 0))]
+    frac = summ.failed / np.maximum(summ.jobs, 1)
+    order = np.lexsort((summ.nodes, -frac, -summ.failed))[:top]
+    if len(order):
+        width = max(len(nn) for nn in summ.nodes[order])
+        lines.append("{:>{}s}  {:>8s}  {:>8s}  {:>8s}  {:>12s}".format(
+            "Node", width, "Jobs", "Failed", "Failed %", "Hours"))
+        for ii in order:
+            lines.append("{:>{}s}  {:8d}  {:8d}  {:8.1f}  {:12.2f}".format(
+                summ.nodes[ii], width, summ.jobs[ii], summ.failed[ii], 100*frac[ii],
+                summ.hours[ii]))
+
+    good = summ.nodes[summ.failed == 0]
+    if len(good):
+        lines.append("Nodes without failed jobs: " + hostlist.compress(good.tolist()))
+
+    return lines
+
+
+def collapse_arrays(table, max_ranges=None):
+    """Combine the tasks of each job-array into a single row, other jobs are kept as they are.
+
+    Each row gives the number of tasks, the number in each state (e.g. 'COMPLETED:9990,FAILED:10'),
+    the minimum, median and maximum elapsed time (of tasks which have started), and the ranges
+    of tasks in `const.ARRAY_FAILED_STATES`.  Rows are grouped by the integer components of their
+    JobIDs, and all values are computed with `np.bincount` and a single sort.  Pending tasks
+    (e.g. '123_[5-100]') are counted without being expanded.  Only job allocations (not job-steps)
+    are included.
+
+    Arguments
+    ---------
+    table : `JobTable`
+    max_ranges : int or None
+        Maximum number of ranges of failed tasks listed for each array (`None` for all).
+
+    Returns
+    -------
+    collapsed : `JobTable`
+        Fields: 'JobID' (e.g. '123_[*]' for arrays), 'JobName', 'Tasks', 'States',
+        'ElapsedMin', 'ElapsedMed', 'ElapsedMax', 'Failed'.
+
+    """
+    from collections import OrderedDict
+    from . import jobid, utils
+    from .table import JobTable
+
+    table = table[table['JobID']['step'] == jobid.NONE]
+    ids = table['JobID']
+    labels, first = _group_arrays(ids)
+    num = len(first)
+    is_array = (ids['task'] != jobid.NONE) | (ids['array'] != b'')
+
+    # Number of tasks (of each state) in each group
+    states = list(const.SLURM_STATES) + [const.OTHER_STATE]
+    codes = state_codes(table['State'])
+    tasks = _count_tasks(ids)
+    counts = np.bincount(labels * len(states) + codes, weights=tasks,
+                         minlength=num*len(states)).astype(np.int64).reshape(num, len(states))
+
+    # Percentiles of elapsed time of started tasks
+    started = (table['Elapsed'] >= 0) & (codes != const.SLURM_STATES.index('PENDING'))
+    ranks = np.bincount(labels[started], minlength=num)
+    elapsed = _grouped_percentiles(table['Elapsed'][started].astype(np.float64),
+                                   labels[started], ranks, [0, 50, 100])
+    elapsed = np.where(np.isfinite(elapsed), np.round(elapsed), -1).astype(np.int64)
+
+    # Ranges of failed tasks of each array
+    failed = [''] * num
+    sel = is_array & (ids['task'] != jobid.NONE)
+    sel &= np.isin(codes, [const.SLURM_STATES.index(ss) for ss in const.ARRAY_FAILED_STATES])
+    if np.any(sel):
+        order = np.lexsort((ids['task'][sel], labels[sel]))
+        grp = labels[sel][order]
+        vals = ids['task'][sel][order]
+        breaks = np.flatnonzero(np.diff(grp)) + 1
+        for gg, vv in zip(grp[np.concatenate([[0], breaks])], np.split(vals, breaks)):
+            ranges = utils.compress_ranges(vv).split(',')
+            if max_ranges is not None and len(ranges) > max_ranges:
+                ranges = ranges[:max_ranges] + ["... ({} ranges)".format(len(ranges))]
+            failed[gg] = ",".join(ranges)
+
+    # Identify each group by its first row
+    names = jobid.render_jobids(ids[first]).tolist()
+    array = is_array[first]
+    for ii in np.flatnonzero(array):
+        het = ids['het'][first[ii]]
+        names[ii] = "{}_[*]{}".format(ids['id'][first[ii]],
+                                      "" if het == jobid.NONE else "+{}".format(het))
+    # Format the state counts of groups in a single state (e.g. most jobs) together
+    multi = np.count_nonzero(counts, axis=1) > 1
+    main = np.argmax(counts, axis=1)
+    summary = np.char.add(np.char.add(np.array(states)[main], ':'),
+                          counts.max(axis=1).astype(str)).astype(object)
+    for ii in np.flatnonzero(multi):
+        summary[ii] = ",".join("{}:{}".format(states[ss], counts[ii, ss])
+                               for ss in np.flatnonzero(counts[ii]))
+    summary = summary.astype(str)
+
+    columns = OrderedDict([
+        ('JobID', np.array(names, dtype=str)),
+        ('JobName', table['JobName'][first]),
+        ('Tasks', counts.sum(axis=1)),
+        ('States', summary),
+        ('ElapsedMin', elapsed[:, 0]),
+        ('ElapsedMed', elapsed[:, 1]),
+        ('ElapsedMax', elapsed[:, 2]),
+        ('Failed', np.array(failed, dtype=str)),
+    ])
+    types = {'Tasks': 'count', 'ElapsedMin': 'duration', 'ElapsedMed': 'duration',
+             'ElapsedMax': 'duration'}
+    return JobTable(columns, types=types)
+
+
+def _group_arrays(ids):
+    """Label the tasks of each job-array by the same integer, and each other job by its own.
+
+    Groups are numbered in the order of their first row.
+
+    Returns
+    -------
+    labels : (N,) np.ndarray of int
+        Group of each row.
+    first : (G,) np.ndarray of int
+        Index of the first row of each group.
+
+    """
+    from . import jobid
+    num = len(ids)
+    is_array = (ids['task'] != jobid.NONE) | (ids['array'] != b'')
+    # Jobs which are not arrays are distinguished by their row number
+    single = np.where(is_array, -1, np.arange(num))
+    order = np.lexsort((single, ids['het'], ids['id']))
+    new = np.ones(num, dtype=bool)
+    new[1:] = ((ids['id'][order][1:] != ids['id'][order][:-1]) |
+               (ids['het'][order][1:] != ids['het'][order][:-1]) |
+               (single[order][1:] != single[order][:-1]))
+    labels = np.empty(num, dtype=np.int64)
+    labels[order] = np.cumsum(new) - 1
+
+    # Renumber groups in the order of their first row
+    first = np.full(np.count_nonzero(new), num, dtype=np.int64)
+    np.minimum.at(first, labels, np.arange(num))
+    rank = np.argsort(first, kind='stable')
+    relabel = np.empty_like(rank)
+    relabel[rank] = np.arange(len(rank))
+    return relabel[labels], first[rank]
+
+
+def _count_tasks(ids):
+    """Number of tasks of each row: one, or the size of a (pending) array specification.
+    """
+    from . import jobid
+    tasks = np.ones(len(ids), dtype=np.int64)
+    pending = np.flatnonzero((ids['task'] == jobid.NONE) & (ids['array'] != b''))
+    if len(pending):
+        uniq, inverse = np.unique(ids['array'][pending], return_inverse=True)
+        sizes = np.array([sum(hi - lo + 1 for lo, hi in jobid._parse_tasks(uu.decode()))
+                          for uu in uniq], dtype=np.int64)
+        tasks[pending] = sizes[inverse.reshape(-1)]
+
+    return tasks
+
+
+def _grouped_percentiles(values, labels, counts, percentiles):
+    """Percentiles of `values` within each group, where `labels` index into `counts`.
+
+    Uses linear interpolation between the closest ranks (the same as `np.percentile`).
+
+    Returns
+    -------
+    result : (len(counts), len(percentiles)) array, NaN for empty groups
+
+    """
+    order = np.lexsort((values, labels))
+    values = values[order]
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    valid = (counts > 0)
+
+    result = np.full((len(counts), len(percentiles)), np.nan)
+    starts = starts[valid]
+    last = counts[valid] - 1
+    for ii, pp in enumerate(percentiles):
+        pos = last * (pp / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        frac = pos - lo
+        result[valid, ii] = values[starts + lo] * (1 - frac) + values[starts + hi] * frac
+
+    return result
+
+
+def _percentile_label(pp):
+    if pp == 0:
+        return "min"
+    elif pp == 50:
+        return "med"
+    elif pp == 100:
+        return "max"
+    return "p{:g}".format(pp)
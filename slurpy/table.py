@@ -0,0 +1,523 @@
+"""Columnar storage for the parsed results of SLURM commands.
+
+Classes
+-------
+-   JobTable              - Table of jobs, stored as one typed `numpy` array per field.
+
+Functions
+---------
+-   convert_column        - Convert a sequence of strings into a typed array for the given type.
+-   render_column         - Convert a typed array back into strings for display.
+-   parse_sort_keys       - Parse a sort specification (e.g. 'State,-Elapsed') into fields.
+
+-   _missing_value        - Value used for missing entries of each type of column.
+-   _sort_keys            - Integer or float keys which sort a typed column.
+-   _isin_rows            - Which rows of a table match any row of another (e.g. for `update`).
+-   _partial_candidates   - Rows which can be among the first/last rows once sorted.
+-   _parse_counts         - Convert strings of integers (e.g. 'AllocCPUS') into integers.
+-   _parse_memory         - Convert memory-strings (e.g. '4000Mn') into a number of bytes.
+-   _render_*             - Convert each type of column back into strings.
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+from . import const
+from . import jobid
+from . import times
+
+_MEMORY_UNITS = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40, 'P': 2**50}
+_MEMORY_UNITS_ORDER = ['', 'K', 'M', 'G', 'T', 'P']
+
+
+class JobTable(object):
+    """Table of jobs, stored as one typed `numpy` array per field (column).
+
+    Columns are retrieved by field name, e.g. `table['State']`.  Indexing with an integer array,
+    slice or boolean mask returns a new `JobTable` containing only the selected rows.
+
+    Attributes
+    ----------
+    header : list of str
+        Names of each field, in order.
+    columns : `OrderedDict` of `np.ndarray`
+        Array of values for each field in `header`.
+    types : dict
+        Type of each field (e.g. 'time', 'duration', 'memory'), see `convert_column`.
+
+    """
+
+    def __init__(self, columns, header=None, types=None):
+        if header is None:
+            header = list(columns.keys())
+        if types is None:
+            types = {}
+
+        self.header = list(header)
+        self.columns = OrderedDict((kk, np.asarray(columns[kk])) for kk in self.header)
+        self.types = OrderedDict((kk, types.get(kk)) for kk in self.header)
+
+        sizes = set(len(vv) for vv in self.columns.values())
+        if len(sizes) > 1:
+            raise ValueError("Column lengths do not match: {}".format(
+                [(kk, len(vv)) for kk, vv in self.columns.items()]))
+        return
+
+    @classmethod
+    def from_rows(cls, rows, header, types=None):
+        """Construct a table from rows of strings, each with one value per field in `header`.
+        """
+        if types is None:
+            types = const.SACCT_KEYS_TYPES
+
+        values = [[] for kk in header]
+        for row in rows:
+            for vals, vv in zip(values, row):
+                vals.append(vv)
+
+        return cls.from_columns(values, header, types=types)
+
+    @classmethod
+    def from_columns(cls, values, header, types=None):
+        """Construct a table from one sequence of strings per field in `header`.
+        """
+        if types is None:
+            types = const.SACCT_KEYS_TYPES
+
+        columns = OrderedDict()
+        for kk, vals in zip(header, values):
+            columns[kk] = convert_column(vals, types.get(kk))
+
+        return cls(columns, header, types=types)
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Combine the rows of multiple tables (with matching headers) into a single table.
+        """
+        tables = list(tables)
+        if not len(tables):
+            raise ValueError("No tables to concatenate!")
+
+        first = tables[0]
+        columns = OrderedDict()
+        for kk in first.header:
+            columns[kk] = np.concatenate([tt.columns[kk] for tt in tables])
+
+        return cls(columns, first.header, types=first.types)
+
+    def __len__(self):
+        if not len(self.columns):
+            return 0
+        return len(next(iter(self.columns.values())))
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        return self.take(key)
+
+    def __repr__(self):
+        return "JobTable({} rows: {})".format(len(self), ", ".join(self.header))
+
+    def take(self, idx):
+        """Return a new table containing only the rows selected by index-array, slice or mask.
+        """
+        columns = OrderedDict((kk, vv[idx]) for kk, vv in self.columns.items())
+        return JobTable(columns, self.header, types=self.types)
+
+    def head(self, num):
+        """Return a new table with only the first `num` rows.
+        """
+        return self.take(slice(None, num))
+
+    def tail(self, num):
+        """Return a new table with only the last `num` rows.
+        """
+        return self.take(slice(max(len(self) - num, 0), None))
+
+    def argsort(self, keys, head=None, tail=None):
+        """Return the indices which (stably) sort this table by one or more fields.
+
+        Each field is converted once into numerical sort keys based on its type (see
+        `_sort_keys`), and all fields are sorted together by a single `np.lexsort`.  Missing
+        values (e.g. 'NaT' times) are placed last, in either direction.
+
+        If `head` and/or `tail` are given, only the indices of the first `head` and/or last
+        `tail` rows (in sorted order) are returned.  These are found without sorting the full
+        table: only the rows which can be among them (see `_partial_candidates`) are sorted.
+
+        Arguments
+        ---------
+        keys : str or list of str
+            Fields to sort by, in order of priority, each prefixed with '-' to reverse-sort,
+            e.g. 'State,-Elapsed'.  See `parse_sort_keys`.
+        head : int or None
+        tail : int or None
+
+        Returns
+        -------
+        idx : (N,) np.ndarray of int
+
+        """
+        fields = [_sort_keys(self.columns[key], self.types.get(key), reverse)
+                  for key, reverse in parse_sort_keys(keys, self.header)]
+        sort_keys = [kk for ff in fields for kk in ff]
+        if (head is None and tail is None) or not len(fields):
+            # `np.lexsort` uses the *last* key as the primary one
+            return np.lexsort(sort_keys[::-1])
+
+        cand = _partial_candidates(fields[0], head=head, tail=tail)
+        idx = cand[np.lexsort([kk[cand] for kk in sort_keys[::-1]])]
+        pos = np.arange(len(idx))
+        sel = np.zeros(len(idx), dtype=bool)
+        if head is not None:
+            sel |= (pos < head)
+        if tail is not None:
+            sel |= (pos >= len(idx) - tail)
+        return idx[sel]
+
+    def sort(self, keys, head=None, tail=None):
+        """Return a new table sorted by the given fields (or only its first `head` and/or last
+        `tail` rows), see `argsort`.
+        """
+        return self.take(self.argsort(keys, head=head, tail=tail))
+
+    def update(self, other, key='JobID'):
+        """Return a new table where rows matching those of `other` (by `key`) are replaced.
+
+        `key` is a field, or a list of fields which must all match (e.g. `['Cluster', 'JobID']`).
+        Rows of `other` which do not match any in this table are appended at the end.  Rows are
+        matched by their typed values (see `_isin_rows`), without converting them to strings.
+        """
+        keep = ~_isin_rows(self, other, key)
+        return JobTable.concatenate([self.take(keep), other])
+
+    def join(self, other, fields, key='JobID'):
+        """Return a new table with the given `fields` of `other` added to each matching row.
+
+        Rows are matched by their value of `key`, using a hash table of the rows of `other` (a
+        left join: all rows of this table are kept).  Fields of rows without a match are given
+        missing values (e.g. 'NaT' for times, -1 for durations, '' for strings).
+        """
+        # Structured (e.g. 'jobid') and plain values both convert to hashable python values
+        lookup = {kk: ii for ii, kk in enumerate(other[key].tolist())}
+        idx = np.array([lookup.get(kk, -1) for kk in self[key].tolist()], dtype=np.int64)
+        found = (idx >= 0)
+
+        columns = OrderedDict(self.columns)
+        types = dict(self.types)
+        header = list(self.header)
+        for ff in fields:
+            type = other.types.get(ff)
+            col = np.full(len(self), _missing_value(type), dtype=other[ff].dtype)
+            col[found] = other[ff][idx[found]]
+            if ff not in columns:
+                header.append(ff)
+            columns[ff] = col
+            types[ff] = type
+
+        return JobTable(columns, header, types=types)
+
+    def select_fields(self, keys):
+        """Return a new table with only the fields in `keys` (the arrays themselves are shared).
+        """
+        header = [kk for kk in self.header if kk in keys]
+        columns = OrderedDict((kk, self.columns[kk]) for kk in header)
+        return JobTable(columns, header, types=self.types)
+
+    def render(self, key):
+        """Return the values of the field `key` as an array of strings for display.
+        """
+        return render_column(self.columns[key], self.types.get(key))
+
+    def write(self, path=None, fmt='csv'):
+        """Write this table to a file (or stdout) in a machine-readable format, see `export`.
+        """
+        from . import export
+        export.write_table(self, fmt, path=path)
+        return
+
+    def rows(self):
+        """Iterate over rows, each an `OrderedDict` of display strings for each field.
+        """
+        strings = [self.render(kk) for kk in self.header]
+        for vals in zip(*strings):
+            yield OrderedDict(zip(self.header, vals))
+
+
+def convert_column(values, type=None):
+    """Convert a sequence of strings into a typed array.
+
+    Arguments
+    ---------
+    values : (N,) sequence of str
+    type : str or None
+        One of: 'jobid', 'time', 'duration', 'memory', 'count'; or `None` to keep values as
+        strings.
+
+    Returns
+    -------
+    column : (N,) np.ndarray
+
+    """
+    if type is None:
+        return np.array(values, dtype=str)
+    elif type == 'jobid':
+        return jobid.parse_jobids(values)
+    elif type == 'time':
+        return times.parse_times(values)
+    elif type == 'duration':
+        return times.parse_durations(values)
+    elif type == 'memory':
+        return _parse_memory(values)
+    elif type == 'count':
+        return _parse_counts(values)
+
+    raise ValueError("Unrecognized column type '{}'".format(type))
+
+
+def render_column(column, type=None):
+    """Convert a typed array into an array of strings for display.
+    """
+    if type is None:
+        return column
+    elif type == 'jobid':
+        return jobid.render_jobids(column)
+    elif type == 'time':
+        return times.render_times(column)
+    elif type == 'duration':
+        return times.render_durations(column)
+    elif type == 'memory':
+        return _render_memory(column)
+    elif type == 'count':
+        return _render_counts(column)
+
+    raise ValueError("Unrecognized column type '{}'".format(type))
+
+
+def parse_sort_keys(spec, header):
+    """Parse a sort specification into a list of (field, reverse) pairs.
+
+    Arguments
+    ---------
+    spec : str or list of str
+        Comma-separated field names, each prefixed with '-' to reverse-sort (e.g.
+        'State,-Elapsed').  Field names are matched case-insensitively.
+    header : list of str
+        Names of the available fields.
+
+    Returns
+    -------
+    keys : list of (str, bool)
+
+    Raises
+    ------
+    ValueError
+        If the specification is empty, or includes a field which is not in `header`.
+
+    """
+    if isinstance(spec, str):
+        spec = spec.split(',')
+
+    names = {kk.lower(): kk for kk in header}
+    keys = []
+    for term in spec:
+        term = term.strip()
+        reverse = term.startswith('-')
+        name = term.lstrip('-+').strip()
+        if name.lower() not in names:
+            raise ValueError("Cannot sort by '{}': options are '{}'".format(
+                name, "', '".join(header)))
+        keys.append((names[name.lower()], reverse))
+
+    if not len(keys):
+        raise ValueError("No fields to sort by in '{}'".format(",".join(spec)))
+
+    return keys
+
+
+def _sort_keys(column, type, reverse=False):
+    """Return numerical keys which sort the given typed column (first key is the primary one).
+
+    Each column gives a key which places missing values last, followed by its values:
+    the integer fields of JobIDs, the integer times and durations, memory values, or the rank
+    of each string.  Keys are negated to reverse-sort, so that the sort remains stable.
+
+    Returns
+    -------
+    keys : list of (N,) np.ndarray
+
+    """
+    if type == 'jobid':
+        missing = column['id'] < 0
+        values = [column[ff] for ff in ['id', 'task', 'het', 'step']]
+    elif type == 'time':
+        missing = np.isnat(column)
+        values = [np.where(missing, 0, column.view(np.int64))]
+    elif type in ['duration', 'count']:
+        missing = column < 0
+        values = [column]
+    elif type == 'memory':
+        missing = ~np.isfinite(column)
+        values = [np.where(missing, 0.0, column)]
+    else:
+        missing = None
+        values = [np.unique(column, return_inverse=True)[1].reshape(-1)]
+
+    if reverse:
+        values = [np.negative(vv, dtype=np.float64 if vv.dtype.kind == 'f' else np.int64)
+                  for vv in values]
+    if missing is not None:
+        values = [missing.astype(np.int8)] + values
+
+    return values
+
+
+def _isin_rows(table, other, key):
+    """Boolean mask of the rows of `table` whose values of `key` (a field, or list of fields)
+    match those of any row of `other`.
+
+    Each typed column (including each integer field of JobIDs) is compared separately with the
+    sorted, distinct values of `other` (e.g. the delta of a refresh, which is usually small), so
+    that no values are converted into strings.  Only the rows which match in every column are
+    then compared as whole rows.
+    """
+    keys = [key] if isinstance(key, str) else list(key)
+    mine = []
+    theirs = []
+    for kk in keys:
+        aa, bb = np.asarray(table[kk]), np.asarray(other[kk])
+        if aa.dtype.names is None:
+            mine.append(aa)
+            theirs.append(bb)
+        else:
+            mine.extend(aa[ff] for ff in aa.dtype.names)
+            theirs.extend(bb[ff] for ff in bb.dtype.names)
+
+    found = np.ones(len(table), dtype=bool)
+    if not len(other):
+        return ~found
+
+    codes = []
+    refs = []
+    for aa, bb in zip(mine, theirs):
+        uniq = np.unique(bb)
+        pos = np.minimum(np.searchsorted(uniq, aa), len(uniq) - 1)
+        found &= (uniq[pos] == aa)
+        codes.append(pos)
+        refs.append(np.searchsorted(uniq, bb))
+
+    idx = np.flatnonzero(found)
+    if not len(idx):
+        return found
+
+    rows = np.stack([cc[idx] for cc in codes], axis=1)
+    _, inverse = np.unique(np.concatenate([rows, np.stack(refs, axis=1)]), axis=0,
+                           return_inverse=True)
+    inverse = inverse.reshape(-1)
+    found[idx] = np.isin(inverse[:len(idx)], inverse[len(idx):])
+    return found
+
+
+def _partial_candidates(keys, head=None, tail=None):
+    """Indices of the rows which can be among the first `head` and/or last `tail` rows once
+    sorted, using only the keys of the primary sort field (from `_sort_keys`).
+
+    The boundary values are found with `np.partition` (in linear time), and all rows tied with
+    them are included, so that (stably) sorting only these rows by all keys gives the same first
+    and last rows as sorting the full table.  A leading missing-value key is combined with the
+    first value key (missing values become `+inf`).
+
+    Returns
+    -------
+    idx : (M,) np.ndarray of int
+        Increasing indices of the candidate rows.
+
+    """
+    primary = keys[0]
+    if primary.dtype == np.int8 and len(keys) > 1:
+        primary = np.where(primary > 0, np.inf, keys[1].astype(np.float64))
+
+    num = len(primary)
+    sel = np.zeros(num, dtype=bool)
+    if head is not None and head > 0:
+        if head >= num:
+            return np.arange(num)
+        kth = np.partition(primary, head - 1)[head - 1]
+        sel |= (primary <= kth)
+    if tail is not None and tail > 0:
+        if tail >= num:
+            return np.arange(num)
+        kth = np.partition(primary, num - tail)[num - tail]
+        sel |= (primary >= kth)
+
+    return np.flatnonzero(sel)
+
+
+def _missing_value(type):
+    """Value used for missing entries of a column of the given type.
+    """
+    if type == 'time':
+        return np.datetime64('NaT')
+    elif type in ['duration', 'count']:
+        return -1
+    elif type == 'memory':
+        return np.nan
+    elif type == 'jobid':
+        return jobid.parse_jobids([''])[0]
+    return ''
+
+
+def _parse_counts(values):
+    """Convert strings of (non-negative) integers into `int64`, -1 if invalid (e.g. '').
+    """
+    uniq, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    counts = np.array([int(vv) if vv.isdigit() else -1 for vv in uniq], dtype=np.int64)
+    return counts[inverse].reshape(-1)
+
+
+def _parse_memory(values):
+    """Convert memory strings (e.g. '1234K', '4000Mn', '16Gc') into bytes (NaN if invalid).
+    """
+    uniq, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    nbytes = np.array([_parse_memory_value(vv) for vv in uniq], dtype=np.float64)
+    return nbytes[inverse].reshape(-1)
+
+
+def _parse_memory_value(value):
+    # Remove per-node ('n') or per-cpu ('c') specifiers
+    value = value.rstrip('nc')
+    if not len(value):
+        return np.nan
+
+    unit = value[-1].upper()
+    if unit in _MEMORY_UNITS:
+        value = value[:-1]
+    else:
+        unit = ''
+
+    try:
+        return float(value) * _MEMORY_UNITS[unit]
+    except ValueError:
+        return np.nan
+
+
+def _render_counts(column):
+    strings = column.astype(str)
+    strings[column < 0] = ''
+    return strings
+
+
+def _render_memory(column):
+    valid = np.isfinite(column) & (column > 0)
+    expon = np.zeros(column.shape, dtype=int)
+    expon[valid] = np.clip(np.floor(np.log2(column[valid]) / 10).astype(int),
+                           0, len(_MEMORY_UNITS_ORDER) - 1)
+    vals = np.where(valid, column / 1024.0**expon, 0.0)
+    strings = np.array(["{:.0f}{}".format(vv, _MEMORY_UNITS_ORDER[ee]) if vv >= 10 else
+                        "{:.1f}{}".format(vv, _MEMORY_UNITS_ORDER[ee]).replace('.0', '')
+                        for vv, ee in zip(vals, expon)], dtype=str)
+    strings[~np.isfinite(column)] = ''
+    return strings
@@ -0,0 +1,215 @@
+"""Convert columns of SLURM time-strings into typed arrays, and back into strings for display.
+
+Whole columns are converted at once.  Times ('YYYY-MM-DDTHH:MM:SS') have a fixed layout, so
+their characters are read directly as an array of codes and converted with integer arithmetic
+(without parsing each string).  Durations ('[DD-]HH:MM:SS') are converted in the same way when
+they have the standard layout (right-aligned on 'HH:MM:SS'), or when they are a plain number of
+seconds (e.g. 'CPUTimeRAW').  Any other values (e.g. 'TotalCPU' like '12:34.567') are parsed
+individually, with an LRU cache of `const.TIME_CACHE_SIZE` values, as they repeat heavily.
+
+Times are stored as `datetime64[s]` ('NaT' if invalid, e.g. 'Unknown'), and durations as an
+integer number of seconds (-1 if invalid), see `slurpy.table`.  Display formatting (e.g.
+`const.REFORMAT_TIMES`) is only applied by `render_times`, i.e. to the rows being printed.
+
+Functions
+---------
+-   parse_times           - Convert 'YYYY-MM-DDTHH:MM:SS' strings into `datetime64` values.
+-   parse_durations       - Convert '[DD-]HH:MM:SS' strings into integer numbers of seconds.
+-   parse_duration        - Convert a single duration string into seconds (memoized).
+-   render_times          - Convert `datetime64` values into strings for display.
+-   render_durations      - Convert numbers of seconds into '[D-]HH:MM:SS' strings.
+
+-   _char_codes           - View an array of strings as a 2D array of (offset) character codes.
+-   _days_from_civil      - Number of days since 1970-01-01 of each (year, month, day).
+"""
+
+import functools
+import numpy as np
+
+from . import const
+
+TIME_LEN = len('YYYY-MM-DDTHH:MM:SS')
+
+# Positions of the digits and separators in times, and in (the last 8 characters of) durations
+_TIME_DIGITS = [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]
+_TIME_SEPS = [(4, '-'), (7, '-'), (10, 'T'), (13, ':'), (16, ':')]
+_CLOCK_LEN = len('HH:MM:SS')
+_CLOCK_DIGITS = [0, 1, 3, 4, 6, 7]
+# Largest number of digits of the days in a duration (e.g. 'DDD-HH:MM:SS')
+_DAYS_MAX_DIGITS = 3
+# Number of days in each month (indexed by month, in a leap year)
+_MONTH_DAYS = np.array([0, 31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def parse_times(values):
+    """Convert 'YYYY-MM-DDTHH:MM:SS' strings into `datetime64[s]`, invalid values become 'NaT'.
+
+    The digits of all values are converted together (see `_char_codes`), values which do not
+    have exactly this layout (e.g. 'Unknown', 'None'), or which are not real times (e.g.
+    '2017-02-30T00:00:00') are invalid.
+    """
+    # Keep one extra character, so that longer values are not truncated into valid ones
+    values = np.asarray(values, dtype='U{}'.format(TIME_LEN + 1)).reshape(-1)
+    times = np.full(values.shape, np.datetime64('NaT'), dtype='datetime64[s]')
+    if not len(values):
+        return times
+
+    codes = _char_codes(values)
+    # Digits (as unsigned integers, so that any other characters are larger than 9)
+    digits = codes[:, _TIME_DIGITS].view(np.uint32)
+    valid = np.all(digits <= 9, axis=1) & (codes[:, TIME_LEN] == -ord('0'))
+    for ii, sep in _TIME_SEPS:
+        valid &= (codes[:, ii] == ord(sep) - ord('0'))
+    if not np.any(valid):
+        return times
+
+    # Combine pairs of digits: (YY, YY, MM, DD, hh, mm, ss)
+    digits = digits[valid].astype(np.int32).reshape(-1, len(_TIME_DIGITS) // 2, 2)
+    pairs = digits[:, :, 0]*10 + digits[:, :, 1]
+    year = pairs[:, 0]*100 + pairs[:, 1]
+    month, day, hour, mins, secs = pairs[:, 2:].T
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    ok = ((month >= 1) & (month <= 12) & (day >= 1) &
+          (day <= _MONTH_DAYS[np.clip(month, 0, 12)] - ((month == 2) & ~leap)) &
+          (hour < 24) & (mins < 60) & (secs < 60))
+    epoch = _days_from_civil(year, month, day).astype(np.int64)*86400
+    epoch += (hour*60 + mins)*60 + secs
+
+    idx = np.flatnonzero(valid)
+    times[idx[ok]] = epoch[ok].astype('datetime64[s]')
+    return times
+
+
+def parse_durations(values):
+    """Convert '[DD-]HH:MM:SS' strings (or plain seconds) into integer seconds (-1 if invalid).
+
+    Values with the standard layout, or which are plain integers, are converted together; any
+    others (e.g. 'MM:SS.sss', or 'UNLIMITED') are converted by `parse_duration`.
+    """
+    values = np.asarray(values, dtype=str).reshape(-1)
+    secs = np.full(values.shape, -1, dtype=np.int64)
+    if not len(values):
+        return secs
+
+    lens = np.char.str_len(values)
+    done = np.zeros(len(values), dtype=bool)
+
+    # Plain numbers of seconds (e.g. 'CPUTimeRAW')
+    plain = np.char.isdigit(values) & (lens <= 18)
+    if np.any(plain):
+        secs[plain] = values[plain].astype(np.int64)
+        done |= plain
+
+    # '[DDD-]HH:MM:SS', right-aligned on the last 8 characters
+    width = values.dtype.itemsize // 4
+    fixed = ~done & (lens >= _CLOCK_LEN) & (lens <= _CLOCK_LEN + _DAYS_MAX_DIGITS + 1)
+    fixed &= (lens != _CLOCK_LEN + 1)
+    if width >= _CLOCK_LEN and np.any(fixed):
+        idx = np.flatnonzero(fixed)
+        codes = _char_codes(values[idx])
+        rows = np.arange(len(idx))
+        base = lens[idx] - _CLOCK_LEN
+        clock = codes[rows[:, np.newaxis], base[:, np.newaxis] + np.arange(_CLOCK_LEN)]
+        # Digits (as unsigned integers, so that any other characters are larger than 9)
+        digits = clock[:, _CLOCK_DIGITS].view(np.uint32)
+        ok = np.all(digits <= 9, axis=1)
+        ok &= (clock[:, 2] == ord(':') - ord('0')) & (clock[:, 5] == ord(':') - ord('0'))
+
+        # Days (if any) are separated by a '-' before the clock
+        ndays = np.maximum(base - 1, 0)
+        ok &= (base == 0) | (codes[rows, ndays] == ord('-') - ord('0'))
+        days = np.zeros(len(idx), dtype=np.int64)
+        for ii in range(_DAYS_MAX_DIGITS):
+            sel = (ndays > ii)
+            dig = codes[sel, ii].view(np.uint32)
+            ok[sel] &= (dig <= 9)
+            days[sel] = days[sel]*10 + dig
+
+        digits = digits.astype(np.int64)
+        hours = digits[:, 0]*10 + digits[:, 1]
+        mins = digits[:, 2]*10 + digits[:, 3]
+        sec = digits[:, 4]*10 + digits[:, 5]
+        vals = ((days*24 + hours)*60 + mins)*60 + sec
+        secs[idx[ok]] = vals[ok]
+        done[idx[ok]] = True
+
+    # All other values, individually
+    for ii in np.flatnonzero(~done):
+        secs[ii] = parse_duration(values[ii])
+
+    return secs
+
+
+@functools.lru_cache(maxsize=const.TIME_CACHE_SIZE)
+def parse_duration(value):
+    """Convert a single '[DD-]HH:MM:SS' string into an integer number of seconds (-1 if invalid).
+
+    Hours and minutes are optional, and fractions of seconds are dropped (e.g. 'TotalCPU' values
+    like '12:34.567').
+    """
+    value = str(value)
+    days = 0
+    try:
+        if '-' in value:
+            days, value = value.split('-', 1)
+            days = int(days)
+        comps = [int(vv) for vv in value.split('.')[0].split(':')]
+    except ValueError:
+        return -1
+
+    if len(comps) > 3:
+        return -1
+
+    # Pad missing hours (and minutes), e.g. 'MM:SS'
+    comps = [0]*(3 - len(comps)) + comps
+    hh, mm, ss = comps
+    return ((days*24 + hh)*60 + mm)*60 + ss
+
+
+def render_times(column):
+    """Convert `datetime64` values into strings for display ('Unknown' for 'NaT').
+
+    The 'T' separator is replaced (by `const.REFORMAT_TIMES_SEP_CHAR`) if `const.REFORMAT_TIMES`.
+    """
+    strings = np.datetime_as_string(column, unit='s')
+    strings[np.isnat(column)] = 'Unknown'
+    if const.REFORMAT_TIMES:
+        strings = np.char.replace(strings, 'T', const.REFORMAT_TIMES_SEP_CHAR)
+    return strings
+
+
+def render_durations(column):
+    """Convert integer numbers of seconds into '[D-]HH:MM:SS' strings ('' if negative).
+    """
+    days, secs = np.divmod(column, 24*3600)
+    hours, secs = np.divmod(secs, 3600)
+    mins, secs = np.divmod(secs, 60)
+    strings = ["{}-{:02d}:{:02d}:{:02d}".format(dd, hh, mm, ss) if dd > 0 else
+               "{:02d}:{:02d}:{:02d}".format(hh, mm, ss)
+               for dd, hh, mm, ss in zip(days, hours, mins, secs)]
+    strings = np.array(strings, dtype=str)
+    strings[column < 0] = ''
+    return strings
+
+
+def _char_codes(values):
+    """View an (N,) array of strings as an (N, width) array of character codes minus `ord('0')`.
+
+    Digits become their values (0-9), and padding (after the end of shorter strings) is
+    `-ord('0')`.
+    """
+    width = values.dtype.itemsize // 4
+    values = np.ascontiguousarray(values)
+    return values.view(np.int32).reshape(len(values), width) - ord('0')
+
+
+def _days_from_civil(year, month, day):
+    """Number of days since 1970-01-01 of each (proleptic Gregorian) date, with integer arrays.
+    """
+    # Count years from March, so that leap days are at the end of each year
+    year = year - (month <= 2)
+    era = np.floor_divide(year, 400)
+    yoe = year - era*400
+    doy = (153*((month + 9) % 12) + 2)//5 + day - 1
+    doe = yoe*365 + yoe//4 - yoe//100 + doy
+    return era*146097 + doe - 719468
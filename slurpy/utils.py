@@ -2,102 +2,282 @@
 
 Functions
 ---------
--   print_lines_dicts        - Print each line of `sacct` results.  Format nicely.
+-   print_table              - Print each row of a `JobTable` (e.g. `sacct` results).  Format nicely.
+-   print_table_stream       - Print the rows of each `JobTable` from an iterator as they arrive.
+-   format_table             - Format each row of a `JobTable` into lines of text.
 -   prompt_yes_no            - Prompt a yes/no question via input() and return their answer.
+-   compress_ranges          - Combine integers into a compact range string, e.g. '1-5,8'.
+-   map_bounded              - Apply a function to each item, with a bounded number of threads.
+-   iter_head                - Yield tables from an iterator until a total number of rows is reached.
+-   iter_tail                - Yield only the last rows of the tables from an iterator.
 
--   _format_line             -
--   _calculate_formatting    -
-
+-   _filter_fields           - Select only the desired fields of a table.
+-   _select_head_tail        - Select only the first and/or last rows of a table.
+-   _calculate_widths        - Calculate the width of each column of strings.
+-   _format_header           -
+-   _format_columns          - Combine columns of strings into (right-justified) lines of text.
+-   _write_lines             - Write lines of text in large chunks.
 
+NOTE: `numpy` is imported only within the functions which use it, so that importing this module
+(e.g. for `prompt_yes_no`) stays fast.
 """
-import os
-import numpy as np
-from collections import OrderedDict
-
 from . import const
 
 
-def print_lines_dicts(_lines, _header, args):
-    """Print each line (containing a dict) of `sacct` results.  Format nicely.
+def print_table(table, args, stream=None, keys=const.SACCT_KEYS_PRINT):
+    """Print each row of the given `JobTable` (e.g. `sacct` results).  Format nicely.
+
+    Rows are formatted column-by-column (see `format_table`), and written in chunks of
+    `const.OUTPUT_CHUNK_SIZE` lines at a time.
+    """
+    from . import profiling
+    with profiling.stage('format', rows_in=len(table)) as entry:
+        lines = format_table(table, args, keys=keys)
+        entry.rows_out = len(lines)
+    _write_lines(lines, stream=stream)
+    return
+
+
+def print_table_stream(tables, args, stream=None, keys=const.SACCT_KEYS_PRINT):
+    """Print the rows of each `JobTable` in `tables` (e.g. chunks of `sacct` results) as they arrive.
+
+    Column widths are estimated from (up to) the first `const.FORMAT_SAMPLE_SIZE` rows, so
+    printing begins as soon as the first table is available.  Longer values in later rows are
+    not truncated, they extend their column.  With `args.head`, reading stops once enough rows
+    have been printed.  With `args.tail`, only the last rows are kept (see `iter_tail`), and they
+    are printed once all tables have been read.  Using both is not supported.
+    """
+    from . import profiling
+    if args.verbose:
+        keys = None
+    if args.head is not None:
+        tables = iter_head(tables, int(args.head))
+    elif args.tail is not None:
+        tables = iter_tail(tables, int(args.tail))
+
+    sizes = None
+    for table in tables:
+        if not len(table):
+            continue
+
+        with profiling.stage('format', rows_in=len(table)) as entry:
+            table = _filter_fields(table, keys=keys)
+            header = table.header
+            columns = [table.render(kk) for kk in header]
+            lines = []
+            if sizes is None:
+                sizes = _calculate_widths([cc[:const.FORMAT_SAMPLE_SIZE] for cc in columns],
+                                          header)
+                lines.append(_format_header(header, sizes))
+            lines.extend(_format_columns(columns, sizes))
+            entry.rows_out = len(lines)
+
+        # Stop if output is no longer being read (e.g. piped into `head`)
+        if not _write_lines(lines, stream=stream):
+            break
+
+    return
+
+
+def format_table(table, args, keys=const.SACCT_KEYS_PRINT):
+    """Format the rows of the given `JobTable` into lines of text, starting with the header.
+
+    Only the fields in `keys` are included, unless `args.verbose`.
     """
     # If there are no selected lines, return
-    if not len(_lines):
-        return
+    if not len(table):
+        return []
 
     # Filter out which keys are printed
     # ---------------------------------
     # If verbose print all keys (`keys = None`)
     if args.verbose:
         keys = None
-    else:
-        keys = const.SACCT_KEYS_PRINT
-    lines, header = _filter_fields_in_lines(_lines, _header, keys=keys)
+    table = _filter_fields(table, keys=keys)
 
     # Only include the first/last some-number of lines
-    if args.head is not None or args.tail is not None:
-        hh = int(args.head) if (args.head is not None) else None
-        tt = int(args.tail) if (args.tail is not None) else None
-        num_lines = len(lines)
-        lines = [ll for ii, ll in enumerate(lines)
-                 if ((hh is None or ii < hh) or
-                     (tt is None or ii >= num_lines - tt))]
-
-    # Calculate the proper formatting specification string
-    form = _calculate_formatting(lines, header)
-
-    # If we are in 'watch' mode (with repeated output), then clear the screen before printing
-    #    This should happen here to minimize the delay between clearing and printing
-    if (args.watch is not None) and args.clear:
-        os.system('cls' if os.name == 'nt' else 'clear')
-    # Print header
-    print(form.format(*header))
-    # Print each line
-    for ll in lines:
-        pstr = _format_line(ll, form)
-        print(pstr)
+    table = _select_head_tail(table, args.head, args.tail)
+
+    # Convert only the printed rows into strings
+    header = table.header
+    columns = [table.render(kk) for kk in header]
+    # Calculate the width of each column
+    sizes = _calculate_widths(columns, header)
+
+    lines = [_format_header(header, sizes)]
+    lines.extend(_format_columns(columns, sizes))
+    return lines
 
-    return
 
+def _filter_fields(table, keys=None):
+    """Select only the desired `keys` from the given table.
 
-def _filter_fields_in_lines(lines, header, keys=None):
-    """Select only the desired `keys` from the given header and each line of lines.
+    If none of the table's fields are included in `keys`, all fields are kept.
     """
     if keys is None:
-        return lines, header
+        return table
 
     # Find which elements of `header` are desired (i.e. in keys)
-    clean_header = [hh for hh in header if hh in keys]
-    if len(clean_header) == 0:
-        raise ValueError("None of the header values ('{}') are targeted in keys ('{}')".format(
-            header, keys))
+    if not any(hh in keys for hh in table.header):
+        return table
 
-    # Create a new list of dict including only the target keys of each line
-    clean_lines = [OrderedDict((hh, ll[hh]) for hh in clean_header)
-                   for ll in lines]
-    return clean_lines, clean_header
+    return table.select_fields(keys)
 
 
-def _format_line(line, form):
-    return form.format(*line.values())
+def _select_head_tail(table, head=None, tail=None):
+    """Select only the first `head` and/or last `tail` rows of the given table.
+    """
+    import numpy as np
+    if head is None and tail is None:
+        return table
+    if head is None:
+        return table.tail(int(tail))
+    if tail is None:
+        return table.head(int(head))
 
+    num = len(table)
+    head = min(int(head), num)
+    tail = min(int(tail), num)
+    if head + tail >= num:
+        return table
+    return table.take(np.concatenate([np.arange(head), np.arange(num - tail, num)]))
 
-def _calculate_formatting(lines, header):
-    """Construct an appropriately formatted string to print lines.
-    """
-    lines = np.atleast_1d(lines)
 
-    num_keys = len(header)
-    # Find the maximum length of each component of each line
+def _calculate_widths(columns, header):
+    """Calculate the width of each column of strings (including its header value).
+    """
+    import numpy as np
+    # Find the maximum length of each column
     #    Start with the size of the header values
     sizes = [len(hh) for hh in header]
-    for ll in lines:
-        for ii, (key, val) in enumerate(ll.items()):
-            sizes[ii] = np.maximum(sizes[ii], len(val))
+    for ii, col in enumerate(columns):
+        if len(col):
+            sizes[ii] = max(sizes[ii], int(np.max(np.char.str_len(col))))
+
+    return sizes
+
+
+def _format_header(header, sizes):
+    sep = const.SEP_CHAR + " "*const.COLUMN_SPACING
+    return sep.join(hh.rjust(ss) for hh, ss in zip(header, sizes))
+
 
-    # Create nice formatting string
+def _format_columns(columns, sizes):
+    """Combine columns of strings into (right-justified) lines of text, one column at a time.
+    """
+    import numpy as np
     sep = const.SEP_CHAR + " "*const.COLUMN_SPACING
-    form = sep.join("{{: >{sz}s}}".format(sz=ss) for ss in sizes)
-    return form
+    lines = np.char.rjust(columns[0], sizes[0])
+    for col, ss in zip(columns[1:], sizes[1:]):
+        lines = np.char.add(np.char.add(lines, sep), np.char.rjust(col, ss))
+
+    return lines.tolist()
+
+
+def _write_lines(lines, stream=None):
+    """Write lines of text in chunks of `const.OUTPUT_CHUNK_SIZE`.
+
+    Returns False if the output stream has been closed (e.g. a pipe into `head`), otherwise True.
+    """
+    import sys
+    if stream is None:
+        stream = sys.stdout
+
+    from . import profiling
+    size = const.OUTPUT_CHUNK_SIZE
+    try:
+        with profiling.stage('write', rows_in=len(lines)) as entry:
+            entry.bytes = 0
+            for ii in range(0, len(lines), size):
+                text = "\n".join(lines[ii:ii+size]) + "\n"
+                stream.write(text)
+                entry.bytes += len(text)
+            stream.flush()
+    except BrokenPipeError:
+        # Redirect remaining output (e.g. when python flushes at exit) to avoid further errors
+        import os
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return False
+
+    return True
+
+
+def compress_ranges(values):
+    """Combine integers into a compact, sorted range specification, e.g. `[1, 2, 3, 5]` => '1-3,5'.
+    """
+    import numpy as np
+    values = np.unique(np.asarray(values, dtype=np.int64))
+    if not len(values):
+        return ""
+
+    # Find the start of each contiguous run of values
+    breaks = np.flatnonzero(np.diff(values) != 1) + 1
+    lo = values[np.concatenate([[0], breaks])]
+    hi = values[np.concatenate([breaks - 1, [len(values) - 1]])]
+    return ",".join(str(ll) if ll == hh else "{}-{}".format(ll, hh) for ll, hh in zip(lo, hi))
+
+
+def map_bounded(func, items, workers=None):
+    """Apply `func` to each of `items`, returning the results in order.
+
+    If `workers` is greater than one, up to that many calls are run concurrently, in the threads
+    of the shared `pool.WorkerPool` (which is appropriate for calls which wait on subprocesses).
+    """
+    items = list(items)
+    if workers is None or workers <= 1 or len(items) <= 1:
+        return [func(ii) for ii in items]
+
+    from . import pool
+    return pool.get_pool(workers).map(func, items, limit=workers)
+
+
+def iter_head(tables, num):
+    """Yield the `JobTable`s from `tables`, truncated to a total of (at most) `num` rows.
+
+    Iteration stops as soon as `num` rows have been yielded, and `tables` is then closed (if it
+    is a generator, e.g. stopping a running 'sacct' command), so that no further tables are read.
+    """
+    try:
+        for table in tables:
+            if len(table) >= num:
+                yield table.head(num)
+                return
+            num -= len(table)
+            yield table
+    finally:
+        if hasattr(tables, 'close'):
+            tables.close()
+
+    return
+
+
+def iter_tail(tables, num):
+    """Yield a single `JobTable` of the last `num` rows of all of the `JobTable`s in `tables`.
+
+    While reading, only the most recent tables which are needed for the last `num` rows are kept
+    (i.e. a bounded buffer of `num` rows, plus at most one partial table).  Nothing is yielded if
+    all tables are empty.
+    """
+    from collections import deque
+    from .table import JobTable
+    kept = deque()
+    total = 0
+    for table in tables:
+        if not len(table):
+            continue
+        kept.append(table)
+        total += len(table)
+        # Drop the oldest table once the remaining ones include enough rows
+        while len(kept) > 1 and total - len(kept[0]) >= num:
+            total -= len(kept.popleft())
+
+    if not len(kept):
+        return
+
+    table = kept[0] if len(kept) == 1 else JobTable.concatenate(list(kept))
+    yield table.tail(num)
+    return
 
 
 def prompt_yes_no(question, default="no"):
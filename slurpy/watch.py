@@ -0,0 +1,210 @@
+"""Repeatedly refreshed ('watch') output.
+
+Each tick only queries the jobs which may have changed since the previous one (see
+`_SacctSource`), and only the lines of output which have changed are redrawn, using ANSI
+cursor-control sequences (see `_Screen`).
+
+Functions
+---------
+-   watch                 - Repeatedly query and print results, every `args.watch` seconds.
+
+-   _get_source           - Construct the object which retrieves (and formats) the output lines.
+-   _sleep_until          -
+
+Classes
+-------
+-   _SacctSource          - Maintain a table of 'sacct' results, updated with small queries.
+-   _SqueueSource         - Query 'squeue' results.
+-   _Screen               - Draw lines of output, redrawing only those which have changed.
+"""
+
+import sys
+import time
+import shutil
+import datetime
+import numpy as np
+
+from . import sacct, squeue, utils, const
+
+_ESC_HOME_CLEAR = "\x1b[H\x1b[2J"
+_ESC_MOVE = "\x1b[{row};1H"
+_ESC_CLEAR_LINE = "\x1b[K"
+_ESC_CLEAR_BELOW = "\x1b[J"
+
+
+def watch(args):
+    """Repeatedly query and print results, every `args.watch` seconds.
+
+    The interval is measured from the start of each tick (so that it does not drift with the
+    time spent querying and printing).  When the output has not changed, the interval is
+    increased by a factor of `const.WATCH_BACKOFF` each tick, up to `const.WATCH_MAX_BACKOFF`
+    times `args.watch`; it returns to `args.watch` as soon as the output changes.
+    """
+    source = _get_source(args)
+    screen = _Screen(clear=args.clear)
+    interval = float(args.watch)
+    backoff = 1.0
+
+    next_tick = time.time()
+    try:
+        while True:
+            lines = source.lines()
+            changed = screen.draw(lines)
+            if changed:
+                backoff = 1.0
+            else:
+                backoff = min(backoff * const.WATCH_BACKOFF, const.WATCH_MAX_BACKOFF)
+
+            next_tick = max(next_tick + interval * backoff, time.time())
+            _sleep_until(next_tick)
+    except KeyboardInterrupt:
+        screen.close()
+
+    return
+
+
+def _get_source(args):
+    """Construct the object which retrieves (and formats) the output lines for the given mode.
+    """
+    if args.queue:
+        return _SqueueSource(args)
+    return _SacctSource(args)
+
+
+def _sleep_until(tick):
+    delay = tick - time.time()
+    if delay > 0:
+        time.sleep(delay)
+    return
+
+
+class _SacctSource(object):
+    """Maintain a table of (unfiltered) 'sacct' results, updated with small queries.
+
+    The first query covers the full window (starting at `args.start`).  Each following query
+    only covers the jobs active since the previous one (with an overlap of
+    `const.CACHE_SYNC_OVERLAP` seconds), which are merged into the existing table.  Jobs which
+    ended before the start of the window are then removed, so that the table does not grow
+    with the time spent watching.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self._pushdown = not sacct._use_cache(args)
+        self._raw = None
+        self._synced = None
+        return
+
+    def table(self):
+        """Retrieve the current (filtered and sorted) table of jobs.
+
+        Results are retrieved from a running server, when possible (see `server.query`).
+        """
+        from . import server
+        args = self.args
+        served = server.query('sacct', args)
+        if served is not None:
+            return sacct._sort_lines(served, args)
+
+        raw = self.refresh()
+        table = sacct._filter_lines(raw, args, pushdown=self._pushdown)
+        table = sacct._sort_lines(table, args)
+        return table
+
+    def refresh(self):
+        """Query the jobs active since the previous query, and return the (unfiltered) table.
+        """
+        args = self.args
+        now = np.datetime64(datetime.datetime.now().replace(microsecond=0), 's')
+        if self._raw is None:
+            if self._pushdown:
+                raw = sacct._parse_sacct(args)
+            else:
+                raw = sacct._parse_sacct_cached(args)
+        else:
+            start = self._synced - np.timedelta64(const.CACHE_SYNC_OVERLAP, 's')
+            fresh = sacct._parse_sacct(args, start=str(start), pushdown=self._pushdown)
+            # JobIDs are only unique within each cluster (see `--clusters`)
+            raw = self._raw.update(fresh, key=['Cluster', 'JobID'])
+
+        self._raw = raw
+        self._synced = now
+        if args.start is not None:
+            self.trim(np.datetime64(args.start, 's'))
+        return self._raw
+
+    def trim(self, start):
+        """Remove the jobs which ended before `start` (e.g. of a moving window) from the table.
+        """
+        if self._raw is not None:
+            ends = self._raw['End']
+            self._raw = self._raw[np.isnat(ends) | (ends >= start)]
+        return
+
+    def lines(self):
+        """Retrieve the current lines of output.
+        """
+        table = self.table()
+        if self.args.summary:
+            return sacct.summary_lines(table, self.args)
+        return utils.format_table(table, self.args, keys=sacct._print_keys(self.args))
+
+
+class _SqueueSource(object):
+    """Query 'squeue' results ('squeue' only reports current jobs, so each query is complete).
+    """
+
+    def __init__(self, args):
+        self.args = args
+        return
+
+    def lines(self):
+        table = squeue.squeue_results(self.args)
+        return utils.format_table(table, self.args, keys=const.SQUEUE_KEYS_PRINT)
+
+
+class _Screen(object):
+    """Draw lines of output to a terminal, redrawing only the lines which have changed.
+
+    If `clear` is False, the full output is instead printed (below the previous output)
+    whenever it changes.
+    """
+
+    def __init__(self, clear=True, stream=None):
+        self.clear = clear
+        self.stream = sys.stdout if stream is None else stream
+        self._lines = None
+        return
+
+    def draw(self, lines):
+        """Draw the given lines, returning whether anything has changed.
+        """
+        if self.clear:
+            # Only show as many lines as fit on the screen
+            lines = lines[:shutil.get_terminal_size().lines - 1]
+
+        prev = self._lines
+        if prev is not None and lines == prev:
+            return False
+
+        if not self.clear:
+            out = "\n".join(lines) + "\n"
+        # Redraw the full screen when the number of lines changes
+        elif prev is None or len(prev) != len(lines):
+            out = _ESC_HOME_CLEAR + "\n".join(lines) + "\n"
+        # Otherwise, move the cursor to each changed line and redraw it
+        else:
+            out = [_ESC_MOVE.format(row=ii+1) + ll + _ESC_CLEAR_LINE
+                   for ii, (ll, pp) in enumerate(zip(lines, prev)) if ll != pp]
+            out.append(_ESC_MOVE.format(row=len(lines)+1) + _ESC_CLEAR_BELOW)
+            out = "".join(out)
+
+        self.stream.write(out)
+        self.stream.flush()
+        self._lines = lines
+        return True
+
+    def close(self):
+        self.stream.write("\n")
+        self.stream.flush()
+        return
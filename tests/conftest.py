@@ -0,0 +1,23 @@
+"""Shared fixtures for the tests, which run SLURM commands with stand-in runners (see
+`slurpy.runner`), so that no cluster is needed.
+"""
+
+import pytest
+
+from slurpy import query, runner, sacct
+
+
+@pytest.fixture
+def synthetic():
+    """Use a `SyntheticRunner` (with 500 jobs) for all SLURM commands.
+    """
+    with runner.using(runner.SyntheticRunner(500, seed=1)) as rr:
+        yield rr
+
+
+@pytest.fixture
+def jobs(synthetic):
+    """Unfiltered 'sacct' results (job allocations only) of the synthetic jobs.
+    """
+    args = query.SacctQuery(start='2017-01-01', end='2017-02-01', shard_days=0).args()
+    return sacct._parse_sacct(args, pushdown=False)
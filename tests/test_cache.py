@@ -0,0 +1,82 @@
+"""Tests of the local cache of finished jobs (`slurpy.cache`), with replayed 'sacct' results.
+"""
+
+import subprocess
+
+import numpy as np
+import pytest
+
+from slurpy import const, query, runner, sacct
+
+_HEADER = "JobID|JobName|State|Partition|Submit|Start|End|Elapsed\n"
+
+
+@pytest.fixture
+def cached(tmp_path, monkeypatch):
+    """Use a temporary cache directory, which keeps the (old) replayed jobs.
+    """
+    monkeypatch.setattr(const, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(const, 'CACHE_MAX_AGE', 1e5)
+    monkeypatch.setenv('SLURM_CLUSTER_NAME', 'test')
+    sacct._get_cluster_name.cache_clear()
+    yield tmp_path
+    sacct._get_cluster_name.cache_clear()
+
+
+def _record(path, rows):
+    with open(str(path / 'sacct.txt'), 'w') as out:
+        out.write(_HEADER)
+        for jid, state, end in rows:
+            out.write("{}|job|{}|general|2017-01-02T00:00:00|2017-01-02T00:00:00|{}|01:00:00\n"
+                      .format(jid, state, end))
+
+
+def _states(table):
+    return dict(zip(table.render('JobID').tolist(), table['State'].tolist()))
+
+
+def test_cache_merge(cached):
+    args = query.SacctQuery(start='2017-01-01T00:00:00', cache=True, shard_days=0).args()
+    assert sacct._use_cache(args)
+
+    _record(cached, [('101', 'COMPLETED', '2017-01-02T01:00:00'),
+                     ('102', 'RUNNING', 'Unknown'),
+                     ('103', 'PENDING', 'Unknown')])
+    with runner.using(runner.ReplayRunner(str(cached))):
+        first = sacct._parse_sacct_cached(args)
+    assert _states(first) == {'101': 'COMPLETED', '102': 'RUNNING', '103': 'PENDING'}
+
+    # Later queries only return the jobs active since the previous one, which are merged into
+    #    the cached (finished) jobs
+    _record(cached, [('103', 'RUNNING', 'Unknown'),
+                     ('102', 'FAILED', '2017-01-03T00:00:00'),
+                     ('104', 'PENDING', 'Unknown')])
+    with runner.using(runner.ReplayRunner(str(cached))):
+        second = sacct._parse_sacct_cached(args)
+    assert _states(second) == {'101': 'COMPLETED', '102': 'FAILED', '103': 'RUNNING',
+                               '104': 'PENDING'}
+    # Results are ordered as 'sacct' orders them
+    assert second['JobID']['id'].tolist() == [101, 102, 103, 104]
+
+    # Finished jobs are kept once 'sacct' no longer reports them
+    _record(cached, [('104', 'COMPLETED', '2017-01-04T00:00:00')])
+    with runner.using(runner.ReplayRunner(str(cached))):
+        third = sacct._parse_sacct_cached(args)
+    assert _states(third) == {'101': 'COMPLETED', '102': 'FAILED', '104': 'COMPLETED'}
+
+
+def test_cache_failed_sacct(cached, monkeypatch):
+    args = query.SacctQuery(start='2017-01-01T00:00:00', cache=True, shard_days=0).args()
+    _record(cached, [('201', 'COMPLETED', '2017-01-02T01:00:00'),
+                     ('200', 'FAILED', '2017-01-02T02:00:00')])
+    with runner.using(runner.ReplayRunner(str(cached))):
+        sacct._parse_sacct_cached(args)
+
+    # When 'sacct' fails, only the cached jobs are returned (in the usual order)
+    def fail(*args, **kwargs):
+        raise subprocess.CalledProcessError(1, ['sacct'], output='', stderr='failed')
+
+    monkeypatch.setattr(sacct, '_parse_sacct', fail)
+    table = sacct._parse_sacct_cached(args)
+    assert table['JobID']['id'].tolist() == [200, 201]
+    assert not np.any(np.isnat(table['End']))
@@ -0,0 +1,89 @@
+"""Tests of the resource efficiency of finished jobs (`slurpy.efficiency`), with replayed results.
+"""
+
+import numpy as np
+import pytest
+
+from slurpy import efficiency, query, runner
+
+_HEADER = ("JobID|JobName|State|Elapsed|AllocCPUS|AllocNodes|ReqMem|ReqTRES|MaxRSS|TotalCPU|"
+           "CPUTimeRAW\n")
+_ROWS = [
+    # Memory from 'ReqTRES' (the total of both nodes), used memory from the largest step, and CPU
+    #    time used from the allocation (the total of its steps)
+    "100|a|COMPLETED|01:00:00|4|2|8Gn|billing=4,cpu=4,mem=16G,node=2||02:00:00|14400",
+    "100.batch|batch|COMPLETED|01:00:00|2|1||||00:00:00|7200",
+    "100.extern|extern|COMPLETED|01:00:00|4|2|||2G|00:00:00|14400",
+    "100.0|a|COMPLETED|00:50:00|4|2|||6G|02:00:00|12000",
+    # Without memory in 'ReqTRES', 'ReqMem' is used (per node)
+    "101|b|FAILED|00:10:00|1|1|4000Mn|billing=1,cpu=1,node=1||00:05:00|600",
+    "101.batch|batch|FAILED|00:10:00|1|1|||1000M|00:05:00|600",
+    # Not finished, or never ran
+    "102|c|RUNNING|00:10:00|1|1|1G|cpu=1,mem=1G,node=1||00:00:00|600",
+    "103|d|CANCELLED by 1|00:00:00|1|1|1G|cpu=1,mem=1G,node=1||00:00:00|0",
+    # Tasks of job-arrays are separate jobs (and their steps are listed later)
+    "104_1|e|COMPLETED|00:30:00|1|1|4Gn|cpu=1,mem=4G,node=1||00:15:00|1800",
+    "104_2|e|TIMEOUT|00:30:00|1|1|4Gn|cpu=1,mem=4G,node=1||00:30:00|1800",
+    "104_2.batch|batch|CANCELLED|00:30:00|1|1|||3G|00:30:00|1800",
+    "104_1.batch|batch|COMPLETED|00:30:00|1|1|||1G|00:15:00|1800",
+    # Without any usage recorded
+    "105|f|COMPLETED|00:30:00|1|1|4Gn|cpu=1,mem=4G,node=1||00:00:00|1800",
+]
+
+_GB = 2.0**30
+_MB = 2.0**20
+
+
+@pytest.fixture
+def eff(tmp_path):
+    with open(str(tmp_path / 'sacct.txt'), 'w') as out:
+        out.write(_HEADER)
+        out.write("\n".join(_ROWS) + "\n")
+
+    args = query.SacctQuery(start='2017-01-01', shard_days=0).args()
+    with runner.using(runner.ReplayRunner(str(tmp_path))):
+        yield efficiency.efficiency_results(args), args
+
+
+def test_compute_efficiency(eff):
+    eff, _ = eff
+    assert eff.jobs.render('JobID').tolist() == ['100', '101', '104_1', '104_2', '105']
+    np.testing.assert_array_equal(eff.mem_req, [8*_GB, 4000*_MB, 4*_GB, 4*_GB, 4*_GB])
+    np.testing.assert_array_equal(eff.mem_used, [6*_GB, 1000*_MB, 1*_GB, 3*_GB, np.nan])
+    np.testing.assert_array_equal(eff.cpu_time, [14400, 600, 1800, 1800, 1800])
+    np.testing.assert_array_equal(eff.cpu_used, [7200, 300, 900, 1800, 0])
+
+
+def test_format_efficiency(eff):
+    eff, args = eff
+    lines = efficiency.format_efficiency(eff, args, top=2)
+    assert lines[0] == "Jobs: 5 (with memory usage: 4, with CPU usage: 5)"
+    # Weighted by the time and number of nodes of each job
+    req = (8*2*1.0 + 4000/1024.*1/6. + 4*0.5 + 4*0.5)
+    used = (6*2*1.0 + 1000/1024.*1/6. + 1*0.5 + 3*0.5)
+    assert lines[1] == "Memory: requested {:.1f} GB-hours, used {:.1f} GB-hours ({:.1f}%)".format(
+        req, used, 100*used/req)
+    assert lines[2] == "CPU: allocated 5.7 CPU-hours, used 2.8 CPU-hours (50.0%)"
+
+    idx = lines.index("Most unused memory:")
+    top = lines[idx+1:]
+    # Header, then the two jobs with the most unused memory
+    assert [ll.split()[0] for ll in top[1:]] == ['100', '104_1']
+
+
+def test_no_jobs(tmp_path):
+    args = query.SacctQuery(start='2017-01-01', shard_days=0).args()
+    with runner.using(runner.ReplayRunner(str(tmp_path))):
+        eff = efficiency.efficiency_results(args)
+    assert len(eff.jobs) == 0
+    lines = efficiency.format_efficiency(eff, args)
+    assert lines == ["Jobs: 0 (with memory usage: 0, with CPU usage: 0)"]
+
+
+def test_synthetic(synthetic):
+    # Memory requests of the synthetic jobs are all given in 'ReqTRES'
+    args = query.SacctQuery(start='2017-01-01', end='2017-02-01', shard_days=0).args()
+    eff = efficiency.efficiency_results(args)
+    assert len(eff.jobs)
+    assert np.all(np.isfinite(eff.mem_req) & (eff.mem_req > 0))
+    assert np.all(eff.cpu_used <= eff.cpu_time)
@@ -0,0 +1,71 @@
+"""Tests of writing job tables in machine-readable formats (`slurpy.export`).
+"""
+
+import csv
+import json
+
+import numpy as np
+import pytest
+
+from slurpy import export
+
+
+def _check_text(jobs, rows):
+    # Text formats give ISO times, seconds and bytes, with missing values as empty/`None`
+    assert [rr['JobID'] for rr in rows] == jobs.render('JobID').tolist()
+    for rr, end, elapsed, mem in zip(rows, jobs['End'], jobs['Elapsed'], jobs['ReqMem']):
+        if np.isnat(end):
+            assert rr['End'] in ['', None]
+        else:
+            assert np.datetime64(rr['End'], 's') == end
+        assert int(rr['Elapsed']) == elapsed
+        assert float(rr['ReqMem']) == mem
+
+
+def test_csv(jobs, tmp_path):
+    path = str(tmp_path / 'jobs.csv')
+    export.write_tables([jobs[:100], jobs[100:]], 'csv', path=path)
+    with open(path, newline='') as infile:
+        rows = list(csv.DictReader(infile))
+    assert list(rows[0].keys())[:5] == ['JobID', 'JobID_id', 'JobID_task', 'JobID_het',
+                                        'JobID_step']
+    _check_text(jobs, rows)
+
+
+def test_jsonl(jobs, tmp_path):
+    path = str(tmp_path / 'jobs.jsonl')
+    export.write_table(jobs, 'jsonl', path=path)
+    with open(path) as infile:
+        rows = [json.loads(ll) for ll in infile]
+    _check_text(jobs, rows)
+    assert [rr['JobID_task'] for rr in rows] == jobs['JobID']['task'].tolist()
+
+
+def test_npz(jobs, tmp_path):
+    path = str(tmp_path / 'jobs.npz')
+    export.write_tables([jobs[:10], jobs[10:]], 'npz', path=path)
+    with np.load(path) as data:
+        assert data['JobID'].tolist() == jobs.render('JobID').tolist()
+        assert np.array_equal(data['JobID_parsed'], jobs['JobID'])
+        for kk in ['Submit', 'End', 'Elapsed', 'ReqMem', 'State']:
+            np.testing.assert_array_equal(data[kk], jobs[kk])
+
+
+@pytest.mark.parametrize('fmt', ['parquet', 'arrow'])
+def test_arrow(jobs, tmp_path, fmt):
+    pa = pytest.importorskip('pyarrow')
+    path = str(tmp_path / ('jobs.' + fmt))
+    export.write_tables([jobs[:10], jobs[10:]], fmt, path=path)
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        data = pq.read_table(path)
+    else:
+        with pa.ipc.open_stream(path) as reader:
+            data = reader.read_all()
+    assert data.column('JobID').to_pylist() == jobs.render('JobID').tolist()
+    assert data.column('End').null_count == np.count_nonzero(np.isnat(jobs['End']))
+
+
+def test_invalid(jobs, tmp_path):
+    with pytest.raises(ValueError):
+        export.write_table(jobs, 'xml', path=str(tmp_path / 'jobs.xml'))
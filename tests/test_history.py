@@ -0,0 +1,113 @@
+"""Tests of the local history of finished jobs (`slurpy.history`), with replayed 'sacct' results.
+"""
+
+import getpass
+import os
+
+import numpy as np
+import pytest
+
+from slurpy import const, history, query, runner, sacct
+
+_HEADER = "JobID|JobName|State|Partition|Submit|Start|End|Elapsed\n"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Use a temporary history directory, returning the path of the store within it.
+    """
+    monkeypatch.setattr(const, 'HISTORY_DIR', str(tmp_path / 'history'))
+    monkeypatch.setenv('SLURM_CLUSTER_NAME', 'test')
+    sacct._get_cluster_name.cache_clear()
+    yield history.store_path('test', getpass.getuser())
+    sacct._get_cluster_name.cache_clear()
+
+
+def _sync(path, rows):
+    with open(str(path / 'sacct.txt'), 'w') as out:
+        out.write(_HEADER)
+        for jid, state, start, end in rows:
+            out.write("{}|job|{}|general|{}|{}|{}|01:00:00\n".format(jid, state, start, start,
+                                                                    end))
+
+    args = query.SacctQuery(start='2017-01-01T00:00:00').args()
+    with runner.using(runner.ReplayRunner(str(path))):
+        history.sync(args)
+    return
+
+
+def _load(**kwargs):
+    args = query.SacctQuery(shard_days=0, **kwargs).args()
+    args.history = True
+    return sacct.sacct_results(args)
+
+
+def _states(table):
+    return dict(zip(table.render('JobID').tolist(), table['State'].tolist()))
+
+
+def test_sync(store, tmp_path, capsys):
+    _sync(tmp_path, [('101', 'COMPLETED', '2017-01-02T00:00:00', '2017-01-02T01:00:00'),
+                     ('102', 'COMPLETED', '2017-01-02T23:30:00', '2017-01-03T00:30:00'),
+                     ('102.batch', 'COMPLETED', '2017-01-02T23:30:00', '2017-01-03T00:30:00'),
+                     ('103', 'RUNNING', '2017-01-03T00:00:00', 'Unknown')])
+    assert "Stored 3 finished jobs" in capsys.readouterr().out
+
+    # Only finished jobs are stored, in the partition of the day they ended
+    st = history.HistoryStore(store, const.SACCT_KEYS, const.SACCT_KEYS_TYPES)
+    assert st.partitions() == ['2017-01-02', '2017-01-03']
+    assert st.covered == np.datetime64('2017-01-01T00:00:00')
+    assert st.index['partitions']['2017-01-03']['first'] == '2017-01-02T23:30:00'
+    part = st.read('2017-01-03')
+    assert part.render('JobID').tolist() == ['102', '102.batch']
+    inode = os.stat(os.path.join(store, '2017-01-02')).st_ino
+
+    # Jobs reported again replace those stored, and other partitions are not rewritten
+    _sync(tmp_path, [('102', 'FAILED', '2017-01-02T23:30:00', '2017-01-03T00:30:00'),
+                     ('103', 'COMPLETED', '2017-01-03T00:00:00', '2017-01-04T02:00:00')])
+    st = history.HistoryStore(store, const.SACCT_KEYS, const.SACCT_KEYS_TYPES)
+    assert st.partitions() == ['2017-01-02', '2017-01-03', '2017-01-04']
+    assert _states(st.read('2017-01-03')) == {'102': 'FAILED', '102.batch': 'COMPLETED'}
+    assert os.stat(os.path.join(store, '2017-01-02')).st_ino == inode
+    assert not [ff for ff in os.listdir(store) if '.new-' in ff or '.old-' in ff]
+
+
+def test_read(store, tmp_path):
+    _sync(tmp_path, [('101', 'COMPLETED', '2017-01-02T00:00:00', '2017-01-02T01:00:00'),
+                     ('102', 'FAILED', '2017-01-02T23:30:00', '2017-01-03T00:30:00'),
+                     ('102.batch', 'FAILED', '2017-01-02T23:30:00', '2017-01-03T00:30:00'),
+                     ('103', 'COMPLETED', '2017-01-03T00:00:00', '2017-01-04T02:00:00')])
+
+    assert _states(_load(start='2017-01-01')) == {
+        '101': 'COMPLETED', '102': 'FAILED', '103': 'COMPLETED'}
+    # Jobs which ended before the start are not included
+    assert _states(_load(start='2017-01-03T00:00:00')) == {'102': 'FAILED', '103': 'COMPLETED'}
+    # Nor jobs which started after the end (even in a partition of a later day)
+    assert _states(_load(start='2017-01-01', end='2017-01-02T12:00:00')) == {'101': 'COMPLETED'}
+    assert _states(_load(start='2017-01-01', state='FAILED', steps='all')) == {
+        '102': 'FAILED', '102.batch': 'FAILED'}
+    assert len(_load(start='2017-02-01')) == 0
+
+    # Only the partitions which may overlap the window are read
+    st = history.HistoryStore(store, const.SACCT_KEYS, const.SACCT_KEYS_TYPES)
+    start, end = np.datetime64('2017-01-03T00:00:00'), np.datetime64('2017-01-03T12:00:00')
+    assert st.partitions(start, end) == ['2017-01-03', '2017-01-04']
+    end = np.datetime64('2017-01-02T12:00:00')
+    assert st.partitions(None, end) == ['2017-01-02']
+
+
+def test_new_fields(store, tmp_path):
+    # Fields which were not stored (e.g. added later) are missing in each partition
+    _sync(tmp_path, [('101', 'COMPLETED', '2017-01-02T00:00:00', '2017-01-02T01:00:00')])
+    header = list(const.SACCT_KEYS) + ['NewTime']
+    types = dict(const.SACCT_KEYS_TYPES, NewTime='time')
+    part = history.HistoryStore(store, header, types).read('2017-01-02')
+    assert part.header == header
+    assert np.isnat(part['NewTime']).tolist() == [True]
+
+
+def test_version(store, tmp_path, monkeypatch):
+    _sync(tmp_path, [('101', 'COMPLETED', '2017-01-02T00:00:00', '2017-01-02T01:00:00')])
+    monkeypatch.setattr(const, 'HISTORY_VERSION', const.HISTORY_VERSION + 1)
+    with pytest.raises(ValueError):
+        history.HistoryStore(store, const.SACCT_KEYS, const.SACCT_KEYS_TYPES)
@@ -0,0 +1,61 @@
+"""Tests of expanding and compressing SLURM hostlists (`slurpy.hostlist`).
+"""
+
+import numpy as np
+import pytest
+
+from slurpy import hostlist, query
+
+
+@pytest.mark.parametrize('text,names', [
+    ('holy7c22', ('holy7c22',)),
+    ('a[1-3],b', ('a1', 'a2', 'a3', 'b')),
+    ('holy2a[01-03,05],holy7c22', ('holy2a01', 'holy2a02', 'holy2a03', 'holy2a05', 'holy7c22')),
+    ('a[08-10]', ('a08', 'a09', 'a10')),
+    ('a[1-2]b[1-2]', ('a1b1', 'a1b2', 'a2b1', 'a2b2')),
+    ('', ()), ('None assigned', ()),
+])
+def test_expand(text, names):
+    assert hostlist.expand(text) == names
+
+
+@pytest.mark.parametrize('text', ['a[3-1]', 'a[1-x]', 'a[-2]', 'a[1-'])
+def test_expand_invalid(text):
+    with pytest.raises(ValueError):
+        hostlist.expand(text)
+
+
+@pytest.mark.parametrize('names,text', [
+    (['a1', 'a2', 'a3', 'b'], 'a[1-3],b'),
+    (['a3', 'a1', 'a1', 'a2'], 'a[1-3]'),
+    (['a05', 'a01', 'a02', 'a03'], 'a[01-03,05]'),
+    # Names are grouped by their number of digits, so that zero-padding is kept
+    (['a08', 'a9', 'a10', 'a09'], 'a[08-10],a9'),
+    (['c7', 'b2'], 'b2,c7'),
+])
+def test_compress(names, text):
+    assert hostlist.compress(names) == text
+
+
+@pytest.mark.parametrize('text', ['holy2a[01-03,05],holy7c22', 'a[08-10],b', 'x[1-2,4,7-9]'])
+def test_round_trip(text):
+    assert hostlist.compress(hostlist.expand(text)) == text
+    names = hostlist.expand(text)
+    assert hostlist.expand(hostlist.compress(names[::-1])) == names
+
+
+def test_node_codes():
+    values = ['a[1-2]', 'b', 'a[1-2]', 'None assigned', 'a[2-1]', 'b,a1']
+    nodes, rows, codes = hostlist.node_codes(values)
+    assert nodes.tolist() == ['a1', 'a2', 'b']
+    # Invalid hostlists (e.g. truncated) are left unexpanded
+    pairs = list(zip(rows.tolist(), nodes[codes].tolist()))
+    assert pairs == [(0, 'a1'), (0, 'a2'), (1, 'b'), (2, 'a1'), (2, 'a2'), (5, 'b'), (5, 'a1')]
+
+
+def test_node_codes_synthetic(synthetic):
+    table = query.SacctQuery(start='2017-01-01', end='2017-02-01', shard_days=0).run()
+    nodes, rows, codes = hostlist.node_codes(table['NodeList'])
+    for ii in np.unique(rows)[:50]:
+        names = nodes[codes[rows == ii]].tolist()
+        assert tuple(names) == hostlist.expand(table['NodeList'][ii])
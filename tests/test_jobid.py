@@ -0,0 +1,60 @@
+"""Tests of JobID specifications (`slurpy.jobid`).
+"""
+
+import numpy as np
+import pytest
+
+from slurpy import jobid
+from slurpy.jobid import SpecTerm
+
+
+def test_parse_spec():
+    terms = jobid.parse_spec('123,456:460 789_[1-3,7%2] 12.batch 13_4.0')
+    assert terms == [
+        SpecTerm(123, 123, None, None),
+        SpecTerm(456, 460, None, None),
+        SpecTerm(789, 789, [(1, 3), (7, 7)], None),
+        SpecTerm(12, 12, None, jobid.STEP_NAMES['batch']),
+        SpecTerm(13, 13, [(4, 4)], 0),
+    ]
+
+
+def test_parse_spec_list_and_spaces():
+    # Lists are joined, and spaces around range separators are removed
+    assert jobid.parse_spec(['100 : 102', '200-201']) == [
+        SpecTerm(100, 102, None, None), SpecTerm(200, 201, None, None)]
+
+
+def test_parse_spec_invalid():
+    with pytest.raises(ValueError):
+        jobid.parse_spec('123,abc')
+
+
+def test_pushdown_spec():
+    terms = jobid.parse_spec('123,456:458 789_[1-3] 12.batch 13_4.0')
+    assert jobid.pushdown_spec(terms, 100) == [
+        '123', '456', '457', '458', '789_1', '789_2', '789_3', '12.batch', '13_4.0']
+
+
+def test_pushdown_spec_too_many():
+    # Ranges of IDs or tasks with more than `max_ids` values cannot be pushed down
+    assert jobid.pushdown_spec(jobid.parse_spec('1:1000'), 100) is None
+    assert jobid.pushdown_spec(jobid.parse_spec('5_[1-1000]'), 100) is None
+    assert jobid.pushdown_spec(jobid.parse_spec('1:60,100:160'), 100) is None
+    assert len(jobid.pushdown_spec(jobid.parse_spec('1:100'), 100)) == 100
+
+
+def test_parse_and_render_jobids():
+    values = ['123', '123_4', '123_[5-9%2]', '123+1', '123.batch', '123_4.0', '123.extern']
+    ids = jobid.parse_jobids(values)
+    assert ids['id'].tolist() == [123]*len(values)
+    assert ids['task'].tolist() == [-1, 4, -1, -1, -1, 4, -1]
+    assert ids['step'].tolist() == [-1, -1, -1, -1, -2, 0, -3]
+    assert jobid.render_jobids(ids).tolist() == values
+
+
+def test_index_select():
+    ids = jobid.parse_jobids(['100', '101_1', '101_2', '101_3', '101_3.0', '105', '110'])
+    index = jobid.JobIDIndex(ids)
+    sel = index.select(jobid.parse_spec('101_[2-3] 104:106'))
+    assert np.flatnonzero(sel).tolist() == [2, 3, 4, 5]
@@ -0,0 +1,129 @@
+"""Tests of the reusable pool of worker threads (`slurpy.pool`).
+"""
+
+import threading
+import time
+
+import pytest
+
+from slurpy import const, pool, query, sacct
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    """Start without a shared pool, and close the one created by the test.
+    """
+    monkeypatch.setattr(pool, '_POOL', None)
+    yield
+    if pool._POOL is not None:
+        pool._POOL.close()
+
+
+class _Tracker(object):
+    """Record the number of concurrent calls, and the threads which ran them.
+    """
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+        self.threads = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, item):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        if item == 'fail':
+            raise RuntimeError(item)
+        return None if item is None else item * 2
+
+
+def test_map_bounded():
+    wp = pool.WorkerPool(6)
+    try:
+        track = _Tracker()
+        assert wp.map(track, range(20), limit=2) == [ii * 2 for ii in range(20)]
+        assert track.peak == 2
+        # The limit is at most the number of workers (and at least one)
+        track = _Tracker()
+        wp.map(track, range(20), limit=100)
+        assert track.peak == 6
+        track = _Tracker()
+        wp.map(track, range(5), limit=0)
+        assert track.peak == 1
+        assert wp.map(track, []) == []
+    finally:
+        wp.close()
+
+
+def test_map_reuses_threads():
+    wp = pool.WorkerPool(3)
+    try:
+        threads = set()
+        for _ in range(5):
+            track = _Tracker(delay=0.001)
+            wp.map(track, range(10))
+            threads |= track.threads
+        assert len(threads) <= 3
+        assert all(tt.startswith('slurpy') for tt in threads)
+    finally:
+        wp.close()
+
+
+def test_map_error():
+    # No more calls are started after one fails, and its exception is raised
+    wp = pool.WorkerPool(2)
+    try:
+        calls = []
+
+        def func(item):
+            calls.append(item)
+            if item == 1:
+                raise RuntimeError("failed")
+            return item
+
+        with pytest.raises(RuntimeError):
+            wp.map(func, range(100), limit=1)
+        assert calls == [0, 1]
+    finally:
+        wp.close()
+
+
+def test_get_pool(shared, monkeypatch):
+    monkeypatch.setattr(const, 'POOL_WORKERS', 4)
+    first = pool.get_pool()
+    assert first.workers == 4
+    # Smaller requests use the same pool, larger ones replace it
+    assert pool.get_pool(2) is first
+    assert pool.get_pool(4) is first
+    larger = pool.get_pool(8)
+    assert larger is not first and larger.workers == 8
+    assert pool.get_pool() is larger
+
+
+def test_sharded_query(shared, synthetic, monkeypatch):
+    # Shards of a query run concurrently on the shared pool, at most `workers` at a time
+    monkeypatch.setattr(const, 'POOL_WORKERS', 4)
+    track = _Tracker()
+    read = sacct._read_sacct
+
+    def _read_sacct(command, **kwargs):
+        track(None)
+        return read(command, **kwargs)
+
+    monkeypatch.setattr(sacct, '_read_sacct', _read_sacct)
+    args = query.SacctQuery(start='2017-01-01T00:00:00', end='2017-01-11T00:00:00', shard_days=1,
+                            workers=3).args()
+    assert len(sacct._parse_sacct(args, pushdown=False)) == 500
+    assert track.peak == 3
+    assert pool._POOL.workers == 4
+
+    # Later queries reuse the pool's threads
+    for _ in range(3):
+        sacct._parse_sacct(args, pushdown=False)
+    assert len(track.threads) <= 4
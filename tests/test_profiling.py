@@ -0,0 +1,76 @@
+"""Tests of the statistics of each stage of a query (`slurpy.profiling`).
+"""
+
+import json
+
+from slurpy import profiling, query
+
+
+def test_inactive():
+    assert not profiling.enabled()
+    with profiling.stage('read', rows_in=10) as entry:
+        entry.rows_out = 5
+    profiling.add('read', bytes=100)
+
+
+def test_stages():
+    names = []
+    with profiling.Profiler(callback=lambda name, entry: names.append(name)) as prof:
+        assert profiling.enabled()
+        # Repeated stages are combined
+        for ii in range(3):
+            with profiling.stage('read') as entry:
+                entry.rows_out = 10
+        profiling.add('read', bytes=2**20)
+        with profiling.stage('filter', rows_in=30) as entry:
+            entry.rows_out = 12
+    assert not profiling.enabled()
+
+    assert names == ['read'] * 4 + ['filter']
+    assert list(prof.stages) == ['read', 'filter']
+    read = prof.stages['read']
+    # Counts added without timing are not calls
+    assert (read.calls, read.rows_in, read.rows_out, read.bytes) == (3, None, 30, 2**20)
+    filt = prof.stages['filter']
+    assert (filt.calls, filt.rows_in, filt.rows_out, filt.peak) == (1, 30, 12, None)
+    assert prof.seconds >= read.seconds + filt.seconds
+
+    data = json.loads(prof.to_json())
+    assert data['seconds'] == prof.seconds
+    assert [ss['name'] for ss in data['stages']] == ['read', 'filter']
+    assert data['stages'][0]['rows_out'] == 30
+
+    lines = prof.report().splitlines()
+    assert len(lines) == 4
+    assert lines[1].split()[:2] == ['read', '3']
+    assert lines[1].split()[-2:] == ['1.0', '-']
+    assert lines[-1].split()[0] == 'total'
+
+
+def test_nested():
+    # Stages are recorded by the innermost active profiler
+    with profiling.Profiler() as outer:
+        with profiling.Profiler() as inner:
+            with profiling.stage('sort'):
+                pass
+        with profiling.stage('format'):
+            pass
+    assert list(inner.stages) == ['sort']
+    assert list(outer.stages) == ['format']
+
+
+def test_memory():
+    with profiling.Profiler(memory=True) as prof:
+        with profiling.stage('convert'):
+            data = [bytearray(2**20) for _ in range(4)]
+    del data
+    assert prof.stages['convert'].peak >= 4 * 2**20
+
+
+def test_query(synthetic):
+    with profiling.Profiler() as prof:
+        table = query.SacctQuery(start='2017-01-01', end='2017-02-01', shard_days=0,
+                                 state='FAILED').run()
+    assert {'read', 'convert', 'filter', 'sort'} <= set(prof.stages)
+    assert prof.stages['filter'].rows_in == 500
+    assert prof.stages['filter'].rows_out == len(table)
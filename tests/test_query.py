@@ -0,0 +1,79 @@
+"""Tests of running queries within an event loop (`slurpy.query`), with synthetic results.
+"""
+
+import asyncio
+
+import pytest
+
+from slurpy import query, runner
+
+
+class _StallingRunner(runner.SyntheticRunner):
+    """Synthetic results whose output stops (until killed) after the given number of lines.
+    """
+
+    def __init__(self, num, lines, seed=1):
+        super().__init__(num, seed=seed)
+        self.lines = lines
+        self.procs = []
+
+    async def popen_async(self, command):
+        proc = _StallingProcess(self.popen(command), self.lines)
+        self.procs.append(proc)
+        return proc
+
+
+class _StallingProcess(runner._AsyncProcess):
+
+    def __init__(self, proc, lines):
+        super().__init__(proc)
+        self.stdout = self._Stalling(proc.stdout, lines)
+        self.waited = False
+
+    class _Stalling(runner._AsyncProcess._Output):
+
+        def __init__(self, stream, lines):
+            super().__init__(stream)
+            self._num = lines
+
+        async def _lines(self):
+            for ii, line in enumerate(self._stream):
+                if ii == self._num:
+                    await asyncio.sleep(3600)
+                yield line.encode()
+
+    async def wait(self):
+        self.waited = True
+        return await super().wait()
+
+
+def test_run_async(synthetic):
+    params = dict(start='2017-01-01T00:00:00', end='2017-01-05T00:00:00', shard_days=1)
+    table = asyncio.run(query.SacctQuery(**params).run_async(timeout=60.0))
+    expect = query.SacctQuery(**params).run()
+    assert table.render('JobID').tolist() == expect.render('JobID').tolist()
+
+
+@pytest.mark.parametrize('shard_days', [0, 1])
+def test_run_async_timeout(shard_days):
+    # Commands still running when a query times out are killed, and waited on
+    stalling = _StallingRunner(100, lines=10)
+    q = query.SacctQuery(start='2017-01-01T00:00:00', end='2017-01-05T00:00:00',
+                         shard_days=shard_days)
+    with runner.using(stalling):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(q.run_async(timeout=0.2))
+    assert len(stalling.procs) == (1 if shard_days == 0 else 4)
+    for proc in stalling.procs:
+        assert proc.returncode == -9
+        assert proc.waited
+
+
+def test_command_timeout():
+    # The timeout of each command is also applied in the event loop
+    stalling = _StallingRunner(100, lines=10)
+    q = query.SacctQuery(start='2017-01-01T00:00:00', shard_days=0, timeout=0.2)
+    with runner.using(stalling):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(q.run_async())
+    assert [proc.returncode for proc in stalling.procs] == [-9]
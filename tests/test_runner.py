@@ -0,0 +1,46 @@
+"""Tests of queries run with stand-in runners (`slurpy.runner`), which do not apply filters.
+"""
+
+import numpy as np
+
+from slurpy import query, runner, sacct, stats
+
+
+def test_synthetic_reproducible():
+    args = query.SacctQuery(start='2017-01-01', end='2017-02-01', shard_days=0).args()
+    tables = []
+    for _ in range(2):
+        with runner.using(runner.SyntheticRunner(100, seed=3)):
+            tables.append(sacct._parse_sacct(args, pushdown=False))
+    assert len(tables[0]) == 100
+    assert tables[0].render('JobID').tolist() == tables[1].render('JobID').tolist()
+
+
+def test_squeue_state(synthetic):
+    table = query.SqueueQuery(state='RUNNING').run()
+    assert len(table)
+    assert set(stats.normalize_states(table['State']).tolist()) == {'RUNNING'}
+
+
+def test_sacct_filters(synthetic):
+    table = query.SacctQuery(start='2017-01-01', end='2017-02-01', state='FAILED',
+                             partition='shared', shard_days=0).run()
+    assert len(table)
+    assert set(stats.normalize_states(table['State']).tolist()) == {'FAILED'}
+    assert set(table['Partition'].tolist()) == {'shared'}
+    assert np.all(table['JobID']['step'] == -1)
+
+
+def test_replay_allocations(tmp_path):
+    # Job-steps in recordings are removed unless they are requested
+    with open(str(tmp_path / 'sacct.txt'), 'w') as out:
+        out.write("JobID|JobName|State\n")
+        out.write("100|a|COMPLETED\n100.batch|batch|COMPLETED\n101|b|FAILED\n101.0|b|FAILED\n")
+
+    with runner.using(runner.ReplayRunner(str(tmp_path))):
+        table = query.SacctQuery(start='2017-01-01', shard_days=0).run()
+        assert table.render('JobID').tolist() == ['100', '101']
+        table = query.SacctQuery(start='2017-01-01', shard_days=0, steps='all').run()
+        assert table.render('JobID').tolist() == ['100', '100.batch', '101', '101.0']
+        table = query.SacctQuery(start='2017-01-01', shard_days=0, jobid='101.0').run()
+        assert table.render('JobID').tolist() == ['101.0']
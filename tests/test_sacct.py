@@ -0,0 +1,62 @@
+"""Tests of 'sacct' queries (`slurpy.sacct`), with synthetic results.
+"""
+
+import numpy as np
+import pytest
+
+from slurpy import const, jobid, query, sacct
+from slurpy.table import JobTable
+
+
+def test_shard_window():
+    shards = sacct._shard_window('2017-01-01T00:00:00', '2017-01-04T00:00:00', 1)
+    assert shards == [('2017-01-01T00:00:00', '2017-01-02T00:00:00'),
+                      ('2017-01-02T00:00:00', '2017-01-03T00:00:00'),
+                      ('2017-01-03T00:00:00', '2017-01-04T00:00:00')]
+    # Partial shards at the end are kept
+    shards = sacct._shard_window('2017-01-01T00:00:00', '2017-01-03T12:00:00', 1)
+    assert [ss[0] for ss in shards] == ['2017-01-01T00:00:00', '2017-01-02T00:00:00',
+                                        '2017-01-03T00:00:00']
+    assert shards[-1][1] == '2017-01-03T12:00:00'
+
+
+def test_shard_window_slack():
+    # A window slightly longer than a number of shards is not given an extra (very short) shard
+    end = np.datetime64('2017-01-03T00:00:00') + np.timedelta64(
+        int(0.5 * const.SACCT_SHARD_SLACK * 86400), 's')
+    shards = sacct._shard_window('2017-01-01T00:00:00', str(end), 1)
+    assert len(shards) == 2
+    assert shards[-1] == ('2017-01-02T00:00:00', str(end))
+
+
+@pytest.mark.parametrize('start,end,days', [
+    (None, '2017-01-03', 1), ('2017-01-01', '2017-01-03', 0), ('2017-01-01', '2017-01-01T12', 1),
+    ('now-7days', None, 1)])
+def test_shard_window_single(start, end, days):
+    assert sacct._shard_window(start, end, days) == [(start, end)]
+
+
+def _table(values, clusters):
+    columns = {'JobID': jobid.parse_jobids(values), 'Cluster': np.array(clusters)}
+    return JobTable(columns, ['JobID', 'Cluster'], types={'JobID': 'jobid'})
+
+
+def test_merge_shards():
+    # Jobs active across a shard boundary are reported by both shards, and only kept once
+    first = _table(['10', '12', '11', '12.batch'], ['a', 'a', 'b', 'a'])
+    second = _table(['12', '13', '11', '12.batch', '10'], ['a', 'a', 'b', 'a', 'b'])
+    table = sacct._merge_shards([first, second])
+    assert list(zip(table['Cluster'], table.render('JobID'))) == [
+        ('a', '10'), ('a', '12'), ('a', '12.batch'), ('a', '13'), ('b', '10'), ('b', '11')]
+
+
+def test_sharded_query(synthetic):
+    # The synthetic runner reports all jobs for each shard, which are merged into one of each
+    params = dict(start='2017-01-01T00:00:00', end='2017-01-05T00:00:00', steps='all')
+    single = sacct._parse_sacct(query.SacctQuery(shard_days=0, **params).args())
+    sharded = sacct._parse_sacct(query.SacctQuery(shard_days=1, **params).args())
+    assert len(single) == 2000
+    assert len(sharded) == len(single)
+    assert sorted(sharded.render('JobID').tolist()) == sorted(single.render('JobID').tolist())
+    # Merged results are ordered by job
+    assert np.all(np.diff(sharded['JobID']['id']) >= 0)
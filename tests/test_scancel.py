@@ -0,0 +1,62 @@
+"""Tests of cancelling jobs (`slurpy.scancel`).
+"""
+
+from slurpy import const, jobid, scancel
+from slurpy.table import JobTable
+
+
+def _table(values):
+    return JobTable({'JobID': jobid.parse_jobids(values)}, ['JobID'], types={'JobID': 'jobid'})
+
+
+def test_collapse_jobids():
+    table = _table(['100', '200_1', '200_2', '300_4', '200_5', '300_1.batch', '200_3', '101'])
+    specs = scancel._collapse_jobids(table)
+    # Other jobs first (in order), then each job-array in order of first appearance
+    assert specs == ['100', '300_1.batch', '101', '200_[1-3,5]', '300_[4]']
+
+
+def test_chunk_arguments(monkeypatch):
+    monkeypatch.setattr(const, 'SCANCEL_MAX_ARG_BYTES', 40)
+    specs = ["{}_[1-{}]".format(1000 + ii, ii) for ii in range(30)]
+    chunks = scancel._chunk_arguments(specs)
+    assert len(chunks) > 1
+    assert [ss for cc in chunks for ss in cc] == specs
+    for cc in chunks:
+        assert sum(len(ss) + 1 for ss in ['scancel'] + cc) <= 40
+
+
+def test_chunk_arguments_long_spec(monkeypatch):
+    # Specifications longer than the limit are still cancelled, on their own
+    monkeypatch.setattr(const, 'SCANCEL_MAX_ARG_BYTES', 20)
+    chunks = scancel._chunk_arguments(['1', '2' * 30, '3'])
+    assert chunks == [['1'], ['2' * 30], ['3']]
+
+
+def test_find_spec():
+    specs = scancel._index_specs(['100', '200_[1-3,5]', '300.batch', '400:410'])
+    assert scancel._find_spec('200_2', specs) == '200_[1-3,5]'
+    assert scancel._find_spec('200_4', specs) is None
+    assert scancel._find_spec('100', specs) == '100'
+    assert scancel._find_spec('300.batch', specs) == '300.batch'
+    assert scancel._find_spec('101', specs) is None
+    assert scancel._find_spec('300.0', specs) is None
+    assert scancel._find_spec('405_3', specs) == '400:410'
+
+
+def test_run_scancel_errors(monkeypatch):
+    # Errors of individual tasks are reported for the specification which includes them
+    err = ("scancel: error: Kill job error on job id 200_2: Job/step already completing\n"
+           "scancel: error: Kill job error on job id 200_5: Invalid job id specified\n"
+           "scancel: error: Kill job error on job id 100: Invalid job id specified\n")
+
+    class Runner(object):
+        def communicate(self, command):
+            return 1, '', err
+
+    monkeypatch.setattr(scancel.runner, 'get_runner', lambda: Runner())
+    results = scancel._run_scancel(['100', '200_[1-3,5]', '300'])
+    assert results['100'] == 'Invalid job id specified'
+    assert results['200_[1-3,5]'] == ('200_2: Job/step already completing; '
+                                      '200_5: Invalid job id specified')
+    assert results['300'] is None
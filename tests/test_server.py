@@ -0,0 +1,211 @@
+"""Tests of the server's requests and responses (`slurpy.server`), with synthetic results.
+"""
+
+import os
+import argparse
+import getpass
+import stat
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from slurpy import const, query, sacct, server
+
+
+def _server(path, **kwargs):
+    args = query.SacctQuery(start='2017-01-01T00:00:00', shard_days=0, **kwargs).args()
+    srv = server.Server(str(path), args, interval=60.0)
+    table = server._fill_step_users(sacct._parse_sacct(srv.args, pushdown=False))
+    srv.snapshot = srv.snapshot._replace(sacct=table, synced=np.datetime64('2017-02-01', 's'))
+    return srv
+
+
+def _request(kind='sacct', **kwargs):
+    params = dict(start='2017-01-01T04:00:00', all_users=True)
+    params.update(kwargs)
+    return {'version': const.SERVER_PROTOCOL, 'kind': kind, 'format': 'npz', 'args': params}
+
+
+@pytest.fixture
+def served(synthetic, tmp_path):
+    """A server of all users' (synthetic) jobs, on a socket in a temporary directory.
+    """
+    srv = _server(tmp_path / 'test.sock', all_users=True)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_encode_decode(jobs):
+    table = server._decode_table(server._encode_table(jobs, 'npz'))
+    assert table.header == jobs.header
+    assert dict(table.types) == dict(jobs.types)
+    for kk in jobs.header:
+        np.testing.assert_array_equal(table[kk], jobs[kk])
+
+
+@pytest.mark.parametrize('filters', [{}, {'state': 'FAILED'}, {'partition': 'shared'},
+                                     {'name': 'job_1'}, {'steps': 'all'},
+                                     {'jobid': '10000100:10000150'}])
+def test_round_trip(served, filters):
+    # Results from the server match the filters applied to its (unfiltered) results locally
+    params = dict(start='2017-01-01T04:00:00', all_users=True, shard_days=0, **filters)
+    args = query.SacctQuery(**params).args()
+    args.server = True
+    args.socket = served.path
+    table = server.query('sacct', args)
+    assert table is not None
+
+    raw = served.snapshot.sacct
+    local = sacct._filter_lines(raw[sacct._select_window(raw, args)], args, pushdown=False)
+    assert len(local)
+    assert table.header == local.header
+    for kk in local.header:
+        np.testing.assert_array_equal(table[kk], local[kk])
+
+
+def test_status(served):
+    header, payload = server.request(served.path, {'kind': 'status'})
+    assert header['status'] == 'ok'
+    assert header['users'] is None
+    assert payload is None
+
+
+def test_miss(served):
+    # Windows starting before the server's are not covered
+    header, _ = served.answer(_request(start='2016-12-01T00:00:00'), peer='user1')
+    assert header['status'] == 'miss'
+    header, _ = served.answer(_request(start=None), peer='user1')
+    assert header['status'] == 'miss'
+    header, _ = served.answer(_request(clusters='other'), peer='user1')
+    assert header['status'] == 'miss'
+    header, _ = served.answer(dict(_request(), version=0), peer='user1')
+    assert header['status'] == 'error'
+
+
+def test_peer_users(synthetic, tmp_path):
+    # Without `--all-users`, only the jobs of the connected user are served
+    user = getpass.getuser()
+    srv = _server(tmp_path / 'test.sock', users='{},user1'.format(user))
+    try:
+        header, _ = srv.answer(_request(all_users=False), peer='user1')
+        assert header['status'] == 'ok'
+        header, _ = srv.answer(_request(all_users=False, users='user1'), peer=user)
+        assert header['status'] == 'miss'
+        header, _ = srv.answer(_request(all_users=True), peer='user1')
+        assert header['status'] == 'miss'
+        header, _ = srv.answer(_request(all_users=False), peer=None)
+        assert header['status'] == 'miss'
+        header, _ = srv.answer(_request(all_users=False), peer='user2')
+        assert header['status'] == 'miss'
+    finally:
+        srv.server_close()
+
+
+def test_peer_selected(served):
+    header, payload = served.answer(_request(all_users=False), peer='user3')
+    assert header['status'] == 'ok'
+    table = server._decode_table(payload)
+    assert len(table) and set(table['User'].tolist()) == {'user3'}
+
+
+def test_not_owned(tmp_path):
+    # Paths which are not sockets (or are owned by other users) are never used
+    path = tmp_path / 'test.sock'
+    path.write_text('')
+    args = argparse.Namespace(server=True, socket=str(path))
+    assert not server.available(args)
+    assert server.query('sacct', args) is None
+
+
+def _poll(srv, ticks):
+    """Run the server's queries for (at least) the given number of ticks.
+    """
+    thread = threading.Thread(target=srv.poll, daemon=True)
+    synced = []
+    thread.start()
+    while len(synced) < ticks:
+        snap = srv.snapshot
+        if snap.synced is not None and (not len(synced) or snap is not synced[-1]):
+            synced.append(snap)
+        time.sleep(0.01)
+    srv._stop.set()
+    thread.join()
+    srv._stop.clear()
+    return
+
+
+def test_window_kept_for_clients(synthetic, tmp_path, monkeypatch):
+    srv = _server(tmp_path / 'test.sock', all_users=True)
+    srv.interval = 0.05
+    # The window would move past all of the synthetic jobs on the first poll
+    srv.span = np.timedelta64(1, 's')
+    try:
+        # A client (e.g. `--watch`) which keeps its start time is served across several polls
+        for _ in range(3):
+            header, _ = srv.answer(_request(), peer='user1')
+            assert header['status'] == 'ok'
+            _poll(srv, 2)
+        assert srv.start == np.datetime64('2017-01-01T04:00:00')
+
+        # Once there are no recent requests, the window moves forward
+        monkeypatch.setattr(const, 'SERVER_REQUEST_EXPIRY', 0.0)
+        _poll(srv, 2)
+        assert srv.start > np.datetime64('2017-02-01')
+        header, _ = srv.answer(_request(), peer='user1')
+        assert header['status'] == 'miss'
+    finally:
+        srv.server_close()
+
+
+def test_socket_path_without_slurm(monkeypatch):
+    # Finding the socket never runs SLURM commands (e.g. 'scontrol' for the cluster name)
+    def fail(*args, **kwargs):
+        raise AssertionError("SLURM command run")
+
+    monkeypatch.delenv('SLURM_CLUSTER_NAME', raising=False)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', '/run/user/1234')
+    monkeypatch.setattr(sacct, '_get_cluster_name', fail)
+    assert server.socket_path() == '/run/user/1234/slurpy/server.sock'
+    args = argparse.Namespace(server=True, socket=None)
+    assert not server.available(args)
+
+    monkeypatch.setenv('SLURM_CLUSTER_NAME', 'odyssey')
+    assert server.socket_path() == '/run/user/1234/slurpy/server-odyssey.sock'
+
+
+def test_shared(synthetic, tmp_path, monkeypatch):
+    # Shared sockets can be used by all local users, and by clients without their own server
+    path = str(tmp_path / 'shared.sock')
+    monkeypatch.setattr(const, 'SERVER_SHARED_SOCKET', path)
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path / 'runtime'))
+    args = argparse.Namespace(server=True, socket=None)
+    assert server._get_path(args) == path
+
+    srv = _server(path, all_users=True)
+    srv.server_close()
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    os.remove(path)
+    srv = server.Server(path, srv.args, interval=60.0, shared=True)
+    try:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o666
+        assert server.available(args)
+    finally:
+        srv.server_close()
+
+    # A server of its own is used first
+    own = server.socket_path()
+    os.makedirs(os.path.dirname(own))
+    open(own, 'w').close()
+    assert server._get_path(args) == own
+
+    # Shared servers must include all users
+    serve_args = query.SacctQuery(start='2017-01-01T00:00:00').args()
+    serve_args.shared = True
+    serve_args.interval = 60.0
+    with pytest.raises(RuntimeError):
+        server.serve(serve_args)
@@ -0,0 +1,103 @@
+"""Tests of summary statistics of jobs (`slurpy.stats`), on synthetic (or replayed) 'sacct' results.
+"""
+
+import numpy as np
+import pytest
+
+from slurpy import const, query, runner, sacct, stats
+
+
+def test_summarize(jobs):
+    summ = stats.summarize(jobs)
+    assert summ.key is None
+    assert summ.counts.shape == (1, len(const.SLURM_STATES) + 1)
+    assert summ.counts.sum() == len(jobs)
+
+    states = stats.normalize_states(jobs['State'])
+    for ss, state in enumerate(summ.states[:-1]):
+        assert summ.counts[0, ss] == np.count_nonzero(states == state)
+
+
+@pytest.mark.parametrize('by', ['Partition', 'JobName', 'User'])
+def test_summarize_by(jobs, by):
+    # Counts and percentiles of each group and state match those computed one at a time
+    summ = stats.summarize(jobs, by=by, percentiles=[0, 25, 50, 90, 100])
+    values = jobs.render(by)
+    states = stats.normalize_states(jobs['State'])
+    hours = np.maximum(jobs['Elapsed'], 0) / 3600.0
+    assert summ.groups.tolist() == sorted(set(values.tolist()))
+    for gg, group in enumerate(summ.groups):
+        for ss, state in enumerate(summ.states[:-1]):
+            sel = (values == group) & (states == state)
+            assert summ.counts[gg, ss] == np.count_nonzero(sel)
+            if np.any(sel):
+                expect = np.percentile(hours[sel], summ.percentiles)
+                assert np.allclose(summ.durations[gg, ss], expect)
+            else:
+                assert np.all(np.isnan(summ.durations[gg, ss]))
+
+
+def test_summarize_invalid(jobs):
+    with pytest.raises(ValueError):
+        stats.summarize(jobs, by='NotAField')
+
+
+def test_summary_lines(jobs):
+    args = query.SacctQuery(start='2017-01-01').args()
+    args.group_by = 'Partition'
+    lines = sacct.summary_lines(jobs, args)
+    summ = stats.summarize(jobs, by='Partition')
+    headers = [ll for ll in lines if ll.startswith('Partition ')]
+    assert headers == ["Partition '{}': {}".format(gg, nn)
+                       for gg, nn in zip(summ.groups, summ.counts.sum(axis=1))]
+    # All of the states in `const.STATE_KEYS` are listed for each group
+    for state in const.STATE_KEYS:
+        assert sum("'{}':".format(state) in ll for ll in lines) == len(summ.groups)
+
+
+def _replay(path, rows):
+    with open(str(path / 'sacct.txt'), 'w') as out:
+        out.write("JobID|JobName|State|Elapsed\n")
+        out.write("\n".join(rows) + "\n")
+    with runner.using(runner.ReplayRunner(str(path))):
+        return query.SacctQuery(start='2017-01-01', shard_days=0, steps='all').run()
+
+
+def test_collapse_arrays(tmp_path):
+    table = _replay(tmp_path, [
+        "100_1|arr|COMPLETED|00:10:00", "100_1.batch|batch|COMPLETED|00:10:00",
+        "100_2|arr|FAILED|00:20:00", "101|one|COMPLETED|01:00:00",
+        "100_4|arr|TIMEOUT|00:40:00", "100_3|arr|COMPLETED|00:30:00",
+        "100_[5-10]|arr|PENDING|00:00:00", "102+0|het|RUNNING|00:01:00",
+        "102+1|het|RUNNING|00:01:00", "103_9|other|FAILED|00:05:00",
+        "103_[10-11]|other|PENDING|00:00:00"])
+    coll = stats.collapse_arrays(table)
+    # Each job-array is one row (in order of its first task), other jobs are kept as they are
+    assert coll['JobID'].tolist() == ['100_[*]', '101', '102+0', '102+1', '103_[*]']
+    assert coll['JobName'].tolist() == ['arr', 'one', 'het', 'het', 'other']
+    # Pending tasks are counted without being expanded, and steps are not counted
+    assert coll['Tasks'].tolist() == [10, 1, 1, 1, 3]
+    # States are listed in the order of `const.SLURM_STATES`
+    assert coll['States'].tolist() == ['PENDING:6,COMPLETED:2,FAILED:1,TIMEOUT:1', 'COMPLETED:1',
+                                       'RUNNING:1', 'RUNNING:1', 'PENDING:2,FAILED:1']
+    # Elapsed times of started tasks only
+    assert coll['ElapsedMin'].tolist() == [600, 3600, 60, 60, 300]
+    assert coll['ElapsedMed'].tolist() == [1500, 3600, 60, 60, 300]
+    assert coll['ElapsedMax'].tolist() == [2400, 3600, 60, 60, 300]
+    assert coll['Failed'].tolist() == ['2,4', '', '', '', '9']
+
+
+def test_collapse_arrays_max_ranges(tmp_path):
+    table = _replay(tmp_path, ["200_{}|arr|{}|00:01:00".format(ii, 'FAILED' if ii % 2 else
+                                                                'COMPLETED')
+                               for ii in range(1, 10)])
+    assert stats.collapse_arrays(table)['Failed'].tolist() == ['1,3,5,7,9']
+    coll = stats.collapse_arrays(table, max_ranges=2)
+    assert coll['Failed'].tolist() == ['1,3,... (5 ranges)']
+
+
+def test_collapse_arrays_synthetic(jobs):
+    # All jobs (and pending tasks) are counted once
+    coll = stats.collapse_arrays(jobs)
+    assert coll['Tasks'].sum() == stats._count_tasks(jobs['JobID']).sum()
+    assert len(coll) < len(jobs)
@@ -0,0 +1,62 @@
+"""Tests of the columnar job table (`slurpy.table`).
+"""
+
+import numpy as np
+import pytest
+
+from slurpy import jobid
+from slurpy.table import JobTable
+
+
+@pytest.mark.parametrize('keys', ['Elapsed', '-Elapsed', 'State,-Elapsed', 'Partition,JobName',
+                                  '-Submit', 'JobID', '-End'])
+@pytest.mark.parametrize('head,tail', [(5, None), (None, 7), (3, 4), (1, None), (1000, None),
+                                       (None, 0)])
+def test_argsort_head_tail(jobs, keys, head, tail):
+    # Partial sorts must give the same rows, in the same order, as the full (stable) sort
+    full = jobs.argsort(keys)
+    idx = jobs.argsort(keys, head=head, tail=tail)
+    expect = np.zeros(len(full), dtype=bool)
+    if head is not None:
+        expect[:head] = True
+    if tail is not None and tail > 0:
+        expect[-tail:] = True
+    assert idx.tolist() == full[expect].tolist()
+
+
+def test_argsort_missing_last(jobs):
+    # Missing times (e.g. of running jobs) are placed last in either direction
+    for keys in ['End', '-End']:
+        ends = jobs.sort(keys)['End']
+        missing = np.isnat(ends)
+        assert missing.any()
+        assert not missing[:np.count_nonzero(~missing)].any()
+
+
+def test_argsort_invalid_key(jobs):
+    with pytest.raises(ValueError):
+        jobs.argsort('NotAField')
+
+
+def _table(values, states):
+    columns = {'JobID': jobid.parse_jobids(values), 'State': np.array(states)}
+    return JobTable(columns, ['JobID', 'State'], types={'JobID': 'jobid'})
+
+
+def test_update():
+    old = _table(['1', '2', '3_1', '3_2', '4.batch'], ['C', 'R', 'R', 'P', 'R'])
+    new = _table(['2', '3_2', '4.batch', '5'], ['C', 'R', 'C', 'P'])
+    table = old.update(new)
+    assert table.render('JobID').tolist() == ['1', '3_1', '2', '3_2', '4.batch', '5']
+    assert table['State'].tolist() == ['C', 'R', 'C', 'R', 'C', 'P']
+
+
+def test_update_multiple_keys():
+    old = _table(['1', '1', '2'], ['C', 'R', 'R'])
+    old.columns['Cluster'] = np.array(['a', 'b', 'a'])
+    old.header.append('Cluster')
+    new = _table(['1'], ['C'])
+    new.columns['Cluster'] = np.array(['b'])
+    new.header.append('Cluster')
+    table = old.update(new, key=['Cluster', 'JobID'])
+    assert list(zip(table['Cluster'], table['State'])) == [('a', 'C'), ('a', 'R'), ('b', 'C')]
@@ -0,0 +1,47 @@
+"""Tests of the conversion of SLURM time-strings (`slurpy.times`).
+"""
+
+import numpy as np
+
+from slurpy import times
+
+
+def test_parse_times():
+    values = ['2017-03-01T12:34:56', '2016-02-29T00:00:00', '2000-02-29T23:59:59',
+              '1999-12-31T00:00:00']
+    assert times.parse_times(values).tolist() == [np.datetime64(vv, 's').tolist()
+                                                  for vv in values]
+
+
+def test_parse_times_invalid():
+    values = ['Unknown', 'None', '', '2017-03-01', '2017-03-01T12:34:567', '2017-03-01 12:34:56',
+              '2017-13-01T00:00:00', '2017-00-10T00:00:00', '2017-01-00T00:00:00',
+              '2017-01-01T24:00:00', '2017-01-01T00:60:00', '2017-01-01T00:00:60',
+              # Days which do not exist in their month
+              '2017-02-29T00:00:00', '1900-02-29T00:00:00', '2017-02-30T00:00:00',
+              '2017-04-31T00:00:00', '2017-11-31T00:00:00']
+    assert np.all(np.isnat(times.parse_times(values)))
+
+
+def test_parse_times_mixed():
+    parsed = times.parse_times(['Unknown', '2017-01-31T00:00:00', '2017-02-31T00:00:00'])
+    assert np.isnat(parsed).tolist() == [True, False, True]
+    assert parsed[1] == np.datetime64('2017-01-31T00:00:00')
+
+
+def test_parse_durations():
+    values = ['1-02:03:04', '02:03:04', '10-00:00:00', '123', '12:34.567', '1:02', '', 'UNLIMITED',
+              'INVALID']
+    expect = [93784, 7384, 864000, 123, 754, 62, -1, -1, -1]
+    assert times.parse_durations(values).tolist() == expect
+
+
+def test_parse_durations_matches_single():
+    values = ['00:00:01', '5-23:59:59', '123-00:00:00', '59:59', '00:01.500', '7']
+    assert times.parse_durations(values).tolist() == [times.parse_duration(vv)
+                                                      for vv in values]
+
+
+def test_render_durations():
+    secs = times.parse_durations(['1-02:03:04', '02:03:04'])
+    assert times.parse_durations(times.render_durations(secs)).tolist() == secs.tolist()
@@ -0,0 +1,96 @@
+"""Tests of repeatedly printed results (`slurpy.watch`).
+"""
+
+import io
+import os
+
+import pytest
+
+from slurpy import query, runner, watch
+
+
+def _record(path, rows):
+    with open(str(path / 'sacct.txt'), 'w') as out:
+        out.write("JobID|JobName|State|Start|End\n")
+        for jid, state, end in rows:
+            out.write("{}|job|{}|2016-11-01T00:00:00|{}\n".format(jid, state, end))
+
+
+def test_sacct_source_trim(tmp_path):
+    # Jobs which ended before the start of the window are not kept between ticks
+    args = query.SacctQuery(start='2017-01-01T00:00:00', shard_days=0).args()
+    source = watch._SacctSource(args)
+    _record(tmp_path, [('100', 'COMPLETED', '2016-12-01T00:00:00'),
+                       ('101', 'COMPLETED', '2017-01-05T00:00:00'),
+                       ('102', 'RUNNING', 'Unknown')])
+    with runner.using(runner.ReplayRunner(str(tmp_path))):
+        assert source.refresh().render('JobID').tolist() == ['101', '102']
+        _record(tmp_path, [('103', 'COMPLETED', '2016-12-31T00:00:00'),
+                           ('102', 'COMPLETED', '2017-01-06T00:00:00')])
+        table = source.refresh()
+    assert table.render('JobID').tolist() == ['101', '102']
+    assert table['State'].tolist() == ['COMPLETED', 'COMPLETED']
+
+
+@pytest.fixture
+def screen(monkeypatch):
+    """A `_Screen` writing into a string, on a terminal of 10 lines.
+    """
+    monkeypatch.setattr(watch.shutil, 'get_terminal_size', lambda: os.terminal_size((80, 10)))
+    return watch._Screen(stream=io.StringIO())
+
+
+def _written(screen):
+    out = screen.stream.getvalue()
+    screen.stream.seek(0)
+    screen.stream.truncate()
+    return out
+
+
+def test_screen_redraw(screen):
+    assert screen.draw(['a', 'b', 'c'])
+    assert _written(screen) == watch._ESC_HOME_CLEAR + "a\nb\nc\n"
+
+    # Nothing is written when nothing has changed
+    assert not screen.draw(['a', 'b', 'c'])
+    assert _written(screen) == ""
+
+    # Only the changed lines are redrawn (in place)
+    assert screen.draw(['a', 'B', 'c'])
+    assert _written(screen) == (watch._ESC_MOVE.format(row=2) + "B" + watch._ESC_CLEAR_LINE +
+                                watch._ESC_MOVE.format(row=4) + watch._ESC_CLEAR_BELOW)
+
+    # The full screen is redrawn when the number of lines changes
+    assert screen.draw(['a', 'B'])
+    assert _written(screen) == watch._ESC_HOME_CLEAR + "a\nB\n"
+
+
+def test_screen_height(screen):
+    # Only the lines which fit on the terminal are drawn, and changes below them are ignored
+    lines = [str(ii) for ii in range(20)]
+    screen.draw(lines)
+    assert _written(screen).count("\n") == 9
+    assert not screen.draw(lines[:9] + ['x'] * 11)
+
+
+def test_screen_no_clear():
+    screen = watch._Screen(clear=False, stream=io.StringIO())
+    screen.draw(['a', 'b'])
+    screen.draw(['a', 'b'])
+    screen.draw(['a', 'c'])
+    screen.close()
+    assert screen.stream.getvalue() == "a\nb\na\nc\n\n"
+
+
+def test_screen_synthetic(screen, synthetic):
+    # Redrawing unchanged results writes nothing, and one changed job redraws a single line
+    table = query.SacctQuery(start='2017-01-01', end='2017-02-01', shard_days=0).run()
+    lines = [" ".join(row) for row in zip(table.render('JobID'), table['State'])][:9]
+    screen.draw(lines)
+    _written(screen)
+    assert not screen.draw(list(lines))
+    lines[3] = lines[3] + " (changed)"
+    assert screen.draw(lines)
+    out = _written(screen)
+    assert out.count(watch._ESC_CLEAR_LINE) == 1
+    assert out.startswith(watch._ESC_MOVE.format(row=4) + lines[3])